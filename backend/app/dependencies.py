@@ -0,0 +1,36 @@
+# /send_me_mvp/backend/app/dependencies.py
+from typing import Optional
+from fastapi import Depends, HTTPException
+from sqlalchemy.orm import Session
+from app.services.db_service import get_db, get_user_by_id, get_user_targets
+from app.services.user_cache import USER_CACHE, UserSnapshot
+
+# --- Dependencies משותפים לכל ה-Routers ---
+
+def find_user_snapshot(db: Session, user_id: str) -> Optional[UserSnapshot]:
+    """טעינת המשתמש דרך ה-Cache (Read-through); None אם לא קיים."""
+    def loader():
+        user = get_user_by_id(db, user_id)
+        if not user:
+            return None
+        return UserSnapshot.from_orm(user, get_user_targets(db, user_id))
+
+    return USER_CACHE.get(user_id, loader)
+
+def load_user_snapshot(db: Session, user_id: str) -> UserSnapshot:
+    """כמו find_user_snapshot, אך זורק 404 אם המשתמש לא קיים."""
+    user = find_user_snapshot(db, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="משתמש לא קיים")
+    return user
+
+def get_current_user(user_id: str, db: Session = Depends(get_db)) -> UserSnapshot:
+    """Dependency לטעינת משתמש קיים."""
+    return load_user_snapshot(db, user_id)
+
+def get_onboarded_user(user_id: str, db: Session = Depends(get_db)) -> UserSnapshot:
+    """Dependency לטעינת משתמש שהשלים את שלב האונבורדינג."""
+    user = load_user_snapshot(db, user_id)
+    if not user.onboarding_complete:
+        raise HTTPException(status_code=403, detail="יש להשלים את שלב האונבורדינג")
+    return user
@@ -1,5 +1,10 @@
 # /send_me_mvp/backend/app/main.py
-from fastapi import FastAPI
+import time
+_IMPORT_STARTED_AT = time.perf_counter()
+
+import asyncio
+from fastapi import FastAPI, Response
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 import os
@@ -9,8 +14,12 @@ load_dotenv()
 
 # ייבוא Routers - נעשה אותם אופציונליים כרגע למקרה שהם לא קיימים
 try:
-    from app.routers import auth, onboarding, chat 
-    from app.services.db_service import create_tables
+    from app.routers import auth, onboarding, chat, chat_ws
+    from app.services import startup
+    from app.services.pdf_service import shutdown_pool
+    from app.services.email_outbox import OUTBOX_WORKER, OUTBOX_WORKER_ENABLED
+    from app.services.metrics import MetricsMiddleware
+    from app.services.llm_admission import AdmissionRejected
     routers_available = True
 except ImportError:
     routers_available = False
@@ -35,19 +44,43 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# --- אתחול DB ---
+# --- Middleware מדדים (Latency לכל Route, בקשות פעילות, Trace מדוגם) ---
 if routers_available:
-    try:
-        create_tables()
-        print("Database tables created/verified")
-    except Exception as e:
-        print(f"Warning: Could not create tables: {e}")
+    app.add_middleware(MetricsMiddleware)
+
+# --- אתחול DB ---
+# במצב defer/skip יצירת הטבלאות לא מעכבת את ה-Cold start (ראה DB_SCHEMA_MODE)
+if routers_available and startup.DB_SCHEMA_MODE == "create":
+    startup.init_schema()
+
+@app.on_event("startup")
+async def on_startup():
+    if not routers_available:
+        return
+    if startup.DB_SCHEMA_MODE == "defer":
+        startup.run_in_background(asyncio.to_thread(startup.init_schema))
+    if startup.WARMUP_CLIENTS:
+        startup.run_in_background(startup.warm_up_clients())
+    if OUTBOX_WORKER_ENABLED:
+        OUTBOX_WORKER.start()
+    startup.record("startup_seconds", _IMPORT_STARTED_AT)
+    print(f"Startup metrics: {startup.STARTUP_METRICS}")
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    if routers_available:
+        await OUTBOX_WORKER.stop()
+        shutdown_pool()
 
 # --- טעינת Routers ---
 if routers_available:
     app.include_router(auth.router, prefix="/api/v1/auth", tags=["Authentication"])
     app.include_router(onboarding.router, prefix="/api/v1/onboarding", tags=["Onboarding Flow"])
     app.include_router(chat.router, prefix="/api/v1/chat", tags=["Chat & Submission"])
+    app.include_router(chat_ws.router, prefix="/api/v1/chat", tags=["Chat WebSocket"])
+
+if routers_available:
+    startup.record("import_seconds", _IMPORT_STARTED_AT)
 
 # --- Health Check Endpoints ---
 @app.get("/")
@@ -75,6 +108,17 @@ def api_root():
         }
     }
 
+@app.get("/api/startup")
+def startup_metrics():
+    """מדדי Cold start: זמן Import, יצירת סכמה ו-Warm-up של הקליינטים (בשניות)."""
+    return startup.STARTUP_METRICS if routers_available else {}
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    """מדדים בפורמט Prometheus (Latency, DB, Gemini, Vision/GCS, Cache)."""
+    from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 @app.get("/api/v1")
 def api_v1_root():
     """נקודת כניסה ל-API v1"""
@@ -104,6 +148,16 @@ async def server_error(request, exc):
         "status": 500
     }
 
+if routers_available:
+    @app.exception_handler(AdmissionRejected)
+    async def llm_admission_rejected(request, exc: AdmissionRejected):
+        # חריגה ממכסת Gemini: תשובה מהירה עם Retry-After במקום המתנה ל-Timeout
+        return JSONResponse(
+            status_code=429,
+            content={"detail": "עומס על שירות ה-AI, נסה שוב בעוד מספר שניות", "reason": exc.reason},
+            headers={"Retry-After": exc.retry_after_header},
+        )
+
 # הוספת מידע על הפורט שהאפליקציה מאזינה לו
 if __name__ == "__main__":
     import uvicorn
@@ -1,31 +1,30 @@
 # /send_me_mvp/backend/app/routers/auth.py
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.schemas import PhoneAuth, AuthResponse, UserProfileBase
-from app.services.db_service import get_db, get_user_by_phone, create_new_user
-import uuid
+from app.services.async_db_service import get_async_db, upsert_user_by_phone_async
+from app.services.phone_service import to_e164
 
 router = APIRouter()
 
 @router.post("/phone", response_model=AuthResponse)
-def authenticate_by_phone(
+async def authenticate_by_phone(
     auth_data: PhoneAuth, 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Endpoint כניסה/הרשמה ראשונית באמצעות מספר טלפון.
     אם המשתמש קיים, טוען את הפרופיל. אם לא, יוצר משתמש חדש.
     """
-    phone = auth_data.phone_number.replace('-', '').strip()
+    # 1. נרמול המספר לפורמט E.164 (מפתח ייחודי יחיד לכל מספר)
+    try:
+        phone = to_e164(auth_data.phone_number)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="מספר טלפון לא תקין")
     
-    # 1. בדיקה אם המשתמש קיים
-    user = get_user_by_phone(db, phone)
-    is_new_user = user is None
-    
-    if is_new_user:
-        # 2. אם לא קיים: יצירת משתמש חדש
-        new_user_id = str(uuid.uuid4())
-        user = create_new_user(db, new_user_id, phone)
+    # 2. כניסה או הרשמה ב-Round trip יחיד (INSERT ... ON CONFLICT ... RETURNING)
+    #    בטוח גם לשתי כניסות מקבילות עם אותו מספר
+    user, is_new_user = await upsert_user_by_phone_async(db, phone)
         
     # 3. החזרת נתוני המשתמש
     profile = UserProfileBase(
@@ -36,4 +35,4 @@ def authenticate_by_phone(
         onboarding_complete=user.onboarding_complete
     )
     
-    return AuthResponse(user=profile, is_new_user=is_new_user)
\ No newline at end of file
+    return AuthResponse(user=profile, is_new_user=is_new_user)
@@ -1,77 +1,272 @@
 # /send_me_mvp/backend/app/routers/chat.py
-from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException
+import asyncio
+import functools
+import json
+from typing import Optional
+from fastapi import APIRouter, Depends, UploadFile, File, Form, Header, HTTPException, Request, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from app.schemas import IngestInput, JobData, Submission, SubmissionHistory
-from app.services.db_service import get_db, get_user_by_id, create_submission, get_submissions_by_user
-from app.services.llm_service import generate_custom_paragraph, extract_job_data_with_llm
-from app.services.external_api import extract_job_data_from_image, create_email_message, send_email_with_gmail_api
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.schemas import IngestInput, IngestResponse, BatchIngestInput, JobData, JobMatch, Submission, SubmissionListItem, SubmissionPage
+from app.services.db_service import SessionLocal, get_db, create_submission, create_submissions_bulk, get_submission_by_id, enqueue_email
+from app.services.llm_service import generate_custom_paragraph, stream_custom_paragraph, extract_job_data_with_llm, JobExtractionError, PARAGRAPH_FALLBACKS
+from app.services.external_api import create_email_message
+from app.services.email_outbox import OUTBOX_WORKER
+from app.services.ocr_service import ocr_image_urls, OCRError
+from app.services.async_db_service import get_async_db, get_submission_page_async, get_submission_by_id_async
+from app.services.job_ad_store import get_or_extract_job_ad, to_job_data
+from app.services.paragraph_prefetch import PREFETCHER
+from app.services.user_cache import UserSnapshot
+from app.services.prompt_builder import PROMPT_VERSIONS, user_context_block
+from app.services.idempotency import IDEMPOTENCY
+from app.services.llm_admission import AdmissionRejected
+from app.services.skill_match import SKILL_INDEX
+from app.dependencies import find_user_snapshot, get_onboarded_user
 
 router = APIRouter()
 
-# Dependency לטעינת משתמש קיים
-def get_current_user(user_id: str, db: Session = Depends(get_db)):
-    user = get_user_by_id(db, user_id)
-    if not user:
-        raise HTTPException(status_code=404, detail="משתמש לא קיים")
-    if not user.onboarding_complete:
-        raise HTTPException(status_code=403, detail="יש להשלים את שלב האונבורדינג")
-    return user
+# Header אופציונלי: Retry של הלקוח עם אותו מפתח מקבל את התגובה המקורית (ראה services/idempotency)
+IDEMPOTENCY_KEY_HEADER = Header(None, alias="Idempotency-Key", max_length=200)
 
-@router.post("/ingest", response_model=JobData)
-async def ingest_job_ad(ingest_data: IngestInput, db: Session = Depends(get_db)):
+def build_user_context(user: UserSnapshot) -> dict:
     """
-    קולט מודעת משרה (טקסט או תמונה) ומחלץ נתונים קריטיים באמצעות Vision/LLM.
+    נתוני המשתמש לפרומפט הפסקה - בלוק ההקשר הקומפקטי שנשמר באונבורדינג (מתוך ה-Cache, בלי גישה ל-DB).
+    גרסת הפרומפט כלולה כדי שפסקאות מוכנות מגרסה קודמת לא יוגשו (היא נכנסת ל-context_hash).
+    """
+    return {
+        "prompt_context": user_context_block(user),
+        "prompt_version": PROMPT_VERSIONS["paragraph"],
+        # לבחירת ההדגשים הרלוונטיים לכל משרה (ראה prompt_builder.job_focus_block)
+        "technologies": list(user.technologies or []),
+        "highlights": [t["content"] for t in user.targets if t["type"] == "highlight"],
+    }
+
+def job_match(user: Optional[UserSnapshot], job_data: JobData) -> Optional[JobMatch]:
+    """ציון התאמה לפי כישורים (אינדקס בזיכרון, בלי LLM) - None למשתמש לא מוכר."""
+    if user is None:
+        return None
+    return SKILL_INDEX.match(user.id, user.technologies, job_data)
+
+def sse_event(event: str, data: dict) -> str:
+    """פורמט הודעת Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def resolve_job_ad(db: Session, content_type: str, content: str, user_id: Optional[str] = None):
+    """
+    מחלץ נתוני משרה מטקסט/תמונה דרך המודעות המשותפות. מחזיר (JobData, job_ad_id).
+    שגיאות קלט/חילוץ נזרקות כ-HTTPException; חריגה ממכסת ה-LLM - כ-AdmissionRejected (429).
     """
     # 1. טיפול בקלט (image_url הוא לצרכי פיתוח, במציאות קובץ מועלה)
-    if ingest_data.content_type == "text":
-        job_ad_text = ingest_data.content
-        # 2. LLM: פירוק טקסט ישירות
-        job_data = await extract_job_data_with_llm(job_ad_text)
+    if content_type == "text":
+        job_ad_text = content
     
-    elif ingest_data.content_type == "image_url":
-        # 2. Vision API: ביצוע OCR על התמונה (נניח שקודם בוצעה הורדה לקובץ זמני)
-        # image_bytes = download_image(ingest_data.content) 
-        # job_data = extract_job_data_from_image(image_bytes)
-        
-        # סימולציה:
-        job_data = JobData(job_title="מפתח בכיר", target_email="test@company.com", requirements=["React", "Python", "SQL"])
+    elif content_type == "image_url":
+        # 2. Vision API: OCR על צילום/צילומי המסך (כמה URLs מופרדים ברווח/שורה = אותה מודעה)
+        #    ואז אותו מסלול חילוץ ומודעה משותפת כמו בטקסט
+        urls = content.split()
+        if not urls:
+            raise HTTPException(status_code=400, detail="לא נשלח URL של תמונה")
+        try:
+            job_ad_text = await ocr_image_urls(urls)
+        except OCRError as e:
+            raise HTTPException(status_code=422, detail=f"כשל בזיהוי טקסט בתמונה: {e}")
+        if not job_ad_text:
+            raise HTTPException(status_code=422, detail="לא זוהה טקסט בתמונה")
         
     else:
         raise HTTPException(status_code=400, detail="Content type לא נתמך.")
-    
-    # 3. יצירת סבמישן בסטטוס 'draft' ב-DB
-    create_submission(db, ingest_data.user_id, job_data)
-    
-    return job_data
+
+    # 2. LLM: פירוק טקסט - רק אם המודעה (או כמעט-זהה לה) לא חולצה כבר ע"י משתמש אחר
+    try:
+        job_ad, _ = await get_or_extract_job_ad(db, job_ad_text, functools.partial(extract_job_data_with_llm, user_id=user_id))
+    except JobExtractionError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    return to_job_data(job_ad), job_ad.id
+
+@router.post("/ingest", response_model=IngestResponse)
+async def ingest_job_ad(ingest_data: IngestInput, idempotency_key: Optional[str] = IDEMPOTENCY_KEY_HEADER):
+    """
+    קולט מודעת משרה (טקסט או תמונה) ומחלץ נתונים קריטיים באמצעות Vision/LLM.
+    Retry עם אותו Idempotency-Key (או בקשה זהה בתוך חלון קצר) מחזיר את אותה טיוטה, בלי חילוץ נוסף.
+    """
+    async def handle():
+        # Session משלו (ולא של הבקשה): ה-handler ממשיך לרוץ גם אם הלקוח התנתק וה-Dependency נסגר
+        with SessionLocal() as db:
+            job_data, job_ad_id = await resolve_job_ad(db, ingest_data.content_type, ingest_data.content, ingest_data.user_id)
+            
+            # 3. יצירת סבמישן בסטטוס 'draft' ב-DB (עם הפניה למודעה המשותפת)
+            submission = create_submission(db, ingest_data.user_id, job_data, job_ad_id=job_ad_id)
+
+            # 4. יצירה ספקולטיבית של הפסקה ברקע - עד שהמשתמש יבקש אותה היא כנראה כבר מוכנה
+            user = find_user_snapshot(db, ingest_data.user_id)
+            if user and user.onboarding_complete:
+                PREFETCHER.schedule(submission.id, user.id, build_user_context(user), job_data)
+
+            return IngestResponse(**job_data.model_dump(), submission_id=submission.id, match=job_match(user, job_data))
+
+    return await IDEMPOTENCY.run("ingest", ingest_data.user_id, idempotency_key, ingest_data, handle)
+
+@router.post("/ingest/batch")
+async def ingest_job_ads_batch(batch: BatchIngestInput, db: Session = Depends(get_db)):
+    """
+    Ingest של כמה מודעות בבת אחת (SSE). החילוץ רץ במקביל (תחת מגבלות ה-LLM Gateway),
+    ולכל מודעה נשלח אירוע 'item' ברגע שהיא מסתיימת - עם נתוני המשרה או שגיאה.
+    בסוף כל הטיוטות נוצרות ב-INSERT אחד, ונשלח אירוע 'done' עם מזהי ההגשות.
+    """
+    user = find_user_snapshot(db, batch.user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="משתמש לא נמצא")
+
+    async def extract(index: int, item):
+        # Session נפרד לכל מודעה: החילוצים רצים במקביל
+        with SessionLocal() as item_db:
+            try:
+                job_data, job_ad_id = await resolve_job_ad(item_db, item.content_type, item.content, batch.user_id)
+                return index, job_data, job_ad_id, None
+            except HTTPException as e:
+                return index, None, None, {"error": e.detail}
+            except AdmissionRejected as e:
+                # הלקוח יכול לשלוח שוב רק את המודעות שנדחו, אחרי retry_after שניות
+                return index, None, None, {"error": "עומס על שירות ה-AI", "retry_after": e.retry_after_header}
+            except Exception as e:
+                print(f"Warning: batch ingest item {index} failed: {e}")
+                return index, None, None, {"error": "כשל בעיבוד המודעה"}
+
+    async def event_stream():
+        tasks = [asyncio.create_task(extract(i, item)) for i, item in enumerate(batch.items)]
+        extracted = {}
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                index, job_data, job_ad_id, error = await next_done
+                if error is not None:
+                    yield sse_event("item", {"index": index, "status": "error", **error})
+                    continue
+                extracted[index] = (job_data, job_ad_id)
+                match = job_match(user, job_data)
+                yield sse_event("item", {"index": index, "status": "ok", **job_data.model_dump(), "match": match.model_dump() if match else None})
+        finally:
+            # ניתוק הלקוח באמצע - לא ממשיכים לחלץ
+            for task in tasks:
+                task.cancel()
+
+        indexes = sorted(extracted)
+        try:
+            # Session משלנו: ה-Session של ה-Dependency כבר שוחרר כשה-Stream רץ
+            with SessionLocal() as stream_db:
+                submission_ids = create_submissions_bulk(stream_db, user.id, [extracted[i] for i in indexes])
+        except Exception as e:
+            print(f"Error creating batch submissions: {e}")
+            yield sse_event("error", {"message": "כשל ביצירת ההגשות"})
+            return
+
+        if user.onboarding_complete:
+            user_context = build_user_context(user)
+            for index, submission_id in zip(indexes, submission_ids):
+                PREFETCHER.schedule(submission_id, user.id, user_context, extracted[index][0])
+
+        yield sse_event("done", {
+            "submissions": [{"index": i, "submission_id": sid} for i, sid in zip(indexes, submission_ids)],
+            "failed": len(batch.items) - len(indexes),
+        })
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @router.post("/generate/paragraph")
-async def generate_paragraph(job_data: JobData, user_id: str, db: Session = Depends(get_db)):
+async def generate_paragraph(
+    job_data: JobData,
+    submission_id: Optional[str] = None,
+    user: UserSnapshot = Depends(get_onboarded_user),
+    idempotency_key: Optional[str] = IDEMPOTENCY_KEY_HEADER,
+):
     """
     יוצר פסקה מותאמת אישית לראש המייל על בסיס נתוני המשתמש והמשרה.
+    אם נשלח submission_id - מחזיר פסקה שנוצרה מראש, או מצטרף ליצירה שכבר רצה.
     """
-    user = get_current_user(user_id, db)
-    # 1. איסוף נתונים (קו"ח + יעדים) מהמשתמש
-    # user_targets = get_user_targets(db, user.id)
-    
-    # 2. יצירת הפסקה באמצעות LLM (הפרומפט המורכב)
-    paragraph = await generate_custom_paragraph(user, job_data)
-    
-    return {"paragraph": paragraph}
+    async def handle():
+        # 1. איסוף נתונים (קו"ח + יעדים) מהמשתמש
+        user_context = build_user_context(user)
+        
+        # 2. יצירת הפסקה באמצעות LLM (הפרומפט המורכב)
+        if submission_id:
+            with SessionLocal() as db:
+                paragraph = await PREFETCHER.get_or_generate(db, submission_id, user.id, user_context, job_data)
+        else:
+            paragraph = await generate_custom_paragraph(user_context, job_data, user_id=user.id)
+        if paragraph in PARAGRAPH_FALLBACKS:
+            # טקסט שגיאה לא נשמר כתוצאה - ה-Retry ינסה שוב
+            raise HTTPException(status_code=503, detail=paragraph)
+        return {"paragraph": paragraph}
+
+    payload = {"job_data": job_data, "submission_id": submission_id}
+    try:
+        # בלי Idempotency-Key אין Dedup: לחיצה על "צור שוב" צריכה להחזיר פסקה חדשה
+        return await IDEMPOTENCY.run("paragraph", user.id, idempotency_key, payload, handle, implicit=False)
+    except HTTPException as e:
+        if e.status_code == 503:
+            return {"paragraph": e.detail} # התנהגות קודמת: הלקוח מקבל את טקסט ה-Fallback
+        raise
+
+@router.post("/generate/paragraph/stream")
+async def generate_paragraph_stream(job_data: JobData, request: Request, user: UserSnapshot = Depends(get_onboarded_user)):
+    """
+    גרסת Streaming (SSE) של יצירת הפסקה: אירוע 'token' לכל חלק טקסט,
+    ואירוע 'done' בסוף עם הפסקה המלאה. ניתוק הלקוח מבטל את הקריאה ל-Gemini.
+    """
+    user_context = build_user_context(user)
 
-@router.post("/submit/email")
+    async def event_stream():
+        parts = []
+        tokens = stream_custom_paragraph(user_context, job_data, user_id=user.id)
+        try:
+            async for text in tokens:
+                if await request.is_disconnected():
+                    break
+                parts.append(text)
+                yield sse_event("token", {"text": text})
+            else:
+                yield sse_event("done", {"paragraph": "".join(parts).strip()})
+        except AdmissionRejected as e:
+            # ה-Headers כבר נשלחו - ה-429 מגיע כאירוע
+            yield sse_event("error", {"detail": "עומס על שירות ה-AI", "status": 429, "retry_after": e.retry_after_header})
+        except Exception as e:
+            print(f"Error in paragraph stream: {e}")
+            yield sse_event("error", {"detail": "כשל ביצירת הפסקה", "partial": "".join(parts)})
+        finally:
+            await tokens.aclose()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.post("/submit/email", status_code=202)
 async def submit_email(
     submission_id: str, 
     final_text: str = Form(...),
     user_id: str = Form(...), 
-    db: Session = Depends(get_db)
+    idempotency_key: Optional[str] = IDEMPOTENCY_KEY_HEADER,
 ):
     """
-    שולח את המייל הסופי באמצעות Gmail API.
+    מכניס את המייל הסופי ל-Outbox וחוזר מיד; השליחה בפועל דרך Gmail API נעשית ב-Worker ברקע.
+    שליחה חוזרת של אותה הגשה לא יוצרת מייל כפול.
     """
-    user = get_current_user(user_id, db)
-    submission = get_submission_by_id(db, submission_id) # נניח שיש פונקציה זו
+    async def handle():
+        with SessionLocal() as db:
+            return await enqueue_submission_email(db, submission_id, final_text, get_onboarded_user(user_id, db))
+
+    payload = {"submission_id": submission_id, "final_text": final_text}
+    return await IDEMPOTENCY.run("submit_email", user_id, idempotency_key, payload, handle, status_code=202)
+
+async def enqueue_submission_email(db: Session, submission_id: str, final_text: str, user: UserSnapshot) -> dict:
+    """בניית המייל והכנסה ל-Outbox, עבור משתמש שכבר נטען ואומת (HTTP או חיבור WebSocket)."""
+    submission = get_submission_by_id(db, submission_id)
     
-    if not submission:
+    if not submission or submission.user_id != user.id:
         raise HTTPException(status_code=404, detail="הגשה לא נמצאה")
         
     # 1. יצירת הודעת המייל
@@ -94,20 +289,55 @@ async def submit_email(
         # attachment_file=user.resume_url # צירוף הקו"ח
     )
     
-    # 2. שליחה בפועל (דורש OAuth Flow)
-    try:
-        # send_email_with_gmail_api(service, user.email, raw_message)
-        update_submission_status(db, submission_id, "sent")
-    except Exception:
-        update_submission_status(db, submission_id, "error")
-        raise HTTPException(status_code=500, detail="כשל בשליחת המייל דרך Gmail API")
+    # 2. הכנסה ל-Outbox (באותה טרנזקציה עם עדכון הסטטוס ל-queued)
+    entry = enqueue_email(db, submission_id, user.id, user.email, submission.target_email, raw_message["raw"])
+    OUTBOX_WORKER.notify()
         
-    return {"message": "Email submitted successfully."}
+    status = entry.status if entry.status in ("sent", "error") else "queued"
+    return {"message": "Email queued for sending.", "submission_id": submission_id, "status": status}
 
-@router.get("/submissions", response_model=SubmissionHistory)
-def get_submission_history(user_id: str, db: Session = Depends(get_db)):
+@router.get("/submissions", response_model=SubmissionPage)
+async def get_submission_history(
+    user_id: str,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    מחזיר עמוד מהיסטוריית ההגשות של המשתמש (CRM), מהחדש לישן.
+    לעמוד הבא יש לשלוח את next_cursor שהתקבל. הטקסט המלא זמין ב-/submissions/{id}.
+    """
+    try:
+        rows, next_cursor = await get_submission_page_async(db, user_id, limit, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor לא תקין")
+    items = [
+        SubmissionListItem(
+            submission_id=row.id,
+            job_title=row.job_title,
+            target_email=row.target_email,
+            status=row.status,
+            date_submitted=row.date_submitted,
+        )
+        for row in rows
+    ]
+    return SubmissionPage(submissions=items, next_cursor=next_cursor)
+
+@router.get("/submissions/{submission_id}", response_model=Submission)
+async def get_submission_detail(submission_id: str, user_id: str, db: AsyncSession = Depends(get_async_db)):
     """
-    מחזיר את היסטוריית ההגשות של המשתמש (CRM).
+    מחזיר הגשה בודדת במלואה (כולל טקסט המייל ודרישות המשרה).
     """
-    submissions = get_submissions_by_user(db, user_id)
-    return SubmissionHistory(submissions=submissions)
\ No newline at end of file
+    submission = await get_submission_by_id_async(db, submission_id)
+    if not submission or submission.user_id != user_id:
+        raise HTTPException(status_code=404, detail="הגשה לא נמצאה")
+    return Submission(
+        submission_id=submission.id,
+        user_id=submission.user_id,
+        job_title=submission.job_title,
+        target_email=submission.target_email,
+        status=submission.status,
+        date_submitted=submission.date_submitted,
+        submission_text=submission.submission_text,
+        job_requirements={"requirements": submission.requirements},
+    )
\ No newline at end of file
@@ -0,0 +1,241 @@
+# /send_me_mvp/backend/app/routers/chat_ws.py
+import asyncio
+import json
+import os
+from typing import Any, Dict, Optional, Set
+
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+
+from app.schemas import JobData
+from app.services.db_service import SessionLocal, create_submission, get_submission_by_id, save_draft_paragraph
+from app.services.llm_service import stream_custom_paragraph, PARAGRAPH_FALLBACKS
+from app.services.llm_admission import AdmissionRejected
+from app.services.paragraph_prefetch import PREFETCHER, context_hash
+from app.services.user_cache import UserSnapshot
+from app.dependencies import find_user_snapshot
+from app.routers.chat import build_user_context, job_match, resolve_job_ad, enqueue_submission_email
+
+router = APIRouter()
+
+# --- הגדרות ---
+WS_MAX_DRAFTS = int(os.getenv("WS_MAX_DRAFTS", "20"))
+# כמה פקודות (חילוץ / יצירה / שליחה) רצות במקביל על חיבור אחד
+WS_MAX_INFLIGHT = int(os.getenv("WS_MAX_INFLIGHT", "4"))
+WS_IDLE_TIMEOUT_SECONDS = float(os.getenv("WS_IDLE_TIMEOUT_SECONDS", "600"))
+WS_SEND_QUEUE_SIZE = 256
+
+# קודי סגירה אפליקטיביים (טווח 4000-4999)
+WS_CLOSE_USER_NOT_FOUND = 4404
+WS_CLOSE_IDLE = 4408
+
+
+class _Draft:
+    """טיוטה אחת בתוך החיבור: נתוני המשרה נשמרים בצד השרת, הלקוח שולח רק את מזהה ההגשה."""
+
+    def __init__(self, submission_id: str, job_data: JobData):
+        self.submission_id = submission_id
+        self.job_data = job_data
+        self.paragraph: Optional[str] = None
+        self.generation: Optional[asyncio.Task] = None
+
+
+class ChatSession:
+    """
+    מצב של חיבור WebSocket אחד: המשתמש (נטען פעם אחת), הקשר הפרומפט שלו, והטיוטות הפתוחות.
+    כל פקודה רצה כמשימה נפרדת (כמה טיוטות במקביל על אותו חיבור), וכל אירוע מתויג ב-draft/request_id.
+    הכתיבה לסוקט עוברת דרך תור ו-Writer יחיד.
+    """
+
+    def __init__(self, websocket: WebSocket, user: UserSnapshot):
+        self.websocket = websocket
+        self.user = user
+        self.user_context = build_user_context(user)
+        self.drafts: Dict[str, _Draft] = {}
+        self._outgoing: asyncio.Queue = asyncio.Queue(maxsize=WS_SEND_QUEUE_SIZE)
+        self._tasks: Set[asyncio.Task] = set()
+        self._inflight = asyncio.Semaphore(WS_MAX_INFLIGHT)
+
+    # --- שליחה ---
+    async def send(self, event: str, **data):
+        await self._outgoing.put(json.dumps({"event": event, **data}, ensure_ascii=False))
+
+    async def _writer(self):
+        while True:
+            message = await self._outgoing.get()
+            await self.websocket.send_text(message)
+
+    async def send_error(self, exc: BaseException, **tags):
+        if isinstance(exc, HTTPException):
+            await self.send("error", status=exc.status_code, detail=exc.detail, **tags)
+        elif isinstance(exc, AdmissionRejected):
+            await self.send("error", status=429, detail="עומס על שירות ה-AI", retry_after=exc.retry_after_header, **tags)
+        else:
+            print(f"Error in chat websocket ({self.user.id}): {exc!r}")
+            await self.send("error", status=500, detail="שגיאה בעיבוד הבקשה", **tags)
+
+    # --- משתמש ---
+    def _require_onboarded(self):
+        if not self.user.onboarding_complete:
+            # ייתכן שהאונבורדינג הושלם אחרי פתיחת החיבור - רענון מה-Cache
+            with SessionLocal() as db:
+                self.user = find_user_snapshot(db, self.user.id) or self.user
+            self.user_context = build_user_context(self.user)
+            if not self.user.onboarding_complete:
+                raise HTTPException(status_code=403, detail="יש להשלים את שלב האונבורדינג")
+
+    def _draft(self, submission_id: Optional[str]) -> _Draft:
+        draft = self.drafts.get(submission_id or "")
+        if draft is None:
+            raise HTTPException(status_code=404, detail="טיוטה לא נמצאה בחיבור הזה")
+        return draft
+
+    # --- פקודות ---
+    async def ingest(self, message: Dict[str, Any]):
+        if len(self.drafts) >= WS_MAX_DRAFTS:
+            raise HTTPException(status_code=409, detail="יותר מדי טיוטות פתוחות - יש לשלוח או לסגור טיוטה")
+        with SessionLocal() as db:
+            job_data, job_ad_id = await resolve_job_ad(db, message.get("content_type", "text"), message.get("content") or "", self.user.id)
+            submission = create_submission(db, self.user.id, job_data, job_ad_id=job_ad_id)
+            submission_id = submission.id
+        self.drafts[submission_id] = _Draft(submission_id, job_data)
+        match = job_match(self.user, job_data)
+        await self.send(
+            "extracted",
+            request_id=message.get("request_id"),
+            draft=submission_id,
+            job=job_data.model_dump(),
+            match=match.model_dump() if match else None,
+        )
+        if self.user.onboarding_complete:
+            PREFETCHER.schedule(submission_id, self.user.id, self.user_context, job_data)
+
+    async def generate(self, draft: _Draft):
+        """
+        פסקה מוכנה (Prefetch) נשלחת מיד - גם כשה-Prefetch עוד רץ (מצטרפים אליו, בלי קריאה שנייה ל-LLM);
+        אחרת Streaming של Tokens ואירוע 'paragraph' בסוף.
+        """
+        expected_hash = context_hash(self.user_context)
+        ready = await PREFETCHER.join_or_cancel(draft.submission_id, self.user.id, self.user_context)
+        if not ready:
+            with SessionLocal() as db:
+                submission = get_submission_by_id(db, draft.submission_id)
+                ready = submission.draft_paragraph if submission and submission.draft_context_hash == expected_hash else None
+        if ready:
+            draft.paragraph = ready
+            await self.send("paragraph", draft=draft.submission_id, paragraph=ready, prefetched=True)
+            return
+
+        parts = []
+        tokens = stream_custom_paragraph(self.user_context, draft.job_data, user_id=self.user.id)
+        try:
+            async for text in tokens:
+                parts.append(text)
+                await self.send("token", draft=draft.submission_id, text=text)
+        finally:
+            await tokens.aclose()
+        paragraph = "".join(parts).strip()
+        if paragraph and paragraph not in PARAGRAPH_FALLBACKS:
+            draft.paragraph = paragraph
+            with SessionLocal() as db:
+                save_draft_paragraph(db, draft.submission_id, self.user.id, paragraph, expected_hash)
+        await self.send("paragraph", draft=draft.submission_id, paragraph=paragraph, prefetched=False)
+
+    async def submit(self, draft: _Draft, final_text: str):
+        with SessionLocal() as db:
+            result = await enqueue_submission_email(db, draft.submission_id, final_text, self.user)
+        self.drafts.pop(draft.submission_id, None)
+        await self.send("submitted", draft=draft.submission_id, status=result["status"])
+
+    # --- Dispatch ---
+    def _spawn(self, coro, **tags) -> asyncio.Task:
+        async def run():
+            try:
+                async with self._inflight:
+                    await coro
+            except asyncio.CancelledError:
+                coro.close() # בוטלה עוד בהמתנה לסמפור
+                raise
+            except Exception as e:
+                await self.send_error(e, **tags)
+
+        task = asyncio.create_task(run())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def dispatch(self, message: Dict[str, Any]):
+        kind = message.get("type")
+        request_id = message.get("request_id")
+        if kind == "ping":
+            await self.send("pong", request_id=request_id)
+        elif kind == "ingest":
+            self._spawn(self.ingest(message), request_id=request_id)
+        elif kind == "generate":
+            self._require_onboarded()
+            draft = self._draft(message.get("draft"))
+            if draft.generation is not None and not draft.generation.done():
+                draft.generation.cancel() # בקשה חדשה לאותה טיוטה מחליפה את הקודמת
+            draft.generation = self._spawn(self.generate(draft), draft=draft.submission_id)
+        elif kind == "cancel":
+            draft = self._draft(message.get("draft"))
+            if draft.generation is not None:
+                draft.generation.cancel()
+        elif kind == "submit":
+            self._require_onboarded()
+            draft = self._draft(message.get("draft"))
+            final_text = message.get("final_text") or draft.paragraph
+            if not final_text:
+                raise HTTPException(status_code=422, detail="אין טקסט לשליחה")
+            self._spawn(self.submit(draft, final_text), draft=draft.submission_id)
+        elif kind == "close":
+            draft = self.drafts.pop(message.get("draft") or "", None)
+            if draft is not None and draft.generation is not None:
+                draft.generation.cancel()
+        else:
+            raise HTTPException(status_code=400, detail=f"סוג הודעה לא נתמך: {kind}")
+
+    async def run(self):
+        writer = asyncio.create_task(self._writer())
+        try:
+            await self.send("ready", user_id=self.user.id, onboarding_complete=bool(self.user.onboarding_complete))
+            while True:
+                try:
+                    raw = await asyncio.wait_for(self.websocket.receive_text(), WS_IDLE_TIMEOUT_SECONDS)
+                except asyncio.TimeoutError:
+                    await self.websocket.close(code=WS_CLOSE_IDLE)
+                    return
+                try:
+                    message = json.loads(raw)
+                    if not isinstance(message, dict):
+                        raise ValueError("message must be a JSON object")
+                except ValueError:
+                    await self.send("error", status=400, detail="הודעה לא תקינה (נדרש JSON)")
+                    continue
+                try:
+                    await self.dispatch(message)
+                except HTTPException as e:
+                    await self.send_error(e, request_id=message.get("request_id"), draft=message.get("draft"))
+        except WebSocketDisconnect:
+            pass
+        finally:
+            # ניתוק: עוצרים יצירות שרצות (ה-Gateway סוגר את ה-Stream מול Gemini)
+            for task in list(self._tasks):
+                task.cancel()
+            writer.cancel()
+
+
+@router.websocket("/ws")
+async def chat_websocket(websocket: WebSocket, user_id: str):
+    """
+    ערוץ Chat מתמשך: המשתמש נטען פעם אחת לחיבור, ונתוני המשרה נשארים בצד השרת.
+    הודעות לקוח (JSON): ingest {content_type, content, request_id}, generate {draft}, cancel {draft},
+    submit {draft, final_text?}, close {draft}, ping.
+    אירועי שרת: ready, extracted, token, paragraph, submitted, error, pong - כולם מתויגים ב-draft/request_id.
+    """
+    await websocket.accept()
+    with SessionLocal() as db:
+        user = find_user_snapshot(db, user_id)
+    if user is None:
+        await websocket.close(code=WS_CLOSE_USER_NOT_FOUND, reason="user not found")
+        return
+    await ChatSession(websocket, user).run()
@@ -1,19 +1,104 @@
 # /send_me_mvp/backend/app/routers/onboarding.py
-from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException
+import asyncio
+import os
+import shutil
+import tempfile
+from typing import Optional
+from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from app.schemas import OnboardingResponse, FocusAnswers, UserProfileBase
-from app.services.db_service import get_db, get_user_by_id, update_user, save_targets
-from app.services.llm_service import process_resume_and_generate_questions
-from app.services.external_api import upload_resume_to_gcs # נניח שיש פונקציה כזו
+from app.schemas import OnboardingResponse, FocusAnswers, FocusQuestionsResponse, UserProfileBase, ResumeAnalysis
+from app.services.db_service import get_db, update_user, complete_onboarding, SessionLocal
+from app.services.llm_service import process_resume_and_generate_questions, stream_resume_and_generate_questions
+from app.services.llm_admission import AdmissionRejected
+from app.services.external_api import upload_resume_stream_to_gcs
+from app.services.paragraph_prefetch import PREFETCHER
+from app.services.prompt_builder import user_context_fields
+from app.services.pdf_service import read_upload_limited, extract_resume_text, PDFExtractionError, PDFTooLargeError
+from app.services.user_cache import UserSnapshot
+from app.services.startup import run_in_background
+from app.dependencies import get_current_user
+from app.routers.chat import sse_event
 
 router = APIRouter()
 
-# Dependency לטעינת משתמש קיים
-def get_current_user(user_id: str, db: Session = Depends(get_db)):
-    user = get_user_by_id(db, user_id)
-    if not user:
-        raise HTTPException(status_code=404, detail="משתמש לא קיים")
-    return user
+# העלאת הקו"ח ל-GCS (ניתן לכבות בפיתוח מקומי ללא GCS)
+RESUME_UPLOAD_ENABLED = os.getenv("RESUME_UPLOAD_ENABLED", "1") == "1"
+
+async def upload_resume_in_background(resume_file: UploadFile, user_id: str, file_obj=None):
+    """
+    מעלה את הקו"ח ב-Thread נפרד. כשל בהעלאה לא מכשיל את האונבורדינג.
+    file_obj - עותק שבבעלות המשימה (נסגר בסוף), כשההעלאה ממשיכה אחרי שה-Endpoint חזר ו-FastAPI סגר את ה-UploadFile.
+    """
+    try:
+        return await asyncio.to_thread(
+            upload_resume_stream_to_gcs,
+            file_obj or resume_file.file,
+            f"{user_id}_{os.path.basename(resume_file.filename or 'resume.pdf')}",
+            resume_file.content_type,
+            resume_file.size,
+        )
+    except Exception as e:
+        print(f"Warning: resume upload to GCS failed for {user_id}: {e}")
+        return None
+    finally:
+        if file_obj is not None:
+            file_obj.close()
+
+def copy_upload_spool(resume_file: UploadFile):
+    """מעתיק את ה-Spool של ה-UploadFile לקובץ זמני (נמחק בסגירה). פונקציה חוסמת."""
+    copy = tempfile.TemporaryFile()
+    try:
+        resume_file.file.seek(0)
+        shutil.copyfileobj(resume_file.file, copy)
+        copy.seek(0)
+    except BaseException:
+        copy.close()
+        raise
+    return copy
+
+async def read_resume_text(resume_file: UploadFile) -> str:
+    """אימות הקובץ, קריאה ב-Chunks עם מגבלת גודל, וחילוץ טקסט ב-Process pool (לא חוסם את ה-Event Loop)."""
+    if resume_file.content_type not in ["application/pdf"]: # MVP: נתמך רק ב-PDF
+         raise HTTPException(status_code=400, detail="פורמט קובץ חייב להיות PDF")
+
+    try:
+        file_bytes = await read_upload_limited(resume_file)
+        return await extract_resume_text(file_bytes)
+    except PDFTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except PDFExtractionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def save_resume_profile(db: Session, user: UserSnapshot, profile_data: ResumeAnalysis, resume_url: Optional[str] = None):
+    """עדכון פרופיל ב-DB (UPDATE ... RETURNING יחיד, בלי Refresh) וביטול פסקאות שנוצרו מראש."""
+    updates = {
+        "name": profile_data.name,
+        "email": profile_data.email,
+        "resume_text": profile_data.experience_summary, 
+        "technologies": profile_data.technologies,
+        # בלוק ההקשר הקומפקטי לפרומפט הפסקה - נבנה רק כשהפרופיל משתנה, ולא בכל יצירה
+        **user_context_fields(
+            profile_data.experience_summary,
+            profile_data.technologies,
+            [t["content"] for t in user.targets if t["type"] == "highlight"],
+        ),
+    }
+    if resume_url:
+        updates["resume_url"] = resume_url # שמירת הנתיב ל-GCS
+    updated_user = update_user(db, user, updates, returning=True)
+    # הפרופיל השתנה - פסקאות שנוצרו מראש כבר לא רלוונטיות
+    PREFETCHER.invalidate_user(user.id, db)
+    return updated_user
+
+def profile_response(updated_user) -> UserProfileBase:
+    return UserProfileBase(
+        user_id=updated_user.id,
+        phone_number=updated_user.phone_number,
+        name=updated_user.name,
+        email=updated_user.email,
+        onboarding_complete=bool(updated_user.onboarding_complete),
+    )
 
 @router.post("/resume", response_model=OnboardingResponse)
 async def upload_resume_and_onboard(
@@ -27,38 +112,86 @@ async def upload_resume_and_onboard(
     user = get_current_user(user_id, db)
     
     # 1. אימות וטיפול בקובץ
-    if resume_file.content_type not in ["application/pdf"]: # MVP: נתמך רק ב-PDF
-         raise HTTPException(status_code=400, detail="פורמט קובץ חייב להיות PDF")
-
-    file_bytes = await resume_file.read()
+    resume_text_raw = await read_resume_text(resume_file)
     
-    # 2. שמירת קו"ח ב-GCS (סימולציה)
-    # resume_url = upload_resume_to_gcs(file_bytes, f"{user_id}_{resume_file.filename}") 
+    # 2. שמירת קו"ח ב-GCS - Streaming מה-Spool, במקביל לקריאה ל-LLM
+    upload_task = asyncio.create_task(upload_resume_in_background(resume_file, user_id)) if RESUME_UPLOAD_ENABLED else None
 
-    # 3. פירוק וגנרציה באמצעות LLM (שדרוג פרטו)
-    # נניח שחולץ טקסט גולמי (בפועל, נשתמש בכלי כמו PyPDF2)
-    resume_text_raw = file_bytes.decode('utf-8', errors='ignore') 
-    
-    llm_output = await process_resume_and_generate_questions(resume_text_raw)
+    # 3. פירוק וגנרציה באמצעות LLM (שדרוג פרטו) - על הטקסט המנורמל בלבד
+    try:
+        llm_output = await process_resume_and_generate_questions(resume_text_raw, user_id=user.id)
+    finally:
+        resume_url = await upload_task if upload_task else None
     
     # 4. עדכון פרופיל ב-DB
-    profile_data = llm_output.profile_data
-    updated_user = update_user(db, user, {
-        "name": profile_data.name,
-        "email": profile_data.email,
-        "resume_text": profile_data.experience_summary, 
-        "technologies": profile_data.technologies,
-        # "resume_url": resume_url # שמירת הנתיב ל-GCS
-    })
+    updated_user = save_resume_profile(db, user, llm_output.profile_data, resume_url)
     
     # 5. החזרת נתונים ושאלות לפרונטאנד
     return OnboardingResponse(
-        profile=UserProfileBase.model_validate(updated_user),
+        profile=profile_response(updated_user),
         questions=FocusQuestionsResponse(questions=llm_output.questions)
     )
 
+@router.post("/resume/stream")
+async def upload_resume_and_onboard_stream(
+    request: Request,
+    user_id: str = Form(..., description="ID המשתמש (Auth Token)"),
+    resume_file: UploadFile = File(...),
+    db: Session = Depends(get_db)
+):
+    """
+    גרסת Streaming (SSE) של /resume: הפלט של Gemini נסרק תוך כדי יצירה.
+    אירוע 'profile' נשלח (והפרופיל נשמר) ברגע שבלוק הפרופיל מוכן, אירוע 'question' לכל שאלת מיקוד
+    שהושלמה, ו-'done' בסוף. ניתוק הלקוח מבטל את הקריאה ל-Gemini.
+    """
+    user = get_current_user(user_id, db)
+    resume_text_raw = await read_resume_text(resume_file)
+    # FastAPI סוגר את ה-UploadFile כשה-Endpoint חוזר (לפני שה-Stream רץ) - ההעלאה עובדת על עותק משלה
+    upload_task = None
+    if RESUME_UPLOAD_ENABLED:
+        resume_copy = await asyncio.to_thread(copy_upload_spool, resume_file)
+        upload_task = run_in_background(upload_resume_in_background(resume_file, user_id, resume_copy))
+
+    async def event_stream():
+        # Session משלו: ה-Session של ה-Dependency נסגר לפני שה-Stream מסתיים
+        with SessionLocal() as stream_db:
+            events = stream_resume_and_generate_questions(resume_text_raw, user_id=user.id)
+            profile_saved, finished, question_count = False, False, 0
+            try:
+                async for kind, value in events:
+                    if await request.is_disconnected():
+                        break
+                    if kind == "profile":
+                        updated_user = save_resume_profile(stream_db, user, value)
+                        profile_saved = True
+                        yield sse_event("profile", profile_response(updated_user).model_dump())
+                    elif kind == "question":
+                        yield sse_event("question", {"index": question_count, **value.model_dump()})
+                        question_count += 1
+                    elif kind == "done":
+                        finished = True
+            except AdmissionRejected as e:
+                yield sse_event("error", {"detail": "עומס על שירות ה-AI", "status": 429, "retry_after": e.retry_after_header})
+            except Exception as e:
+                print(f"Error in onboarding stream: {e}")
+                yield sse_event("error", {"detail": "כשל בפירוק קורות החיים", "questions_sent": question_count})
+            finally:
+                await events.aclose()
+                # הנתיב ל-GCS נשמר בסוף (ההעלאה רצה במקביל ולא מעכבת את אירוע הפרופיל)
+                resume_url = await upload_task if upload_task else None
+                if resume_url and profile_saved:
+                    update_user(stream_db, user, {"resume_url": resume_url}, returning=True)
+            if finished:
+                yield sse_event("done", {"questions": question_count})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @router.post("/focus-questions")
-def save_focus_answers(
+async def save_focus_answers(
     answers_data: FocusAnswers,
     db: Session = Depends(get_db)
 ):
@@ -67,10 +200,12 @@ def save_focus_answers(
     """
     user = get_current_user(answers_data.user_id, db)
     
-    # 1. שמירת התשובות (נניח שכל תשובה היא 'highlight' או 'target')
-    # save_targets(db, user.id, answers_data.answers) 
-    
-    # 2. סימון האונבורדינג כהושלם
-    update_user(db, user, {"onboarding_complete": True})
+    # 1+2. שמירת התשובות (נניח שכל תשובה היא 'highlight') וסימון האונבורדינג כהושלם -
+    #      טרנזקציה אחת, שגם מבטלת את הפסקאות שנוצרו מראש (היעדים/הדגשים השתנו)
+    complete_onboarding(
+        db, user.id, answers_data.answers,
+        profile_updates=user_context_fields(user.resume_text, user.technologies, answers_data.answers.values()),
+    )
+    PREFETCHER.invalidate_user(user.id)
 
     return {"message": "Onboarding completed successfully."}
\ No newline at end of file
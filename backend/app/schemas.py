@@ -6,7 +6,7 @@ from datetime import datetime
 # --- 1. מודלי Auth & Profile ---
 class PhoneAuth(BaseModel):
     """קלט עבור כניסת טלפון בלבד."""
-    phone_number: str = Field(..., max_length=15)
+    phone_number: str = Field(..., max_length=20) # מנורמל ל-E.164 בשרת
 
 class UserProfileBase(BaseModel):
     """נתוני פרופיל משתמש בסיסיים."""
@@ -65,12 +65,33 @@ class IngestInput(BaseModel):
     content: str = Field(..., description="טקסט מודעה או URL של תמונה")
     content_type: str = Field(..., description="text או image_url")
 
+class BatchIngestItem(BaseModel):
+    """מודעה אחת בתוך Batch."""
+    content: str = Field(..., description="טקסט מודעה או URL של תמונה")
+    content_type: str = Field(..., description="text או image_url")
+
+class BatchIngestInput(BaseModel):
+    """קלט ל-Ingest של כמה מודעות בבת אחת."""
+    user_id: str
+    items: List[BatchIngestItem] = Field(..., min_length=1, max_length=50)
+
 class JobData(BaseModel):
     """נתוני משרה שזוהו על ידי OCR/LLM."""
     job_title: str
     target_email: str
     requirements: List[str]
 
+class JobMatch(BaseModel):
+    """התאמת המשתמש למשרה לפי הכישורים (מחושב מקומית, בלי LLM)."""
+    score: float = Field(..., description="0-1: משקל הכישורים התואמים מתוך כישורי המשרה")
+    matched_skills: List[str]
+    missing_skills: List[str]
+
+class IngestResponse(JobData):
+    """תגובת Ingest: נתוני המשרה + מזהה טיוטת ההגשה שנוצרה + התאמה למשתמש."""
+    submission_id: Optional[str] = None
+    match: Optional[JobMatch] = None
+
 class SubmissionBase(BaseModel):
     """נתוני הגשה בסיסיים."""
     job_title: str
@@ -82,9 +103,22 @@ class Submission(SubmissionBase):
     """מודל הגשה מלא (מגיע מה-DB)."""
     submission_id: str
     date_submitted: datetime
-    status: str = Field(..., description="draft, sent, error")
+    status: str = Field(..., description="draft, queued, sent, failed, error")
     user_id: str
 
 class SubmissionHistory(BaseModel):
     """תגובה עבור מסך ההיסטוריה."""
-    submissions: List[Submission]
\ No newline at end of file
+    submissions: List[Submission]
+
+class SubmissionListItem(BaseModel):
+    """שורה ברשימת ההיסטוריה (Projection קל, בלי הטקסט והדרישות)."""
+    submission_id: str
+    job_title: Optional[str] = None
+    target_email: Optional[str] = None
+    status: str
+    date_submitted: datetime
+
+class SubmissionPage(BaseModel):
+    """עמוד היסטוריה (Keyset Pagination). next_cursor=None בעמוד האחרון."""
+    submissions: List[SubmissionListItem]
+    next_cursor: Optional[str] = None
\ No newline at end of file
@@ -0,0 +1,55 @@
+# /send_me_mvp/backend/app/services/async_db_service.py
+import uuid
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.services.db_service import (
+    DATABASE_URL, engine_options, submission_page_query, build_submission_page, user_upsert_statement, Submission,
+)
+from app.services.metrics import timed_db
+
+
+def to_async_url(url: str) -> str:
+    """ממיר URL סינכרוני לדרייבר האסינכרוני המקביל (asyncpg / aiosqlite)."""
+    if url.startswith("postgresql+psycopg2://"):
+        return url.replace("postgresql+psycopg2://", "postgresql+asyncpg://", 1)
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    if url.startswith("postgres://"):
+        return url.replace("postgres://", "postgresql+asyncpg://", 1)
+    if url.startswith("sqlite://"):
+        return url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    return url
+
+ASYNC_DATABASE_URL = to_async_url(DATABASE_URL)
+
+# --- Engine אסינכרוני (אותן הגדרות Pool כמו ה-Engine הסינכרוני) ---
+AsyncEngine = create_async_engine(ASYNC_DATABASE_URL, **engine_options(ASYNC_DATABASE_URL))
+# expire_on_commit=False: אחרי Commit אין Lazy-load נסתר (שאינו אפשרי ב-AsyncSession)
+AsyncSessionLocal = async_sessionmaker(AsyncEngine, expire_on_commit=False, autoflush=False)
+
+async def get_async_db():
+    """Dependency Injection עבור FastAPI - AsyncSession."""
+    async with AsyncSessionLocal() as session:
+        yield session
+
+# --- פונקציות אסינכרוניות לנתיבים החמים (מקבילות לאלה שב-db_service; השאר עובדים עם ה-Session הסינכרוני) ---
+
+@timed_db
+async def upsert_user_by_phone_async(session: AsyncSession, phone_number: str):
+    """גרסה אסינכרונית של upsert_user_by_phone - Round trip יחיד."""
+    new_user_id = str(uuid.uuid4())
+    stmt = user_upsert_statement(session.bind.dialect.name, new_user_id, phone_number)
+    row = (await session.execute(stmt)).one()
+    await session.commit()
+    return row, row.id == new_user_id
+
+@timed_db
+async def get_submission_by_id_async(session: AsyncSession, submission_id: str) -> Optional[Submission]:
+    return await session.get(Submission, submission_id)
+
+@timed_db
+async def get_submission_page_async(session: AsyncSession, user_id: str, limit: int, cursor: Optional[str] = None):
+    rows = (await session.execute(submission_page_query(user_id, limit, cursor))).all()
+    return build_submission_page(rows, limit)
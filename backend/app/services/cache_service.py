@@ -0,0 +1,139 @@
+# /send_me_mvp/backend/app/services/cache_service.py
+import asyncio
+import hashlib
+import os
+import re
+import unicodedata
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from app.services.db_service import SessionLocal, CacheEntry
+from app.services.lru_cache import LRUCache
+from app.services.metrics import register_cache
+
+# --- הגדרות ---
+CACHE_MEMORY_MAX_ITEMS = int(os.getenv("CACHE_MEMORY_MAX_ITEMS", "512"))
+CACHE_DB_MAX_ROWS = int(os.getenv("CACHE_DB_MAX_ROWS", "20000"))
+# כל כמה כתיבות ל-DB מריצים ניקוי (Expired + חריגה מהגודל המקסימלי)
+CACHE_EVICT_EVERY = int(os.getenv("CACHE_EVICT_EVERY", "100"))
+# last_accessed מתעדכן בקריאה רק כשהוא ישן מהחלק הזה של ה-TTL (כדי שלא כל Hit יהפוך לכתיבה)
+CACHE_TOUCH_FRACTION = float(os.getenv("CACHE_TOUCH_FRACTION", "0.1"))
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_CONTROL_RE = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]")
+
+
+def normalize_text(text: str) -> str:
+    """נרמול טקסט לפני Hash: Unicode NFKC, הסרת תווי בקרה ואיחוד רווחים."""
+    text = unicodedata.normalize("NFKC", text or "")
+    text = _CONTROL_RE.sub(" ", text)
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+def content_key(text: str, version: str) -> str:
+    """מפתח Content-Addressed: SHA-256 של גרסת הפרומפט + הטקסט המנורמל."""
+    digest = hashlib.sha256()
+    digest.update(version.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(normalize_text(text).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class TwoTierCache:
+    """
+    Cache דו-שכבתי: LRU בזיכרון ואחריו טבלת llm_cache ב-Postgres.
+    שכבת ה-DB עובדת עם Session קצר משלה ב-Thread (לא נוגעת בטרנזקציה של הבקשה ולא חוסמת את ה-Event Loop).
+    שגיאות DB לא מפילות את הבקשה - במקרה כזה פשוט מתנהגים כ-Miss.
+    """
+
+    def __init__(self, namespace: str, ttl_seconds: float, memory_items: int = CACHE_MEMORY_MAX_ITEMS, db_max_rows: int = CACHE_DB_MAX_ROWS):
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self.db_max_rows = db_max_rows
+        self.touch_interval = timedelta(seconds=ttl_seconds * CACHE_TOUCH_FRACTION)
+        self.memory = LRUCache(memory_items, ttl_seconds)
+        self.counters = {"memory_hits": 0, "db_hits": 0, "misses": 0}
+        self._writes = 0
+        register_cache(self)
+
+    async def get(self, key: str) -> Optional[Any]:
+        value = self.memory.get(key)
+        if value is not None:
+            self.counters["memory_hits"] += 1
+            return value
+
+        value = await asyncio.to_thread(self._db_get, key)
+        if value is not None:
+            self.counters["db_hits"] += 1
+            self.memory.set(key, value)
+            return value
+
+        self.counters["misses"] += 1
+        return None
+
+    async def set(self, key: str, value: Any):
+        self.memory.set(key, value)
+        self._writes += 1
+        await asyncio.to_thread(self._db_set, key, value, self._writes % CACHE_EVICT_EVERY == 0)
+
+    def _db_get(self, key: str) -> Optional[Any]:
+        try:
+            with SessionLocal() as db:
+                now = datetime.utcnow()
+                entry = db.get(CacheEntry, (self.namespace, key))
+                if entry is None or not entry.expires_at or entry.expires_at <= now:
+                    return None
+                if entry.last_accessed is None or now - entry.last_accessed > self.touch_interval:
+                    entry.last_accessed = now
+                    db.commit()
+                return entry.payload
+        except Exception as e:
+            print(f"Warning: cache read failed ({self.namespace}): {e}")
+            return None
+
+    def _db_set(self, key: str, value: Any, evict: bool = False):
+        try:
+            with SessionLocal() as db:
+                now = datetime.utcnow()
+                db.merge(CacheEntry(
+                    namespace=self.namespace,
+                    key=key,
+                    payload=value,
+                    created_at=now,
+                    last_accessed=now,
+                    expires_at=now + timedelta(seconds=self.ttl_seconds),
+                ))
+                db.commit()
+                if evict:
+                    self.evict(db)
+        except Exception as e:
+            print(f"Warning: cache write failed ({self.namespace}): {e}")
+
+    def evict(self, db_session):
+        """מוחק רשומות שפג תוקפן, ואם עדיין חורגים מהמקסימום - את הפחות בשימוש."""
+        now = datetime.utcnow()
+        query = db_session.query(CacheEntry).filter(CacheEntry.namespace == self.namespace)
+        query.filter(CacheEntry.expires_at <= now).delete(synchronize_session=False)
+        overflow = query.count() - self.db_max_rows
+        if overflow > 0:
+            stale_keys = [
+                row.key for row in
+                query.with_entities(CacheEntry.key).order_by(CacheEntry.last_accessed.asc()).limit(overflow)
+            ]
+            query.filter(CacheEntry.key.in_(stale_keys)).delete(synchronize_session=False)
+        db_session.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.counters["memory_hits"] + self.counters["db_hits"]
+        total = hits + self.counters["misses"]
+        return {
+            "namespace": self.namespace,
+            **self.counters,
+            "memory_items": len(self.memory),
+            "hit_ratio": (hits / total) if total else 0.0,
+        }
+
+
+# --- מופעים משותפים ---
+RESUME_CACHE_TTL_SECONDS = float(os.getenv("RESUME_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+RESUME_CACHE = TwoTierCache("resume", RESUME_CACHE_TTL_SECONDS)
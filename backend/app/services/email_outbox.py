@@ -0,0 +1,159 @@
+# /send_me_mvp/backend/app/services/email_outbox.py
+import asyncio
+import os
+import random
+import time
+from typing import Dict, Optional
+
+from app.services.db_service import (
+    SessionLocal, EmailOutbox, claim_outbox_batch, mark_outbox_sent, mark_outbox_failed, reschedule_outbox,
+)
+from app.services.external_api import get_gmail_service, send_email_with_gmail_api, GmailNotConfiguredError
+
+# --- הגדרות ---
+OUTBOX_WORKER_ENABLED = os.getenv("OUTBOX_WORKER_ENABLED", "1") == "1"
+OUTBOX_CONCURRENCY = int(os.getenv("OUTBOX_CONCURRENCY", "4"))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "20"))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "2"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+OUTBOX_BACKOFF_BASE_SECONDS = float(os.getenv("OUTBOX_BACKOFF_BASE_SECONDS", "5"))
+OUTBOX_BACKOFF_MAX_SECONDS = float(os.getenv("OUTBOX_BACKOFF_MAX_SECONDS", "600"))
+# רשומה ב-sending מעבר לזמן הזה נחשבת "יתומה" (ה-Worker נפל) ונתפסת מחדש
+OUTBOX_LOCK_TIMEOUT_SECONDS = float(os.getenv("OUTBOX_LOCK_TIMEOUT_SECONDS", "120"))
+# מגבלת קצב לכל שולח (Gmail מגביל שליחה לחשבון)
+OUTBOX_SENDER_RATE_PER_MINUTE = float(os.getenv("OUTBOX_SENDER_RATE_PER_MINUTE", "20"))
+# כשאין Credentials ל-Gmail: המייל נשאר pending ונבדק שוב אחרי הזמן הזה (בלי לספור ניסיון)
+OUTBOX_UNCONFIGURED_RETRY_SECONDS = float(os.getenv("OUTBOX_UNCONFIGURED_RETRY_SECONDS", "300"))
+
+
+class SenderRateLimiter:
+    """Token bucket לכל כתובת שולח."""
+
+    def __init__(self, rate_per_minute: float, burst: Optional[float] = None):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.burst = burst if burst is not None else max(1.0, rate_per_minute / 6)
+        self._buckets: Dict[str, list] = {}
+
+    def try_acquire(self, sender: str) -> float:
+        """מחזיר 0 אם אפשר לשלוח עכשיו, אחרת מספר השניות עד שיתפנה Token."""
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.get(sender, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated_at) * self.rate_per_second)
+        if tokens >= 1:
+            self._buckets[sender] = [tokens - 1, now]
+            return 0.0
+        self._buckets[sender] = [tokens, now]
+        return (1 - tokens) / self.rate_per_second
+
+
+def outbox_backoff(attempts: int) -> float:
+    cap = min(OUTBOX_BACKOFF_MAX_SECONDS, OUTBOX_BACKOFF_BASE_SECONDS * (2 ** attempts))
+    return random.uniform(cap / 2, cap)
+
+
+class EmailOutboxWorker:
+    """
+    Worker ברקע שמרוקן את טבלת email_outbox: תפיסת רשומות ב-SKIP LOCKED, שליחה במקביליות חסומה,
+    מגבלת קצב לכל שולח ו-Retry עם Backoff. אפשר להריץ כמה Workers/מופעים במקביל.
+    המסירה היא At-least-once רק בחלון שבין שליחה מוצלחת לעדכון ה-DB.
+    """
+
+    def __init__(self, concurrency: int = OUTBOX_CONCURRENCY):
+        self.concurrency = concurrency
+        self.rate_limiter = SenderRateLimiter(OUTBOX_SENDER_RATE_PER_MINUTE)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._inflight = set()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """עוצר את ה-Poll ואת השליחות שבתהליך (רשומה שנקטעה תיתפס שוב אחרי OUTBOX_LOCK_TIMEOUT_SECONDS)."""
+        tasks = list(self._inflight)
+        if self._task is not None:
+            tasks.append(self._task)
+            self._task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def notify(self):
+        """מעיר את ה-Worker מיד אחרי הכנסה לתור (במקום לחכות ל-Poll הבא)."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                # תופסים רק כמה שיש מקום לשלוח עכשיו
+                free_slots = min(OUTBOX_BATCH_SIZE, self.concurrency - len(self._inflight))
+                entries = await asyncio.to_thread(self._claim, free_slots) if free_slots > 0 else []
+                for entry in entries:
+                    task = asyncio.create_task(self._deliver(entry))
+                    self._inflight.add(task)
+                    task.add_done_callback(self._inflight.discard)
+                if len(entries) == free_slots and free_slots > 0:
+                    continue # ייתכן שיש עוד עבודה ממתינה
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Warning: email outbox poll failed: {e}")
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), OUTBOX_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    @staticmethod
+    def _claim(limit: int):
+        with SessionLocal() as db:
+            return claim_outbox_batch(db, limit, OUTBOX_LOCK_TIMEOUT_SECONDS)
+
+    @staticmethod
+    def _update(fn, *args, **kwargs):
+        with SessionLocal() as db:
+            fn(db, *args, **kwargs)
+
+    async def _safe_update(self, entry: EmailOutbox, fn, *args, **kwargs):
+        """עדכון סטטוס של רשומה; כשל DB לא מפיל את המשימה (הרשומה תיתפס שוב אחרי פקיעת הנעילה)."""
+        try:
+            await asyncio.to_thread(self._update, fn, entry.id, *args, **kwargs)
+        except Exception as e:
+            print(f"Warning: email outbox update ({fn.__name__}) failed for submission {entry.submission_id}: {e}")
+
+    @staticmethod
+    def _send(entry: EmailOutbox):
+        service = get_gmail_service(entry.sender)
+        return send_email_with_gmail_api(service, entry.sender, {"raw": entry.raw_message, "to": entry.recipient})
+
+    async def _deliver(self, entry: EmailOutbox):
+        async with self._semaphore:
+            wait = self.rate_limiter.try_acquire(entry.sender or "")
+            if wait > 0:
+                # מגבלת הקצב של השולח מלאה - דוחים בלי לספור ניסיון
+                await self._safe_update(entry, reschedule_outbox, wait, count_attempt=False)
+                return
+            try:
+                await asyncio.to_thread(self._send, entry)
+            except GmailNotConfiguredError as e:
+                # לא נשלח ולא נכשל - נשאר בתור עם שגיאה מפורשת, עד שיוגדרו Credentials
+                print(f"Warning: email for submission {entry.submission_id} not sent: {e}")
+                await self._safe_update(entry, reschedule_outbox, OUTBOX_UNCONFIGURED_RETRY_SECONDS, str(e), count_attempt=False)
+                return
+            except Exception as e:
+                attempts = (entry.attempts or 0) + 1
+                print(f"Warning: email send failed for submission {entry.submission_id} (attempt {attempts}): {e}")
+                if attempts >= OUTBOX_MAX_ATTEMPTS:
+                    await self._safe_update(entry, mark_outbox_failed, entry.submission_id, str(e))
+                else:
+                    await self._safe_update(entry, reschedule_outbox, outbox_backoff(attempts), str(e))
+                return
+            await self._safe_update(entry, mark_outbox_sent, entry.submission_id)
+
+
+OUTBOX_WORKER = EmailOutboxWorker()
@@ -1,36 +1,141 @@
 # /send_me_mvp/backend/app/services/external_api.py
 import os
-from google.cloud import storage, vision
-from typing import List, Dict, Any
+import threading
+from typing import List, Dict, Any, Optional
 from app.schemas import JobData
+from app.services.metrics import observe_external
 from email.mime.text import MIMEText
 import base64
-# import os.path # נדרש ל-Gmail API Auth
-# from googleapiclient.discovery import build # נדרש ל-Gmail API
 
-# --- קליינטים ---
-GCS_CLIENT = storage.Client()
-VISION_CLIENT = vision.ImageAnnotatorClient()
+# --- קליינטים (אתחול עצל) ---
+# הקליינטים נוצרים בשימוש הראשון ולא בזמן ה-Import, כדי לא להאט Cold start
+# לבקשות שלא נוגעות ב-GCS/Vision. ניתן להציב כאן מופע מוכן (למשל Fake לבדיקות).
+GCS_CLIENT = None
+VISION_CLIENT = None
+_CLIENTS_LOCK = threading.Lock()
+
+def get_gcs_client():
+    """מחזיר את קליינט ה-GCS (יוצר אותו בפעם הראשונה, Thread-safe)."""
+    global GCS_CLIENT
+    if GCS_CLIENT is None:
+        with _CLIENTS_LOCK:
+            if GCS_CLIENT is None:
+                from google.cloud import storage
+                if os.getenv("STORAGE_EMULATOR_HOST"):
+                    # GCS מקומי (למשל fake-gcs-server) - בלי Credentials אמיתיים
+                    from google.auth.credentials import AnonymousCredentials
+                    GCS_CLIENT = storage.Client(project=os.getenv("GCS_PROJECT", "local-dev"), credentials=AnonymousCredentials())
+                else:
+                    GCS_CLIENT = storage.Client()
+    return GCS_CLIENT
+
+def get_vision_client():
+    """מחזיר את קליינט ה-Vision (יוצר אותו בפעם הראשונה, Thread-safe)."""
+    global VISION_CLIENT
+    if VISION_CLIENT is None:
+        with _CLIENTS_LOCK:
+            if VISION_CLIENT is None:
+                from google.cloud import vision
+                VISION_CLIENT = vision.ImageAnnotatorClient()
+    return VISION_CLIENT
 
 # הגדרת Bucket
 GCS_BUCKET_NAME = os.getenv("GCS_BUCKET_NAME", "sendme-resumes-bucket")
+# מעל הסף הזה ההעלאה היא Resumable ב-Chunks (חייב להיות כפולה של 256KB)
+GCS_RESUMABLE_THRESHOLD = int(os.getenv("GCS_RESUMABLE_THRESHOLD", str(1024 * 1024)))
+GCS_UPLOAD_CHUNK_SIZE = int(os.getenv("GCS_UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
 
 # --- 1. שירות GCS ---
 def upload_resume_to_gcs(file_bytes: bytes, filename: str, content_type: str) -> str:
     """מעלה קובץ קורות חיים ל-GCS ומחזיר את הנתיב."""
-    bucket = GCS_CLIENT.bucket(GCS_BUCKET_NAME)
+    bucket = get_gcs_client().bucket(GCS_BUCKET_NAME)
+    blob = bucket.blob(f"resumes/{filename}")
+    with observe_external("gcs", "upload"):
+        blob.upload_from_string(file_bytes, content_type=content_type)
+    return f"gs://{GCS_BUCKET_NAME}/resumes/{filename}"
+
+def upload_resume_stream_to_gcs(file_obj, filename: str, content_type: str, size: Optional[int] = None) -> str:
+    """
+    מעלה קובץ ל-GCS ישירות מ-File object (למשל ה-Spool של UploadFile), בלי לטעון אותו שוב לזיכרון.
+    מעל GCS_RESUMABLE_THRESHOLD (או כשהגודל לא ידוע) - Resumable upload ב-Chunks.
+    פונקציה חוסמת: יש להריץ ב-Thread (asyncio.to_thread).
+    """
+    bucket = get_gcs_client().bucket(GCS_BUCKET_NAME)
     blob = bucket.blob(f"resumes/{filename}")
-    blob.upload_from_string(file_bytes, content_type=content_type)
+    if size is None or size > GCS_RESUMABLE_THRESHOLD:
+        blob.chunk_size = GCS_UPLOAD_CHUNK_SIZE
+    file_obj.seek(0)
+    with observe_external("gcs", "upload_stream"):
+        blob.upload_from_file(file_obj, size=size, content_type=content_type)
     return f"gs://{GCS_BUCKET_NAME}/resumes/{filename}"
 
 # --- 2. שירות Google Vision (OCR) ---
 def extract_text_from_image(image_bytes: bytes) -> str:
     """מבצע OCR על תמונת מודעת משרה ומחלץ טקסט גולמי."""
+    from google.cloud import vision
     image = vision.Image(content=image_bytes)
-    response = VISION_CLIENT.document_text_detection(image=image)
+    with observe_external("vision", "document_text_detection"):
+        response = get_vision_client().document_text_detection(image=image)
     return response.full_text_annotation.text
 
+def batch_extract_text_from_images(images: List[bytes]) -> List[Any]:
+    """
+    OCR לכמה תמונות בקריאת batch_annotate_images אחת (עד 16 תמונות לבקשה).
+    מחזיר לכל תמונה את הטקסט, או Exception אם ה-OCR שלה נכשל. פונקציה חוסמת.
+    """
+    from google.cloud import vision
+    feature = vision.Feature(type_=vision.Feature.Type.DOCUMENT_TEXT_DETECTION)
+    requests = [vision.AnnotateImageRequest(image=vision.Image(content=content), features=[feature]) for content in images]
+    with observe_external("vision", "batch_annotate_images"):
+        response = get_vision_client().batch_annotate_images(requests=requests)
+    results = []
+    for item in response.responses:
+        if item.error.message:
+            results.append(RuntimeError(f"Vision OCR error: {item.error.message}"))
+        else:
+            results.append(item.full_text_annotation.text)
+    return results
+
 # --- 3. שירות Gmail API (שליחה) ---
+# Credentials לשליחה: Service account עם Domain-wide delegation (כל מייל נשלח בשם השולח שלו),
+# או טוקן OAuth של חשבון שולח יחיד (authorized_user JSON, כפי שנוצר ב-OAuth Flow של google-auth-oauthlib)
+GMAIL_SERVICE_ACCOUNT_FILE = os.getenv("GMAIL_SERVICE_ACCOUNT_FILE")
+GMAIL_TOKEN_FILE = os.getenv("GMAIL_TOKEN_FILE")
+GMAIL_SCOPES = ["https://www.googleapis.com/auth/gmail.send"]
+# אובייקט השירות של googleapiclient אינו Thread-safe - מופע לכל Thread (השליחה רצה ב-to_thread)
+_GMAIL_SERVICES = threading.local()
+
+
+class GmailNotConfiguredError(RuntimeError):
+    """לא הוגדרו Credentials לשליחה דרך Gmail - המייל נשאר בתור עד שיוגדרו."""
+
+
+def get_gmail_service(sender: str):
+    """שירות Gmail מאומת עבור השולח (נבנה פעם אחת לכל שולח ו-Thread). פונקציה חוסמת."""
+    if GMAIL_SERVICE_ACCOUNT_FILE:
+        key = sender
+    elif GMAIL_TOKEN_FILE:
+        key = "" # חשבון שולח יחיד לכל המיילים
+    else:
+        raise GmailNotConfiguredError("gmail not configured: set GMAIL_SERVICE_ACCOUNT_FILE or GMAIL_TOKEN_FILE")
+    services = getattr(_GMAIL_SERVICES, "by_sender", None)
+    if services is None:
+        services = _GMAIL_SERVICES.by_sender = {}
+    service = services.get(key)
+    if service is None:
+        from googleapiclient.discovery import build
+        if GMAIL_SERVICE_ACCOUNT_FILE:
+            from google.oauth2 import service_account
+            credentials = service_account.Credentials.from_service_account_file(
+                GMAIL_SERVICE_ACCOUNT_FILE, scopes=GMAIL_SCOPES
+            ).with_subject(sender)
+        else:
+            from google.oauth2.credentials import Credentials
+            credentials = Credentials.from_authorized_user_file(GMAIL_TOKEN_FILE, GMAIL_SCOPES)
+        service = build("gmail", "v1", credentials=credentials, cache_discovery=False)
+        services[key] = service
+    return service
+
 def create_email_message(sender: str, to: str, subject: str, message_text: str) -> Dict[str, str]:
     """יוצר אובייקט הודעת מייל מקודד ב-Base64 עבור Gmail API."""
     message = MIMEText(message_text, 'html', 'utf-8')
@@ -44,9 +149,7 @@ def create_email_message(sender: str, to: str, subject: str, message_text: str)
     return {'raw': raw_message}
 
 def send_email_with_gmail_api(service, user_email: str, raw_message: Dict[str, str]):
-    """שולח את המייל דרך Gmail API (דורש שירות מאומת)."""
-    # בפועל, כאן תהיה קריאה ל-service.users().messages().send()
-    
-    # סימולציה:
-    print(f"DEBUG: Email sent from {user_email} to {raw_message.get('to')} successfully!")
-    return True
\ No newline at end of file
+    """שולח את המייל דרך Gmail API (דורש שירות מאומת). מחזיר את מזהה ההודעה ב-Gmail."""
+    with observe_external("gmail", "send"):
+        result = service.users().messages().send(userId="me", body={"raw": raw_message["raw"]}).execute()
+    return result.get("id")
\ No newline at end of file
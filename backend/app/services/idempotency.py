@@ -0,0 +1,190 @@
+# /send_me_mvp/backend/app/services/idempotency.py
+import asyncio
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import IntegrityError
+
+from app.services.db_service import SessionLocal, IdempotencyRecord
+
+# --- הגדרות ---
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+# בלי Header: בקשה זהה מאותו משתמש בתוך החלון הזה נחשבת Retry (0 = כבוי).
+# רק בפעולות עם תופעות לוואי (Ingest, שליחת מייל) - ב-run(implicit=False) נדרש מפתח מפורש
+IDEMPOTENCY_IMPLICIT_WINDOW_SECONDS = float(os.getenv("IDEMPOTENCY_IMPLICIT_WINDOW_SECONDS", "30"))
+# כמה זמן בקשה כפולה ממתינה למקורית שרצה במופע אחר, לפני 409
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "60"))
+# רשומה in_progress ותיקה מזה נחשבת נטושה (המופע שטיפל בה נפל)
+IDEMPOTENCY_LOCK_SECONDS = float(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "300"))
+IDEMPOTENCY_POLL_SECONDS = 0.25
+IDEMPOTENCY_EVICT_EVERY = 200
+
+REPLAY_HEADER = "Idempotent-Replayed"
+
+
+def request_fingerprint(payload: Any) -> str:
+    body = json.dumps(jsonable_encoder(payload), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+
+def replay_response(status_code: int, body: Any) -> JSONResponse:
+    return JSONResponse(body, status_code=status_code, headers={REPLAY_HEADER: "true"})
+
+
+class IdempotencyStore:
+    """
+    Idempotency לבקשות יקרות (Ingest, פסקה, שליחת מייל):
+    הבקשה הראשונה עם מפתח רצה ושומרת את התגובה; Retry מקבל את התגובה השמורה,
+    ו-Retry שמגיע בזמן שהמקורית עדיין רצה - ממתין לה (Future באותו מופע, Polling על ה-DB ממופע אחר).
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Tuple[str, str, str], Tuple[str, asyncio.Future]] = {}
+        self._claims = 0
+
+    # --- DB ---
+    def _claim(self, scope: str, user_id: str, key: str, fingerprint: str, ttl_seconds: float) -> Optional[IdempotencyRecord]:
+        """מנסה לתפוס את המפתח. מחזיר None אם נתפס, או את הרשומה הקיימת."""
+        with SessionLocal() as db:
+            now = datetime.utcnow()
+            db.add(IdempotencyRecord(
+                scope=scope, user_id=user_id, key=key, fingerprint=fingerprint,
+                status="in_progress", created_at=now, expires_at=now + timedelta(seconds=ttl_seconds),
+            ))
+            try:
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+            else:
+                self._claims += 1
+                if self._claims % IDEMPOTENCY_EVICT_EVERY == 0:
+                    db.query(IdempotencyRecord).filter(IdempotencyRecord.expires_at <= now).delete(synchronize_session=False)
+                    db.commit()
+                return None
+
+            existing = db.get(IdempotencyRecord, (scope, user_id, key))
+            if existing is None:
+                return self._claim(scope, user_id, key, fingerprint, ttl_seconds) # נמחקה בינתיים
+            abandoned = existing.status == "in_progress" and existing.created_at < now - timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS)
+            if existing.expires_at <= now or abandoned:
+                db.delete(existing)
+                db.commit()
+                return self._claim(scope, user_id, key, fingerprint, ttl_seconds)
+            db.expunge(existing)
+            return existing
+
+    @staticmethod
+    def _complete(scope: str, user_id: str, key: str, status_code: int, body: Any):
+        with SessionLocal() as db:
+            db.query(IdempotencyRecord).filter_by(scope=scope, user_id=user_id, key=key).update(
+                {"status": "completed", "response_status": status_code, "response_body": body}, synchronize_session=False
+            )
+            db.commit()
+
+    @staticmethod
+    def _release(scope: str, user_id: str, key: str):
+        """כשל לא צפוי - משחררים את המפתח כדי שה-Retry יריץ את הבקשה מחדש."""
+        with SessionLocal() as db:
+            db.query(IdempotencyRecord).filter_by(scope=scope, user_id=user_id, key=key).delete(synchronize_session=False)
+            db.commit()
+
+    @staticmethod
+    def _load(scope: str, user_id: str, key: str) -> Optional[IdempotencyRecord]:
+        with SessionLocal() as db:
+            record = db.get(IdempotencyRecord, (scope, user_id, key))
+            if record is not None:
+                db.expunge(record)
+            return record
+
+    async def _wait_for_other_instance(self, scope: str, user_id: str, key: str) -> JSONResponse:
+        deadline = asyncio.get_running_loop().time() + IDEMPOTENCY_WAIT_SECONDS
+        while asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(IDEMPOTENCY_POLL_SECONDS)
+            record = await asyncio.to_thread(self._load, scope, user_id, key)
+            if record is None:
+                break # המקורית נכשלה ושוחררה
+            if record.status == "completed":
+                return replay_response(record.response_status, record.response_body)
+        raise HTTPException(status_code=409, detail="בקשה עם אותו Idempotency-Key עדיין בטיפול", headers={"Retry-After": "1"})
+
+    async def _join_inflight(self, record_id: Tuple[str, str, str], fingerprint: str) -> JSONResponse:
+        inflight_fingerprint, future = self._inflight[record_id]
+        if inflight_fingerprint != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key כבר שימש לבקשה אחרת")
+        stored_status, body = await asyncio.shield(future)
+        return replay_response(stored_status, body)
+
+    # --- API ---
+    async def run(
+        self,
+        scope: str,
+        user_id: str,
+        key: Optional[str],
+        payload: Any,
+        handler: Callable[[], Awaitable[Any]],
+        status_code: int = 200,
+        implicit: bool = True,
+    ) -> Any:
+        """
+        מריץ את handler פעם אחת לכל (scope, user_id, key). בלי key - חלון Dedup קצר לפי גוף הבקשה,
+        אלא אם implicit=False (למשל יצירת פסקה, שבה בקשה חוזרת היא "צור שוב" ולא Retry).
+        מחזיר את תוצאת ה-handler בקריאה הראשונה, ו-JSONResponse שמור (עם Header של Replay) בחזרות.
+        """
+        fingerprint = request_fingerprint(payload)
+        ttl_seconds = IDEMPOTENCY_TTL_SECONDS
+        if not key:
+            if not implicit or IDEMPOTENCY_IMPLICIT_WINDOW_SECONDS <= 0:
+                return await handler()
+            key, ttl_seconds = f"implicit:{fingerprint}", IDEMPOTENCY_IMPLICIT_WINDOW_SECONDS
+        record_id = (scope, user_id or "", key)
+
+        if record_id in self._inflight:
+            return await self._join_inflight(record_id, fingerprint)
+
+        # פעולות ה-DB (Commit סינכרוני) רצות ב-Thread כדי לא לחסום את ה-Event Loop
+        existing = await asyncio.to_thread(self._claim, *record_id, fingerprint, ttl_seconds)
+        if existing is not None:
+            if existing.fingerprint != fingerprint:
+                raise HTTPException(status_code=422, detail="Idempotency-Key כבר שימש לבקשה אחרת")
+            if existing.status == "completed":
+                return replay_response(existing.response_status, existing.response_body)
+            if record_id in self._inflight:
+                # בקשה מקבילה באותו מופע תפסה את המפתח בזמן שחיכינו ל-DB
+                return await self._join_inflight(record_id, fingerprint)
+            return await self._wait_for_other_instance(*record_id)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[record_id] = (fingerprint, future)
+        # ה-handler רץ כמשימה עצמאית: ניתוק של הלקוח (שעליו יבוא Retry) לא מבטל את העבודה היקרה
+        task = asyncio.create_task(self._execute(record_id, handler, status_code, future))
+        return await asyncio.shield(task)
+
+    async def _execute(self, record_id, handler, status_code: int, future: asyncio.Future):
+        try:
+            # שגיאות (כולל HTTPException כמו 403 לפני סיום אונבורדינג) לא נשמרות: המצב יכול להשתנות עד ה-Retry.
+            # ממתינים שכבר מחכים לבקשה הזו מקבלים את אותה שגיאה.
+            result = await handler()
+            body = jsonable_encoder(result)
+            await asyncio.to_thread(self._complete, *record_id, status_code, body)
+            future.set_result((status_code, body))
+            return result
+        except BaseException as e:
+            if not future.done():
+                await asyncio.to_thread(self._release, *record_id)
+                if isinstance(e, asyncio.CancelledError):
+                    future.cancel()
+                else:
+                    future.set_exception(e)
+                    future.exception() # מסמן כ"נקרא" - אם אין ממתינים זו לא שגיאה
+            raise
+        finally:
+            self._inflight.pop(record_id, None)
+
+
+IDEMPOTENCY = IdempotencyStore()
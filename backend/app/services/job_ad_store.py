@@ -0,0 +1,172 @@
+# /send_me_mvp/backend/app/services/job_ad_store.py
+import hashlib
+import os
+import random
+import re
+import unicodedata
+import uuid
+from typing import Awaitable, Callable, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from sqlalchemy.exc import IntegrityError
+
+from app.schemas import JobData
+from app.services.db_service import JobAd, JobAdBand
+from app.services.metrics import timed_db
+
+# --- הגדרות MinHash / LSH ---
+MINHASH_PERMUTATIONS = 128
+LSH_BANDS = 16 # 16 Bands של 8 שורות: סף מועמדות של ~0.7 דמיון
+LSH_ROWS = MINHASH_PERMUTATIONS // LSH_BANDS
+SHINGLE_SIZE = 3
+JOB_AD_SIMILARITY_THRESHOLD = float(os.getenv("JOB_AD_SIMILARITY_THRESHOLD", "0.85"))
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+# פרמוטציות קבועות (Seed קבוע) - חייבות להיות זהות בין תהליכים והרצות
+_rng = random.Random(1337)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(MINHASH_PERMUTATIONS)
+]
+
+_URL_RE = re.compile(r"https?://\S+")
+_EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+", re.UNICODE)
+# פיסוק שנדבק לסוף קישור בטקסט חופשי ("...co.il/jobs)." )
+_TRAILING_PUNCTUATION = ".,;:!?)]}>\"'"
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+# פרמטרי מעקב שלא משנים את תוכן המודעה
+_TRACKING_PARAMS = {"fbclid", "gclid", "ref", "ref_src", "src", "trk", "trackingid", "igshid", "si"}
+
+
+def _strip_tracking(match: re.Match) -> str:
+    parts = urlsplit(match.group(0))
+    query = [
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if k.lower() not in _TRACKING_PARAMS and not k.lower().startswith(("utm_", "mc_"))
+    ]
+    return urlunsplit((parts.scheme, parts.netloc.lower(), parts.path.rstrip("/"), urlencode(query), ""))
+
+
+def normalize_job_ad(text: str) -> str:
+    """נרמול מודעה: Unicode, אותיות קטנות, ניקוי פרמטרי מעקב מקישורים ואיחוד רווחים/פיסוק."""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    text = _URL_RE.sub(_strip_tracking, text)
+    return " ".join(_TOKEN_RE.findall(text))
+
+
+def contact_points(text: str) -> List[str]:
+    """
+    המיילים והקישורים שבמודעה (מנורמלים, ממוינים). שתי מודעות מאותה תבנית ששונות רק בכתובת
+    או בחברה עוברות את סף ה-Jaccard - ההשוואה הזו מונעת שליחת מועמדות למעסיק של המודעה האחרת.
+    """
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    urls = {_URL_RE.sub(_strip_tracking, url.rstrip(_TRAILING_PUNCTUATION)) for url in _URL_RE.findall(text)}
+    emails = set(_EMAIL_RE.findall(_URL_RE.sub(" ", text)))
+    return sorted(urls | emails)
+
+
+def fingerprint(normalized: str) -> str:
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def minhash_signature(normalized: str) -> List[int]:
+    """חתימת MinHash על Shingles של מילים (k=3)."""
+    tokens = normalized.split()
+    if len(tokens) < SHINGLE_SIZE:
+        shingles = {" ".join(tokens)}
+    else:
+        shingles = {" ".join(tokens[i:i + SHINGLE_SIZE]) for i in range(len(tokens) - SHINGLE_SIZE + 1)}
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "big") for s in shingles]
+    return [
+        min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+        for a, b in _PERMUTATIONS
+    ]
+
+
+def band_keys(signature: List[int]) -> List[str]:
+    keys = []
+    for band in range(LSH_BANDS):
+        rows = signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]
+        digest = hashlib.blake2b(repr(rows).encode("ascii"), digest_size=8).hexdigest()
+        keys.append(f"{band}:{digest}")
+    return keys
+
+
+def estimated_similarity(sig_a: List[int], sig_b: List[int]) -> float:
+    """הערכת Jaccard: שיעור הפרמוטציות שבהן המינימום זהה."""
+    if not sig_a or not sig_b:
+        return 0.0
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / len(sig_a)
+
+
+def to_job_data(job_ad: JobAd) -> JobData:
+    return JobData(job_title=job_ad.job_title, target_email=job_ad.target_email, requirements=job_ad.requirements or [])
+
+
+@timed_db
+def find_job_ad(db_session, normalized: str, signature: List[int], contacts: List[str]) -> Optional[JobAd]:
+    """
+    חיפוש מודעה קיימת: קודם התאמה מדויקת, ואז מועמדים מאינדקס ה-LSH.
+    מועמד דומה מתקבל רק אם המיילים והקישורים שלו זהים (מודעות ישנות בלי contacts - רק התאמה מדויקת).
+    """
+    exact = db_session.query(JobAd).filter(JobAd.fingerprint == fingerprint(normalized)).first()
+    if exact:
+        return exact
+
+    candidate_ids = {
+        row.job_ad_id for row in
+        db_session.query(JobAdBand.job_ad_id).filter(JobAdBand.band_key.in_(band_keys(signature)))
+    }
+    if not candidate_ids:
+        return None
+
+    best, best_score = None, 0.0
+    for candidate in db_session.query(JobAd).filter(JobAd.id.in_(candidate_ids)):
+        if candidate.contacts != contacts:
+            continue
+        score = estimated_similarity(signature, candidate.minhash)
+        if score > best_score:
+            best, best_score = candidate, score
+    return best if best_score >= JOB_AD_SIMILARITY_THRESHOLD else None
+
+
+@timed_db
+def save_job_ad(db_session, normalized: str, signature: List[int], contacts: List[str], job_data: JobData) -> JobAd:
+    """שומר מודעה חדשה + רשומות LSH. במקרה של מירוץ על אותו Fingerprint - מחזיר את הקיימת."""
+    job_ad = JobAd(
+        id=str(uuid.uuid4()),
+        fingerprint=fingerprint(normalized),
+        minhash=signature,
+        contacts=contacts,
+        job_title=job_data.job_title,
+        target_email=job_data.target_email,
+        requirements=job_data.requirements,
+    )
+    db_session.add(job_ad)
+    db_session.add_all([JobAdBand(band_key=key, job_ad_id=job_ad.id) for key in band_keys(signature)])
+    try:
+        db_session.commit()
+    except IntegrityError:
+        db_session.rollback()
+        return db_session.query(JobAd).filter(JobAd.fingerprint == job_ad.fingerprint).one()
+    return job_ad
+
+
+async def get_or_extract_job_ad(
+    db_session,
+    job_ad_text: str,
+    extractor: Callable[[str], Awaitable[JobData]],
+) -> Tuple[JobAd, bool]:
+    """
+    מחזיר מודעה משותפת עבור הטקסט (חדשה או קיימת) ודגל האם נמצאה ב-Cache.
+    החילוץ (LLM) מתבצע רק כשאין מודעה זהה או כמעט-זהה.
+    """
+    normalized = normalize_job_ad(job_ad_text)
+    signature = minhash_signature(normalized)
+    contacts = contact_points(job_ad_text)
+    existing = find_job_ad(db_session, normalized, signature, contacts)
+    if existing:
+        return existing, True
+    job_data = await extractor(job_ad_text)
+    return save_job_ad(db_session, normalized, signature, contacts, job_data), False
@@ -0,0 +1,114 @@
+# /send_me_mvp/backend/app/services/json_stream.py
+import json
+from typing import Any, List, Optional, Set, Tuple
+
+_OPEN = {"{": "}", "[": "]"}
+
+
+class _Frame:
+    """קונטיינר פתוח (אובייקט/מערך) במהלך הסריקה."""
+    __slots__ = ("kind", "path", "expecting_key", "key", "capture_start")
+
+    def __init__(self, kind: str, path: Tuple[str, ...], capture_start: Optional[int]):
+        self.kind = kind # "{" או "["
+        self.path = path
+        self.expecting_key = kind == "{"
+        self.key: Optional[str] = None
+        self.capture_start = capture_start # אינדקס תחילת הערך, אם הוא אחד מהערכים שמחכים להם
+
+
+class IncrementalJSONParser:
+    """
+    Parser אינקרמנטלי ל-JSON שמגיע ב-Chunks (Streaming מ-Gemini).
+    לא בונה את כל העץ - רק סורק את המבנה (מחרוזות, Escape, קינון) ומחזיר כל ערך מבוקש ברגע שהוא נסגר.
+
+    paths: נתיבים של ערכים לפלוט, למשל "profile_data" (מפתח באובייקט השורש)
+    או "questions[]" (כל איבר במערך questions). נפלטים רק ערכים שהם אובייקט/מערך.
+    טקסט לפני השורש (למשל ```json) מדולג. כל תו נסרק פעם אחת בלבד.
+    """
+
+    def __init__(self, paths: List[str]):
+        self._paths: Set[Tuple[str, ...]] = {self._parse_path(p) for p in paths}
+        self._text = ""
+        self._pos = 0
+        self._stack: List[_Frame] = []
+        self._in_string = False
+        self._escaped = False
+        self._string_start = 0
+        self._done = False
+
+    @staticmethod
+    def _parse_path(path: str) -> Tuple[str, ...]:
+        return tuple(part for segment in path.split(".") for part in ((segment[:-2], "[]") if segment.endswith("[]") else (segment,)))
+
+    def _value_path(self) -> Optional[Tuple[str, ...]]:
+        """הנתיב של הערך שמתחיל עכשיו, לפי הקונטיינר הפתוח העליון."""
+        if not self._stack:
+            return ()
+        frame = self._stack[-1]
+        if frame.kind == "[":
+            return frame.path + ("[]",)
+        return frame.path + (frame.key,) if frame.key is not None else None
+
+    @property
+    def done(self) -> bool:
+        return self._done
+
+    @property
+    def text(self) -> str:
+        return self._text
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """מוסיף Chunk ומחזיר רשימת (path, value) של ערכים מבוקשים שהושלמו בו."""
+        self._text += chunk
+        text = self._text
+        events = []
+        pos = self._pos
+        while pos < len(text) and not self._done:
+            ch = text[pos]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+                    frame = self._stack[-1] if self._stack else None
+                    if frame is not None and frame.kind == "{" and frame.expecting_key:
+                        frame.key = json.loads(text[self._string_start:pos + 1])
+                        frame.expecting_key = False
+            elif ch == '"':
+                self._in_string = True
+                self._string_start = pos
+            elif ch in _OPEN:
+                path = self._value_path() or ()
+                self._stack.append(_Frame(ch, path, pos if path in self._paths else None))
+            elif ch in "}]":
+                if not self._stack:
+                    pos += 1
+                    continue
+                frame = self._stack.pop()
+                if frame.capture_start is not None:
+                    events.append((self._format_path(frame.path), json.loads(text[frame.capture_start:pos + 1])))
+                if not self._stack:
+                    self._done = True
+            elif ch == "," and self._stack and self._stack[-1].kind == "{":
+                frame = self._stack[-1]
+                frame.expecting_key = True
+                frame.key = None
+            pos += 1
+        self._pos = pos
+        return events
+
+    @staticmethod
+    def _format_path(path: Tuple[str, ...]) -> str:
+        return ".".join(path).replace(".[]", "[]")
+
+    def result(self) -> Any:
+        """ה-JSON המלא, אחרי שכל ה-Chunks התקבלו (זורק ValueError אם הוא לא שלם/תקין)."""
+        text = self._text
+        start = text.find("{")
+        end = text.rfind("}")
+        if start < 0 or end < start:
+            raise ValueError("JSON לא שלם")
+        return json.loads(text[start:end + 1])
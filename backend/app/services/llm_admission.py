@@ -0,0 +1,276 @@
+# /send_me_mvp/backend/app/services/llm_admission.py
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.services.llm_resilience import parse_endpoint_settings
+from app.services.metrics import LLM_ADMISSION_QUEUE_DEPTH, LLM_ADMISSION_REJECTED, LLM_ADMISSION_WAIT_SECONDS
+from app.services.prompt_builder import estimate_tokens
+
+# --- הגדרות (ממשתני סביבה) ---
+# המכסות של Gemini לכל מופע (אם רצים כמה מופעים - לחלק את המכסה של הפרויקט ביניהם)
+LLM_ADMISSION_ENABLED = os.getenv("LLM_ADMISSION_ENABLED", "1") == "1"
+LLM_GLOBAL_RPM = float(os.getenv("LLM_GLOBAL_RPM", "600"))
+LLM_GLOBAL_TPM = float(os.getenv("LLM_GLOBAL_TPM", "800000"))
+# מכסה לכל משתמש (Burst = דקה שלמה, כך ש-Batch ingest של 50 מודעות עדיין עובר)
+LLM_USER_RPM = float(os.getenv("LLM_USER_RPM", "60"))
+LLM_USER_TPM = float(os.getenv("LLM_USER_TPM", "120000"))
+LLM_ADMISSION_MAX_QUEUE = int(os.getenv("LLM_ADMISSION_MAX_QUEUE", "200"))
+# בקשה שההמתנה הצפויה שלה בתור ארוכה מזה נדחית מיד (429) במקום להגיע ל-Timeout
+LLM_ADMISSION_MAX_WAIT_SECONDS = float(os.getenv("LLM_ADMISSION_MAX_WAIT_SECONDS", "5"))
+# עדיפות לכל סוג קריאה - מספר נמוך קודם. בקשות אינטראקטיביות לפני עבודת רקע
+LLM_ENDPOINT_PRIORITIES = os.getenv("LLM_ENDPOINT_PRIORITIES", "paragraph=0,onboarding=1,job_extraction=1,paragraph_prefetch=5")
+# עדיפות מזו ומעלה היא עבודת רקע: נזרקת ראשונה, כשהתור חצי מלא
+LLM_BACKGROUND_PRIORITY = int(os.getenv("LLM_BACKGROUND_PRIORITY", "5"))
+# הערכת Tokens של הפלט (לתקציב ה-TPM לפני שהקריאה יוצאת; מתוקן אחרי לפי usage_metadata)
+LLM_OUTPUT_TOKEN_ESTIMATES = os.getenv("LLM_OUTPUT_TOKEN_ESTIMATES", "onboarding=1200,paragraph=250,paragraph_prefetch=250,job_extraction=200")
+DEFAULT_OUTPUT_TOKENS = 500
+MAX_TRACKED_USERS = 10_000
+
+
+class AdmissionRejected(Exception):
+    """הקריאה ל-LLM נדחתה ע"י בקרת העומס (מוחזר ללקוח כ-429 עם Retry-After)."""
+
+    def __init__(self, retry_after: float, reason: str):
+        super().__init__(f"LLM admission rejected ({reason}), retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+        self.reason = reason
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class TokenBucket:
+    """Token bucket עם מילוי רציף. הרמה יכולה לרדת מתחת ל-0 (תיקון בדיעבד לפי השימוש בפועל)."""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.level = self.capacity
+        self._updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated_at) * self.rate_per_second)
+        self._updated_at = now
+
+    def eta(self, cost: float) -> float:
+        """שניות עד שיצטברו cost Tokens (0 = עכשיו), גם אם cost גדול מהקיבולת (הערכה לכמה בקשות ברצף)."""
+        self._refill()
+        missing = cost - self.level
+        if missing <= 0:
+            return 0.0
+        return missing / self.rate_per_second if self.rate_per_second > 0 else math.inf
+
+    def wait_time(self, cost: float) -> float:
+        """כמו eta לבקשה בודדת; עלות גדולה מהקיבולת נחסמת לקיבולת (אחרת לא הייתה עוברת לעולם)."""
+        return self.eta(min(cost, self.capacity))
+
+    def take(self, cost: float):
+        self._refill()
+        self.level -= min(cost, self.capacity)
+
+    def adjust(self, delta: float):
+        """תיקון אחרי הקריאה: delta חיובי = השתמשנו ביותר מההערכה."""
+        self._refill()
+        self.level = min(self.capacity, self.level - delta)
+
+    def drain(self):
+        self._refill()
+        self.level = min(self.level, 0.0)
+
+    @property
+    def idle(self) -> bool:
+        self._refill()
+        return self.level >= self.capacity
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "endpoint", "tokens", "future")
+
+    def __init__(self, priority: int, seq: int, endpoint: str, tokens: int, future: asyncio.Future):
+        self.priority = priority
+        self.seq = seq
+        self.endpoint = endpoint
+        self.tokens = tokens
+        self.future = future
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class LLMAdmissionController:
+    """
+    בקרת כניסה לפני כל קריאה ל-Gemini: Token buckets גלובליים (RPM/TPM) ולכל משתמש,
+    תור עדיפויות כשהמכסה הגלובלית מוצתה (פסקה אינטראקטיבית לפני Prefetch ברקע),
+    ודחייה מהירה (AdmissionRejected -> 429 עם Retry-After) כשההמתנה הצפויה ארוכה מדי או שהתור מלא.
+    """
+
+    def __init__(
+        self,
+        rpm: float = LLM_GLOBAL_RPM,
+        tpm: float = LLM_GLOBAL_TPM,
+        user_rpm: float = LLM_USER_RPM,
+        user_tpm: float = LLM_USER_TPM,
+        max_queue: int = LLM_ADMISSION_MAX_QUEUE,
+        max_wait: float = LLM_ADMISSION_MAX_WAIT_SECONDS,
+        priorities: Optional[Dict[str, int]] = None,
+    ):
+        # Burst גלובלי של 10 שניות: לא שורפים את כל מכסת הדקה בשנייה אחת
+        self._requests = TokenBucket(rpm, max(1.0, rpm / 6))
+        self._tokens = TokenBucket(tpm, tpm / 6)
+        self.user_rpm = user_rpm
+        self.user_tpm = user_tpm
+        self._users: Dict[str, Tuple[TokenBucket, TokenBucket]] = {}
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._priorities = priorities if priorities is not None else parse_endpoint_settings(LLM_ENDPOINT_PRIORITIES, int)
+        self._output_estimates = parse_endpoint_settings(LLM_OUTPUT_TOKEN_ESTIMATES, int)
+        self._heap: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    # --- הערכות ---
+    def priority(self, endpoint: str) -> int:
+        return self._priorities.get(endpoint, LLM_BACKGROUND_PRIORITY - 1)
+
+    def estimate_cost(self, endpoint: str, contents: Any) -> int:
+        """Tokens צפויים לקריאה: גודל הפרומפט + הערכת פלט לפי סוג הקריאה."""
+        prompt = contents if isinstance(contents, str) else str(contents)
+        return estimate_tokens(prompt) + self._output_estimates.get(endpoint, DEFAULT_OUTPUT_TOKENS)
+
+    def _user_buckets(self, user_id: str) -> Tuple[TokenBucket, TokenBucket]:
+        buckets = self._users.get(user_id)
+        if buckets is None:
+            if len(self._users) >= MAX_TRACKED_USERS:
+                # משתמשים שה-Bucket שלהם מלא לא שונים ממשתמש חדש - אפשר לשכוח אותם
+                self._users = {uid: b for uid, b in self._users.items() if not (b[0].idle and b[1].idle)}
+            buckets = (TokenBucket(self.user_rpm), TokenBucket(self.user_tpm))
+            self._users[user_id] = buckets
+        return buckets
+
+    def _global_wait(self, tokens: int) -> float:
+        return max(self._requests.wait_time(1), self._tokens.wait_time(tokens))
+
+    def _estimated_wait(self, priority: int, tokens: int) -> float:
+        """המתנה צפויה: כל מי שבתור לפנינו (עדיפות שווה או גבוהה) + אנחנו."""
+        ahead = [w for w in self._heap if not w.future.done() and w.priority <= priority]
+        return max(self._requests.eta(1 + len(ahead)), self._tokens.eta(tokens + sum(w.tokens for w in ahead)))
+
+    def queue_depth(self) -> int:
+        return sum(1 for w in self._heap if not w.future.done())
+
+    def _reject(self, endpoint: str, retry_after: float, reason: str):
+        LLM_ADMISSION_REJECTED.labels(endpoint, reason).inc()
+        raise AdmissionRejected(retry_after, reason)
+
+    # --- תור ---
+    def _pump(self):
+        """מעביר את ראש התור כל עוד יש מכסה; אחרת מתזמן את עצמו לרגע שתתפנה."""
+        self._timer = None
+        while self._heap:
+            head = self._heap[0]
+            if head.future.done():
+                heapq.heappop(self._heap)
+                continue
+            wait = self._global_wait(head.tokens)
+            if wait > 0:
+                self._timer = asyncio.get_running_loop().call_later(wait, self._pump)
+                break
+            heapq.heappop(self._heap)
+            self._take_global(head.tokens)
+            head.future.set_result(None)
+        LLM_ADMISSION_QUEUE_DEPTH.set(self.queue_depth())
+
+    def _repump(self):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._pump()
+
+    def _take_global(self, tokens: int):
+        self._requests.take(1)
+        self._tokens.take(tokens)
+
+    # --- API ---
+    async def acquire(self, endpoint: str, user_id: Optional[str], tokens: int):
+        """ממתין למכסה עבור קריאה אחת, או זורק AdmissionRejected."""
+        if not LLM_ADMISSION_ENABLED:
+            return
+        priority = self.priority(endpoint)
+
+        # 1. מכסת המשתמש - בלי תור: משתמש שחרג מקבל 429 מיד עם הזמן המדויק
+        user_buckets = self._user_buckets(user_id) if user_id else None
+        if user_buckets is not None:
+            user_wait = max(user_buckets[0].wait_time(1), user_buckets[1].wait_time(tokens))
+            if user_wait > 0:
+                self._reject(endpoint, user_wait, "user_quota")
+
+        # 2. מכסה גלובלית - מיידי אם אין תור, אחרת תור עדיפויות
+        started_at = time.perf_counter()
+        if not self._heap and self._global_wait(tokens) == 0:
+            self._take_global(tokens)
+        else:
+            depth = self.queue_depth()
+            if depth >= self.max_queue or (priority >= LLM_BACKGROUND_PRIORITY and depth >= self.max_queue // 2):
+                self._reject(endpoint, max(1.0, self._estimated_wait(priority, tokens)), "queue_full")
+            estimated = self._estimated_wait(priority, tokens)
+            if estimated > self.max_wait:
+                self._reject(endpoint, estimated, "quota")
+
+            waiter = _Waiter(priority, next(self._seq), endpoint, tokens, asyncio.get_running_loop().create_future())
+            heapq.heappush(self._heap, waiter)
+            self._repump()
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), self.max_wait)
+            except asyncio.TimeoutError:
+                waiter.future.cancel()
+                LLM_ADMISSION_QUEUE_DEPTH.set(self.queue_depth())
+                self._reject(endpoint, max(1.0, self._estimated_wait(priority, tokens)), "timeout")
+            except asyncio.CancelledError:
+                if waiter.future.done() and not waiter.future.cancelled():
+                    # קיבלנו מכסה בדיוק כשבוטלנו - מחזירים אותה
+                    self._requests.adjust(-1)
+                    self._tokens.adjust(-tokens)
+                else:
+                    waiter.future.cancel()
+                self._repump()
+                raise
+        LLM_ADMISSION_WAIT_SECONDS.labels(endpoint).observe(time.perf_counter() - started_at)
+
+        if user_buckets is not None:
+            user_buckets[0].take(1)
+            user_buckets[1].take(tokens)
+
+    def try_acquire(self, tokens: int) -> bool:
+        """מכסה גלובלית רק אם היא פנויה עכשיו ואין תור (לבקשות אופציונליות כמו Hedge)."""
+        if not LLM_ADMISSION_ENABLED:
+            return True
+        if self._heap or self._global_wait(tokens) > 0:
+            return False
+        self._take_global(tokens)
+        return True
+
+    def settle(self, user_id: Optional[str], estimated_tokens: int, response: Any):
+        """מתקן את ה-Buckets לפי usage_metadata בפועל (אם קיים)."""
+        usage = getattr(response, "usage_metadata", None)
+        if usage is None or not LLM_ADMISSION_ENABLED:
+            return
+        actual = (getattr(usage, "prompt_token_count", None) or 0) + (getattr(usage, "candidates_token_count", None) or 0)
+        if not actual:
+            return
+        delta = actual - estimated_tokens
+        self._tokens.adjust(delta)
+        if user_id and user_id in self._users:
+            self._users[user_id][1].adjust(delta)
+
+    def on_rate_limited(self):
+        """Gemini החזיר 429 - המכסה האמיתית קטנה ממה שחשבנו: מרוקנים את ה-Bucket עד שיתמלא מחדש."""
+        self._requests.drain()
+
+
+LLM_ADMISSION = LLMAdmissionController()
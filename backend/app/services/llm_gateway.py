@@ -0,0 +1,303 @@
+# /send_me_mvp/backend/app/services/llm_gateway.py
+import asyncio
+import inspect
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+from google.genai import errors as genai_errors
+
+from app.services.metrics import observe_llm, LLM_HEDGES, LLM_MODEL_FALLBACKS
+from app.services.llm_resilience import (
+    CircuitBreakers, CircuitOpenError, HedgePolicy, HALF_OPEN, LLM_FALLBACK_MODELS, parse_endpoint_settings,
+)
+
+# --- הגדרות (ממשתני סביבה) ---
+# מגבלה גלובלית על מספר הקריאות המקבילות ל-Gemini מתוך ה-Worker
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+# מגבלה לכל סוג קריאה, בפורמט: "onboarding=2,paragraph=4"
+LLM_ENDPOINT_LIMITS = os.getenv("LLM_ENDPOINT_LIMITS", "onboarding=3,paragraph=6,paragraph_prefetch=2,job_extraction=4")
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "0.5"))
+LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "8"))
+
+# קודי HTTP שמצדיקים ניסיון חוזר (Rate limit / תקלות זמניות בצד השרת)
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """האם השגיאה זמנית וכדאי לנסות שוב."""
+    if isinstance(exc, asyncio.TimeoutError):
+        return True
+    if isinstance(exc, genai_errors.APIError):
+        return getattr(exc, "code", None) in RETRYABLE_STATUS_CODES
+    return isinstance(exc, (ConnectionError, OSError))
+
+
+def is_rate_limited(exc: BaseException) -> bool:
+    return isinstance(exc, genai_errors.APIError) and getattr(exc, "code", None) == 429
+
+
+class LLMGateway:
+    """
+    שכבת גישה אסינכרונית ל-Gemini: בקרת מכסות (admission, אם הוגדרה), הגבלת מקביליות (גלובלית ולכל Endpoint),
+    Timeout לכל קריאה ו-Retry עם Backoff אקספוננציאלי ו-Jitter.
+    לזנב ה-Latency: Hedging (בקשה שנייה אחרי אחוזון ה-Latency) ו-Circuit breaker לכל סוג קריאה ומודל,
+    עם מעבר למודל חלופי כשה-Breaker של הראשי פתוח (ו-CircuitOpenError אם אין - נכשלים מיד ל-Fallback).
+    """
+
+    def __init__(
+        self,
+        client_getter: Callable[[], Any],
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        endpoint_limits: Optional[Dict[str, int]] = None,
+        timeout: float = LLM_TIMEOUT_SECONDS,
+        max_retries: int = LLM_MAX_RETRIES,
+        admission: Any = None,
+        breakers: Optional[CircuitBreakers] = None,
+        hedging: Optional[HedgePolicy] = None,
+        fallback_models: Optional[Dict[str, str]] = None,
+    ):
+        self._client_getter = client_getter
+        self.admission = admission
+        self.breakers = breakers or CircuitBreakers()
+        self.hedging = hedging or HedgePolicy()
+        self.fallback_models = fallback_models if fallback_models is not None else parse_endpoint_settings(LLM_FALLBACK_MODELS)
+        self._global_limit = asyncio.Semaphore(max_concurrency)
+        self._endpoint_limits = endpoint_limits if endpoint_limits is not None else parse_endpoint_settings(LLM_ENDPOINT_LIMITS, int)
+        self._endpoint_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self.timeout = timeout
+        self.max_retries = max_retries
+
+    def _endpoint_semaphore(self, endpoint: str) -> Optional[asyncio.Semaphore]:
+        limit = self._endpoint_limits.get(endpoint)
+        if not limit:
+            return None
+        if endpoint not in self._endpoint_semaphores:
+            self._endpoint_semaphores[endpoint] = asyncio.Semaphore(limit)
+        return self._endpoint_semaphores[endpoint]
+
+    @asynccontextmanager
+    async def slot(self, endpoint: str):
+        """תופס מקום במגבלת ה-Endpoint ובמגבלה הגלובלית (בסדר קבוע, למניעת Deadlock)."""
+        endpoint_semaphore = self._endpoint_semaphore(endpoint)
+        if endpoint_semaphore is None:
+            async with self._global_limit:
+                yield
+            return
+        async with endpoint_semaphore, self._global_limit:
+            yield
+
+    async def _admit(self, endpoint: str, user_id: Optional[str], contents: Any) -> int:
+        """ממתין למכסה (כל ניסיון הוא בקשה נפרדת מול ה-RPM). מחזיר את הערכת ה-Tokens."""
+        if self.admission is None:
+            return 0
+        estimated = self.admission.estimate_cost(endpoint, contents)
+        await self.admission.acquire(endpoint, user_id, estimated)
+        return estimated
+
+    def _settle(self, user_id: Optional[str], estimated: int, response: Any):
+        if self.admission is not None and response is not None:
+            self.admission.settle(user_id, estimated, response)
+
+    def _on_error(self, exc: BaseException):
+        if self.admission is not None and is_rate_limited(exc):
+            self.admission.on_rate_limited()
+
+    def _pick_model(self, endpoint: str, model: str):
+        """
+        המודל לקריאה הבאה לפי מצב ה-Breakers: הראשי, החלופי, או CircuitOpenError.
+        מחזיר (model, breaker, probe) - probe=True אם הקריאה תפסה את ניסיון ה-Half-open של ה-Breaker,
+        ואז חובה לשחרר אותו (breaker.release) בכל יציאה שלא דיווחה תוצאה.
+        """
+        breaker = self.breakers.get(endpoint, model)
+        if breaker.allow():
+            return model, breaker, breaker.state == HALF_OPEN
+        fallback = self.fallback_models.get(endpoint)
+        if fallback and fallback != model:
+            fallback_breaker = self.breakers.get(endpoint, fallback)
+            if fallback_breaker.allow():
+                LLM_MODEL_FALLBACKS.labels(endpoint, fallback).inc()
+                return fallback, fallback_breaker, fallback_breaker.state == HALF_OPEN
+        raise CircuitOpenError(endpoint)
+
+    @staticmethod
+    def _record_failure(breaker, exc: BaseException):
+        # רק תקלות של השירות נספרות (לא 4xx של הבקשה עצמה, ולא ביטול של הלקוח)
+        if is_retryable(exc):
+            breaker.record(False)
+
+    def _may_hedge(self, endpoint: str, estimated: int) -> bool:
+        if not self.hedging.try_spend(endpoint):
+            return False
+        # ה-Hedge הוא בקשה נוספת מול המכסה - רק אם יש מכסה פנויה עכשיו (לא נכנס לתור)
+        return self.admission is None or self.admission.try_acquire(estimated)
+
+    async def _call_hedged(self, endpoint: str, model: str, contents: Any, config: Any, timeout: float, estimated: int) -> Any:
+        """
+        קריאה אחת, ואם היא לא חזרה אחרי השהיית ה-Hedge - קריאה זהה נוספת; התשובה הראשונה שמצליחה מנצחת
+        והשנייה מבוטלת. ה-Hedge רץ בתוך ה-Slot של הקריאה המקורית (לא תופס מקום נוסף במגבלת המקביליות).
+        """
+        primary = asyncio.ensure_future(asyncio.wait_for(self._call_once(model, contents, config), timeout))
+        hedge = None
+        try:
+            delay = self.hedging.delay(endpoint)
+            if delay is None or delay >= timeout:
+                return await primary
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done or not self._may_hedge(endpoint, estimated):
+                return await primary
+            LLM_HEDGES.labels(endpoint, "fired").inc()
+            hedge = asyncio.ensure_future(asyncio.wait_for(self._call_once(model, contents, config), timeout))
+            pending, error = {primary, hedge}, None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        LLM_HEDGES.labels(endpoint, "hedge_won" if task is hedge else "primary_won").inc()
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    @staticmethod
+    def backoff_delay(attempt: int) -> float:
+        """Full jitter: זמן המתנה אקראי בין 0 לתקרה האקספוננציאלית."""
+        cap = min(LLM_BACKOFF_MAX_SECONDS, LLM_BACKOFF_BASE_SECONDS * (2 ** attempt))
+        return random.uniform(0, cap)
+
+    async def _call_once(self, model: str, contents: Any, config: Any) -> Any:
+        client = self._client_getter()
+        aio = getattr(client, "aio", None)
+        if aio is not None:
+            # ה-SDK חושף ממשק אסינכרוני אמיתי (client.aio)
+            return await aio.models.generate_content(model=model, contents=contents, config=config)
+        # Fallback: קליינט סינכרוני בלבד - מריצים ב-Thread כדי לא לחסום את ה-Event Loop
+        return await asyncio.to_thread(client.models.generate_content, model=model, contents=contents, config=config)
+
+    async def generate(
+        self,
+        endpoint: str,
+        model: str,
+        contents: Any,
+        config: Any = None,
+        timeout: Optional[float] = None,
+        user_id: Optional[str] = None,
+    ) -> Any:
+        """מבצע generate_content תחת מגבלות המכסה והמקביליות, עם Timeout ו-Retry."""
+        timeout = timeout or self.timeout
+        attempt = 0
+        while True:
+            breaker, probe = None, False
+            try:
+                call_model, breaker, probe = self._pick_model(endpoint, model)
+                estimated = await self._admit(endpoint, user_id, contents)
+                async with self.slot(endpoint):
+                    # הזמן נמדד אחרי קבלת ה-Slot: זמן ההמתנה בתור הוא חלק מה-Latency של הבקשה, לא של Gemini
+                    started_at = time.perf_counter()
+                    try:
+                        response = await self._call_hedged(endpoint, call_model, contents, config, timeout, estimated)
+                    except BaseException as e:
+                        observe_llm(endpoint, time.perf_counter() - started_at, "error")
+                        self._record_failure(breaker, e)
+                        raise
+                    elapsed = time.perf_counter() - started_at
+                    observe_llm(endpoint, elapsed, "ok", response)
+                    breaker.record(True)
+                    if call_model == model:
+                        self.hedging.observe(endpoint, elapsed)
+                    self._settle(user_id, estimated, response)
+                    return response
+            except Exception as e:
+                self._on_error(e)
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = self.backoff_delay(attempt)
+                print(f"LLM call '{endpoint}' failed ({e!r}), retry {attempt + 1}/{self.max_retries} in {delay:.2f}s")
+                attempt += 1
+                # ההמתנה מתבצעת מחוץ לסמפור כדי לא לתפוס מקום של קריאות אחרות
+                await asyncio.sleep(delay)
+            finally:
+                if probe:
+                    # ניסיון Half-open שלא דווח (AdmissionRejected, 4xx, ביטול) - לא חוסם את ה-Breaker
+                    breaker.release()
+
+    async def _open_stream(self, model: str, contents: Any, config: Any) -> AsyncIterator[Any]:
+        client = self._client_getter()
+        stream = client.aio.models.generate_content_stream(model=model, contents=contents, config=config)
+        # בגרסאות חדשות של ה-SDK זו Coroutine שמחזירה Iterator, בישנות - Async Generator ישירות
+        if inspect.isawaitable(stream):
+            stream = await stream
+        return stream
+
+    async def stream(
+        self,
+        endpoint: str,
+        model: str,
+        contents: Any,
+        config: Any = None,
+        timeout: Optional[float] = None,
+        user_id: Optional[str] = None,
+    ) -> AsyncIterator[Any]:
+        """
+        generate_content_stream תחת אותן מגבלות מקביליות. ה-Timeout חל על כל Chunk בנפרד.
+        Retry מתבצע רק אם הכשל קרה לפני ה-Chunk הראשון (אחרת הלקוח כבר קיבל טקסט).
+        """
+        timeout = timeout or self.timeout
+        attempt = 0
+        while True:
+            received_any = False
+            breaker, probe = None, False
+            try:
+                # בלי Hedging ב-Streaming (הלקוח כבר מקבל טקסט מהבקשה הראשונה); Breaker ומודל חלופי - כן
+                call_model, breaker, probe = self._pick_model(endpoint, model)
+                estimated = await self._admit(endpoint, user_id, contents)
+                async with self.slot(endpoint):
+                    started_at = time.perf_counter()
+                    outcome, last_chunk = "error", None
+                    stream = await asyncio.wait_for(self._open_stream(call_model, contents, config), timeout)
+                    iterator = stream.__aiter__()
+                    try:
+                        while True:
+                            try:
+                                chunk = await asyncio.wait_for(iterator.__anext__(), timeout)
+                            except StopAsyncIteration:
+                                outcome = "ok"
+                                if not received_any:
+                                    breaker.record(True)
+                                return
+                            if not received_any:
+                                breaker.record(True) # השירות עונה - נספר בחלון ה-Breaker כהצלחה
+                            received_any = True
+                            last_chunk = chunk
+                            yield chunk
+                    except (GeneratorExit, asyncio.CancelledError):
+                        outcome = "cancelled" # הלקוח התנתק באמצע
+                        raise
+                    finally:
+                        # usage_metadata מגיע ב-Chunk האחרון
+                        observe_llm(endpoint, time.perf_counter() - started_at, outcome, last_chunk)
+                        self._settle(user_id, estimated, last_chunk)
+                        # סגירת ה-Stream מול Gemini גם בביטול (למשל ניתוק הלקוח)
+                        aclose = getattr(iterator, "aclose", None)
+                        if aclose is not None:
+                            await aclose()
+            except Exception as e:
+                self._on_error(e)
+                if not received_any and breaker is not None:
+                    self._record_failure(breaker, e)
+                if received_any or attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = self.backoff_delay(attempt)
+                print(f"LLM stream '{endpoint}' failed ({e!r}), retry {attempt + 1}/{self.max_retries} in {delay:.2f}s")
+                attempt += 1
+                await asyncio.sleep(delay)
+            finally:
+                if probe:
+                    breaker.release()
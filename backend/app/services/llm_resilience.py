@@ -0,0 +1,191 @@
+# /send_me_mvp/backend/app/services/llm_resilience.py
+import os
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Optional, Tuple, TypeVar
+
+from app.services.metrics import LLM_CIRCUIT_STATE, LLM_HEDGE_DELAY_SECONDS
+
+T = TypeVar("T")
+
+# --- הגדרות (ממשתני סביבה) ---
+# Hedging: לכל סוג קריאה - האחוזון של ה-Latency שאחריו נשלחת בקשה שנייה (ריק = כבוי)
+LLM_HEDGE_PERCENTILES = os.getenv("LLM_HEDGE_PERCENTILES", "paragraph=95,onboarding=95")
+LLM_HEDGE_MIN_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_MIN_DELAY_SECONDS", "0.5"))
+# עד שנאספו מספיק מדידות אין Hedging (האחוזון לא אמין)
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+# תקציב: לכל היותר חלק זה מהקריאות מקבל בקשה נוספת
+LLM_HEDGE_MAX_RATIO = float(os.getenv("LLM_HEDGE_MAX_RATIO", "0.1"))
+LATENCY_WINDOW_SIZE = 200
+
+# Circuit breaker: לכל (סוג קריאה, מודל)
+LLM_BREAKER_WINDOW_SECONDS = float(os.getenv("LLM_BREAKER_WINDOW_SECONDS", "30"))
+LLM_BREAKER_MIN_CALLS = int(os.getenv("LLM_BREAKER_MIN_CALLS", "10"))
+LLM_BREAKER_ERROR_RATE = float(os.getenv("LLM_BREAKER_ERROR_RATE", "0.5"))
+# חריגות לסוג קריאה מסוים, בפורמט "paragraph=0.3"
+LLM_BREAKER_ERROR_RATES = os.getenv("LLM_BREAKER_ERROR_RATES", "")
+LLM_BREAKER_OPEN_SECONDS = float(os.getenv("LLM_BREAKER_OPEN_SECONDS", "20"))
+
+# מודל זול/מהיר יותר כשה-Breaker של המודל הראשי פתוח, בפורמט "paragraph=gemini-2.5-flash-lite"
+LLM_FALLBACK_MODELS = os.getenv("LLM_FALLBACK_MODELS", "paragraph=gemini-2.5-flash-lite,paragraph_prefetch=gemini-2.5-flash-lite")
+
+
+def parse_endpoint_settings(raw: str, cast: Callable[[str], T] = str) -> Dict[str, T]:
+    """ממיר מחרוזת "name=value,name2=value2" למילון (עם המרת טיפוס לערכים)."""
+    settings = {}
+    for part in raw.split(","):
+        if "=" not in part:
+            continue
+        name, value = part.split("=", 1)
+        try:
+            settings[name.strip()] = cast(value.strip())
+        except ValueError:
+            print(f"Warning: invalid LLM endpoint setting '{part}'")
+    return settings
+
+
+class CircuitOpenError(RuntimeError):
+    """ה-Breaker פתוח (וגם למודל החלופי, אם הוגדר) - נכשלים מיד במקום לחכות ל-Timeout."""
+
+    def __init__(self, endpoint: str):
+        super().__init__(f"LLM circuit open for '{endpoint}'")
+        self.endpoint = endpoint
+
+
+# --- Circuit breaker ---
+CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+
+
+class CircuitBreaker:
+    """
+    Breaker לפי שיעור שגיאות בחלון זמן: נפתח כששיעור השגיאות (מעל מינימום קריאות) עובר את הסף,
+    ואחרי LLM_BREAKER_OPEN_SECONDS מאפשר בקשת ניסיון אחת (Half-open) - הצלחה סוגרת, כשל פותח מחדש.
+    """
+
+    def __init__(
+        self,
+        name: Tuple[str, str],
+        error_rate: float = LLM_BREAKER_ERROR_RATE,
+        window_seconds: float = LLM_BREAKER_WINDOW_SECONDS,
+        min_calls: int = LLM_BREAKER_MIN_CALLS,
+        open_seconds: float = LLM_BREAKER_OPEN_SECONDS,
+    ):
+        self.name = name
+        self.error_rate = error_rate
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self._calls: Deque[Tuple[float, bool]] = deque()
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_started_at: Optional[float] = None
+        self._set_state(CLOSED)
+
+    def _set_state(self, state: int):
+        self.state = state
+        LLM_CIRCUIT_STATE.labels(*self.name).set(state)
+
+    def _prune(self, now: float):
+        while self._calls and self._calls[0][0] < now - self.window_seconds:
+            _, ok = self._calls.popleft()
+            if not ok:
+                self._failures -= 1
+
+    def allow(self) -> bool:
+        now = time.monotonic()
+        if self.state == OPEN:
+            if now - self._opened_at < self.open_seconds:
+                return False
+            self._set_state(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            # בקשת ניסיון אחת בכל פעם (ניסיון שלא דווח - למשל בוטל - פג אחרי open_seconds)
+            if self._probe_started_at is not None and now - self._probe_started_at < self.open_seconds:
+                return False
+            self._probe_started_at = now
+        return True
+
+    def release(self):
+        """
+        ניסיון Half-open שהסתיים בלי תוצאה שנספרת (נדחה ע"י בקרת העומס, 4xx של הבקשה עצמה, ביטול):
+        מפנה את מקום הניסיון מיד, במקום לחסום את ה-Breaker עד שהניסיון יפוג.
+        """
+        if self.state == HALF_OPEN:
+            self._probe_started_at = None
+
+    def record(self, ok: bool):
+        now = time.monotonic()
+        if self.state == HALF_OPEN:
+            self._probe_started_at = None
+            if ok:
+                self._calls.clear()
+                self._failures = 0
+                self._set_state(CLOSED)
+            else:
+                self._open(now)
+            return
+        self._prune(now)
+        self._calls.append((now, ok))
+        if not ok:
+            self._failures += 1
+        if self.state == CLOSED and len(self._calls) >= self.min_calls and self._failures / len(self._calls) >= self.error_rate:
+            print(f"Warning: LLM circuit opened for {self.name} ({self._failures}/{len(self._calls)} failed)")
+            self._open(now)
+
+    def _open(self, now: float):
+        self._opened_at = now
+        self._set_state(OPEN)
+
+
+class CircuitBreakers:
+    def __init__(self, error_rates: Optional[Dict[str, float]] = None):
+        self._error_rates = error_rates if error_rates is not None else parse_endpoint_settings(LLM_BREAKER_ERROR_RATES, float)
+        self._breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+
+    def get(self, endpoint: str, model: str) -> CircuitBreaker:
+        key = (endpoint, model)
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            breaker = CircuitBreaker(key, error_rate=self._error_rates.get(endpoint, LLM_BREAKER_ERROR_RATE))
+            self._breakers[key] = breaker
+        return breaker
+
+
+# --- Hedging ---
+class HedgePolicy:
+    """
+    מחליט מתי לשלוח בקשה שנייה (Hedge): אחרי האחוזון שהוגדר מה-Latency של הקריאות המוצלחות האחרונות,
+    ורק בתוך תקציב (LLM_HEDGE_MAX_RATIO מסך הקריאות) - כדי שבעומס ה-Hedging לא יכפיל את העומס.
+    """
+
+    def __init__(self, percentiles: Optional[Dict[str, float]] = None, max_ratio: float = LLM_HEDGE_MAX_RATIO):
+        self._percentiles = percentiles if percentiles is not None else parse_endpoint_settings(LLM_HEDGE_PERCENTILES, float)
+        self.max_ratio = max_ratio
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._calls: Dict[str, int] = {}
+        self._hedges: Dict[str, int] = {}
+
+    def observe(self, endpoint: str, seconds: float):
+        """Latency של קריאה מוצלחת (בלי המתנה בתור)."""
+        self._latencies.setdefault(endpoint, deque(maxlen=LATENCY_WINDOW_SIZE)).append(seconds)
+
+    def delay(self, endpoint: str) -> Optional[float]:
+        """זמן ההמתנה לפני Hedge עבור קריאה חדשה, או None אם אין Hedging לסוג הזה (עדיין)."""
+        percentile = self._percentiles.get(endpoint)
+        samples = self._latencies.get(endpoint)
+        self._calls[endpoint] = self._calls.get(endpoint, 0) + 1
+        if not percentile or not samples or len(samples) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        rank = min(len(ordered) - 1, max(0, int(round(percentile / 100 * len(ordered))) - 1))
+        delay = max(LLM_HEDGE_MIN_DELAY_SECONDS, ordered[rank])
+        LLM_HEDGE_DELAY_SECONDS.labels(endpoint).set(delay)
+        return delay
+
+    def try_spend(self, endpoint: str) -> bool:
+        """לוקח מתקציב ה-Hedging (מספר ה-Hedges עד כה לא יעלה על max_ratio מהקריאות, +1 ל-Burst)."""
+        hedges = self._hedges.get(endpoint, 0)
+        if hedges + 1 > self.max_ratio * self._calls.get(endpoint, 0) + 1:
+            return False
+        self._hedges[endpoint] = hedges + 1
+        return True
@@ -1,134 +1,227 @@
 # /send_me_mvp/backend/app/services/llm_service.py
 import json
 import os
+import threading
 from google import genai
 from google.genai import types
-from app.schemas import OnboardingCombinedOutput, JobData
-from typing import Dict, Any, List
+from pydantic import ValidationError
+from app.schemas import OnboardingCombinedOutput, ResumeAnalysis, FocusQuestion, JobData
+from app.services.llm_gateway import LLMGateway
+from app.services.llm_admission import LLM_ADMISSION, AdmissionRejected
+from app.services.cache_service import RESUME_CACHE, content_key
+from app.services.json_stream import IncrementalJSONParser
+from app.services.prompt_builder import (
+    PROMPT_VERSIONS, create_onboarding_prompt, create_paragraph_prompt, create_job_extraction_prompt,
+)
+from typing import Dict, Any, List, AsyncIterator, Optional, Tuple
 
 # Gemini API Key יקרא ממשתנה הסביבה GEMINI_API_KEY
 # חובה להגדיר משתנה סביבה זה ב-Cloud Run
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY") 
 MODEL_NAME = "gemini-2.5-flash"
 
-# --- אתחול Gemini Client ---
-# ה-Client מוצא אוטומטית את המפתח ממשתנה הסביבה GEMINI_API_KEY
-try:
-    CLIENT = genai.Client(api_key=GEMINI_API_KEY)
-except Exception as e:
-    # טיפול באתחול אם המפתח חסר (בפיתוח מקומי ללא מפתח)
-    print(f"Gemini Client initialization error: {e}")
-    CLIENT = None # נגדיר ל-None כדי למנוע קריסה מיידית
+# --- אתחול Gemini Client (עצל) ---
+# נוצר בקריאה הראשונה ולא בזמן ה-Import. ניתן להציב כאן מופע מוכן (למשל Fake לבדיקות).
+CLIENT = None
+_CLIENT_INIT_FAILED = False
+_CLIENT_LOCK = threading.Lock()
+
+def get_client():
+    """מחזיר את ה-Client של Gemini, או None אם האתחול נכשל (למשל חסר מפתח בפיתוח מקומי)."""
+    global CLIENT, _CLIENT_INIT_FAILED
+    if CLIENT is None and not _CLIENT_INIT_FAILED:
+        with _CLIENT_LOCK:
+            if CLIENT is None and not _CLIENT_INIT_FAILED:
+                try:
+                    # ה-Client מוצא אוטומטית את המפתח ממשתנה הסביבה GEMINI_API_KEY
+                    CLIENT = genai.Client(api_key=GEMINI_API_KEY)
+                except Exception as e:
+                    print(f"Gemini Client initialization error: {e}")
+                    _CLIENT_INIT_FAILED = True # לא מנסים שוב בכל בקשה
+    return CLIENT
+
+# --- Gateway אסינכרוני (מכסות, מקביליות, Timeout, Retry) ---
+# AdmissionRejected לא נבלע ב-Fallback של הפונקציות כאן: הוא עולה ל-Router ומוחזר כ-429 עם Retry-After
+GATEWAY = LLMGateway(get_client, admission=LLM_ADMISSION)
 
 
 # --- פרומפט 1: פירוק קו"ח ויצירת שאלות ---
-def create_onboarding_prompt(resume_text: str) -> str:
-    """יוצר פרומפט ל-Gemini לפירוק קורות חיים וגנרציה של שאלות בפורמט JSON."""
-    
-    return f"""
-    אתה מומחה גיוס המנתח קורות חיים.
-    המטרה: 
-    1. לחלץ נתונים קריטיים על המועמד: שם, מייל, סיכום ניסיון (2-3 משפטים) ורשימת טכנולוגיות מרכזיות (מערך).
-    2. לייצר 4-5 שאלות מיקוד (Focus Questions) מותאמות אישית, שמטרתן לחלץ "הדגשים" (Highlights) שניתן לשלב במייל הגשת מועמדות. לכל שאלה, הצע 3-4 תשובות אפשריות.
-
-    הקפד להחזיר רק JSON תקין (Raw JSON) לפי הסכימה הבאה:
-    {{
-        "profile_data": {{
-            "name": "שם המועמד",
-            "email": "אימייל",
-            "experience_summary": "סיכום ניסיון",
-            "technologies": ["טכנולוגיה 1", "טכנולוגיה 2"]
-        }},
-        "questions": [
-            {{
-                "q": "השאלה הממוקדת",
-                "options": [
-                    {{"text": "הסבר אופציה 1", "value": "הדגש שיש לשלב במייל (קצר)"}},
-                    {{"text": "הסבר אופציה 2", "value": "הדגש שיש לשלב במייל (קצר)"}}
-                ]
-            }}
-            // ... שאר השאלות
-        ]
-    }}
-
-    ---
-    קורות חיים גולמיים:
-    {resume_text}
-    ---
-    """
+# התבניות, תקציבי ה-Tokens והגרסאות מוגדרים ב-prompt_builder; הגרסה היא חלק ממפתח ה-Cache
+ONBOARDING_PROMPT_VERSION = PROMPT_VERSIONS["onboarding"]
 
-async def process_resume_and_generate_questions(resume_text: str) -> OnboardingCombinedOutput:
-    if not CLIENT:
+async def process_resume_and_generate_questions(resume_text: str, user_id: Optional[str] = None) -> OnboardingCombinedOutput:
+    if not get_client():
         return OnboardingCombinedOutput(profile_data={"name": "חסר", "email": "error@sendme.com", "experience_summary": "שגיאה: חסר GEMINI_API_KEY", "technologies": []}, questions=[])
-        
+
+    # Cache לפי Hash של הטקסט המנורמל + גרסת הפרומפט (העלאה חוזרת של אותו קובץ)
+    cache_key = content_key(resume_text, ONBOARDING_PROMPT_VERSION)
+    cached = await RESUME_CACHE.get(cache_key)
+    if cached is not None:
+        return OnboardingCombinedOutput(**cached)
+
     prompt = create_onboarding_prompt(resume_text)
     
     try:
-        response = CLIENT.models.generate_content(
+        response = await GATEWAY.generate(
+            "onboarding",
             model=MODEL_NAME,
             contents=prompt,
             config=types.GenerateContentConfig(
                 response_mime_type="application/json", # דורש שהפלט יהיה JSON תקין
             ),
+            user_id=user_id,
         )
         
         # Gemini מחזיר את ה-JSON כ-response.text
         json_data = json.loads(response.text)
-        return OnboardingCombinedOutput(**json_data)
+        result = OnboardingCombinedOutput(**json_data)
+        # שומרים ב-Cache רק תוצאה תקינה (לא את ה-Fallback של השגיאה)
+        await RESUME_CACHE.set(cache_key, result.model_dump())
+        return result
         
+    except AdmissionRejected:
+        raise
     except Exception as e:
         print(f"Error calling Gemini for resume processing: {e}")
         return OnboardingCombinedOutput(profile_data={"name": "שגיאה", "email": "error@sendme.com", "experience_summary": "שגיאת פירוק קו\"ח עקב כשל AI", "technologies": []}, questions=[])
 
+async def stream_resume_and_generate_questions(resume_text: str, user_id: Optional[str] = None) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    גרסת Streaming של process_resume_and_generate_questions: JSON של Gemini נסרק תוך כדי הגעה,
+    ומוחזרים ("profile", ResumeAnalysis) ואז ("question", FocusQuestion) לכל שאלה - ברגע שהאובייקט נסגר ועבר אימות.
+    בסוף: ("done", OnboardingCombinedOutput) עם כל מה שהתקבל (ונשמר ב-Cache אם הפלט המלא תקין).
+    """
+    if not get_client():
+        fallback = await process_resume_and_generate_questions(resume_text, user_id)
+        yield "profile", fallback.profile_data
+        yield "done", fallback
+        return
+
+    cache_key = content_key(resume_text, ONBOARDING_PROMPT_VERSION)
+    cached = await RESUME_CACHE.get(cache_key)
+    if cached is not None:
+        result = OnboardingCombinedOutput(**cached)
+        yield "profile", result.profile_data
+        for question in result.questions:
+            yield "question", question
+        yield "done", result
+        return
+
+    parser = IncrementalJSONParser(["profile_data", "questions[]"])
+    profile, questions = None, []
+    try:
+        async for chunk in GATEWAY.stream(
+            "onboarding",
+            model=MODEL_NAME,
+            contents=create_onboarding_prompt(resume_text),
+            config=types.GenerateContentConfig(response_mime_type="application/json"),
+            user_id=user_id,
+        ):
+            for path, value in parser.feed(chunk.text or ""):
+                try:
+                    if path == "profile_data" and profile is None:
+                        profile = ResumeAnalysis(**value)
+                        yield "profile", profile
+                    elif path == "questions[]":
+                        question = FocusQuestion(**value)
+                        questions.append(question)
+                        yield "question", question
+                except ValidationError as e:
+                    # שאלה פגומה אחת לא מפילה את כל האונבורדינג
+                    print(f"Skipping invalid onboarding object at {path}: {e}")
+        if profile is None:
+            raise ValueError("Gemini לא החזיר profile_data תקין")
+    except AdmissionRejected:
+        raise
+    except Exception as e:
+        print(f"Error streaming Gemini resume processing: {e}")
+        if profile is not None:
+            raise # הלקוח כבר קיבל חלק מהתוצאה
+        fallback = OnboardingCombinedOutput(profile_data={"name": "שגיאה", "email": "error@sendme.com", "experience_summary": "שגיאת פירוק קו\"ח עקב כשל AI", "technologies": []}, questions=[])
+        yield "profile", fallback.profile_data
+        yield "done", fallback
+        return
+
+    result = OnboardingCombinedOutput(profile_data=profile, questions=questions)
+    try:
+        parser.result() # רק פלט שלם ותקין נשמר ב-Cache
+        await RESUME_CACHE.set(cache_key, result.model_dump())
+    except ValueError as e:
+        print(f"Onboarding stream ended with incomplete JSON, not caching: {e}")
+    yield "done", result
+
 
 # --- פרומפט 2: יצירת פסקה מותאמת אישית ---
-def create_paragraph_prompt(user_data: Dict[str, Any], job_data: JobData) -> str:
-    """יוצר פרומפט לכתיבת הפסקה המותאמת אישית."""
-    
-    highlights_str = "\n- ".join([t['content'] for t in user_data.get('targets', []) if t['type'] == 'highlight'])
-    requirements_str = "\n- ".join(job_data.requirements)
-    
-    return f"""
-    אתה כותב קריירה מומחה. כתוב פסקה קצרה (עד 4 משפטים), חזקה ומותאמת אישית לחלוטין, שתשמש כטקסט גוף ראשי במייל הגשת מועמדות.
-    
-    הפסקה צריכה:
-    1. להתמקד ב-2-3 הדרישות העיקריות מהמודעה.
-    2. לשלב לפחות אחת מההדגשות המקצועיות ("Highlights") של המועמד.
-    3. להיות קולעת, מקצועית וכתובה בעברית רהוטה.
-    
-    החזר אך ורק את הפסקה המותאמת.
-
-    ---
-    ## נתוני קלט:
-    - סיכום ניסיון (קו"ח): {user_data.get('resume_text')}
-    - טכנולוגיות מפתח: {', '.join(user_data.get('technologies', []))}
-    - הדגשים מקצועיים:
-    {highlights_str if highlights_str else 'אין הדגשים ספציפיים.'}
-
-    - דרישות המשרה (חובה להתייחס):
-    {requirements_str}
-    ---
-    """
+# טקסטי Fallback - מוחזרים למשתמש בכשל, אך לא נשמרים כפסקה מוכנה
+PARAGRAPH_MISSING_KEY_FALLBACK = "אנו מתנצלים, אירעה שגיאה: חסר GEMINI_API_KEY."
+PARAGRAPH_ERROR_FALLBACK = "אנו מתנצלים, אירעה שגיאה ביצירת הפסקה ע\"י Gemini. אנא נסה שוב."
+PARAGRAPH_FALLBACKS = {PARAGRAPH_MISSING_KEY_FALLBACK, PARAGRAPH_ERROR_FALLBACK}
 
-async def generate_custom_paragraph(user_data: Dict[str, Any], job_data: JobData) -> str:
-    if not CLIENT:
-        return "אנו מתנצלים, אירעה שגיאה: חסר GEMINI_API_KEY."
+async def generate_custom_paragraph(user_data: Dict[str, Any], job_data: JobData, endpoint: str = "paragraph", user_id: Optional[str] = None) -> str:
+    if not get_client():
+        return PARAGRAPH_MISSING_KEY_FALLBACK
 
     prompt = create_paragraph_prompt(user_data, job_data)
     
     try:
-        response = CLIENT.models.generate_content(
+        response = await GATEWAY.generate(
+            endpoint,
             model=MODEL_NAME,
             contents=prompt,
+            user_id=user_id,
         )
         return response.text.strip()
+    except AdmissionRejected:
+        raise
     except Exception as e:
         print(f"Error calling Gemini for paragraph generation: {e}")
-        return "אנו מתנצלים, אירעה שגיאה ביצירת הפסקה ע\"י Gemini. אנא נסה שוב."
+        return PARAGRAPH_ERROR_FALLBACK
 
+async def stream_custom_paragraph(user_data: Dict[str, Any], job_data: JobData, user_id: Optional[str] = None) -> AsyncIterator[str]:
+    """גרסת Streaming של generate_custom_paragraph: מחזירה את הטקסט בחלקים, כפי שהם מגיעים מ-Gemini."""
+    if not get_client():
+        yield PARAGRAPH_MISSING_KEY_FALLBACK
+        return
+
+    prompt = create_paragraph_prompt(user_data, job_data)
+    sent_any = False
+    try:
+        async for chunk in GATEWAY.stream("paragraph", model=MODEL_NAME, contents=prompt, user_id=user_id):
+            if chunk.text:
+                sent_any = True
+                yield chunk.text
+    except AdmissionRejected:
+        raise
+    except Exception as e:
+        print(f"Error streaming Gemini paragraph generation: {e}")
+        if not sent_any:
+            yield PARAGRAPH_ERROR_FALLBACK
+        else:
+            raise
 
-async def extract_job_data_with_llm(job_ad_text: str) -> JobData:
-    """מחלץ נתוני משרה קריטיים מטקסט באמצעות LLM (MVP - דאטא מדומה)."""
-    # ... (פונקציה זו נשארה כפי שהיא מהקוד המקורי, מאחר שהפרומפט נשאר דומה)
-    # לצורך MVP נחזיר דאטא מדומה:
-    return JobData(job_title="מפתח פול-סטאק", target_email="hr@mockcompany.com", requirements=["Python", "FastAPI", "React"])
\ No newline at end of file
+
+# --- פרומפט 3: חילוץ נתוני משרה ---
+class JobExtractionError(RuntimeError):
+    """כשל בחילוץ נתוני המשרה (ה-LLM לא זמין או החזיר פלט לא תקין)."""
+
+
+async def extract_job_data_with_llm(job_ad_text: str, user_id: Optional[str] = None) -> JobData:
+    """מחלץ נתוני משרה קריטיים מטקסט באמצעות LLM (דרך ה-Gateway, תחת מגבלת job_extraction)."""
+    if not get_client():
+        # בלי מפתח אין חילוץ - לא מחזירים דאטא מדומה, כי התוצאה נשמרת במודעות המשותפות (job_ads)
+        raise JobExtractionError("שירות ה-AI לא מוגדר - לא ניתן לחלץ את נתוני המשרה")
+
+    try:
+        response = await GATEWAY.generate(
+            "job_extraction",
+            model=MODEL_NAME,
+            contents=create_job_extraction_prompt(job_ad_text),
+            config=types.GenerateContentConfig(response_mime_type="application/json"),
+            user_id=user_id,
+        )
+        return JobData(**json.loads(response.text))
+    except AdmissionRejected:
+        raise
+    except Exception as e:
+        print(f"Error calling Gemini for job extraction: {e}")
+        raise JobExtractionError("כשל בחילוץ נתוני המשרה") from e
@@ -0,0 +1,45 @@
+# /send_me_mvp/backend/app/services/lru_cache.py
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+
+class LRUCache:
+    """Cache בזיכרון התהליך עם מגבלת גודל (LRU) ו-TTL."""
+
+    def __init__(self, max_items: int, ttl_seconds: float):
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+        self._items: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any):
+        with self._lock:
+            self._items[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
@@ -0,0 +1,214 @@
+# /send_me_mvp/backend/app/services/metrics.py
+import contextvars
+import functools
+import inspect
+import json
+import os
+import random
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# --- הגדרות ---
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+# אחוז הבקשות (0-1) שעבורן מודפס Trace מפורט של שלבי הבקשה (ברירת מחדל: כבוי)
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+
+# Buckets משותפים: מ-5ms (DB/Cache) ועד דקה (LLM / Batch)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# --- מדדים ---
+HTTP_REQUEST_SECONDS = Histogram(
+    "sendme_http_request_duration_seconds", "HTTP request latency by route template",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS,
+)
+HTTP_IN_FLIGHT = Gauge("sendme_http_requests_in_flight", "HTTP requests currently being served")
+DB_QUERY_SECONDS = Histogram(
+    "sendme_db_query_duration_seconds", "Time spent in a DB helper (including commit)",
+    ["helper"], buckets=LATENCY_BUCKETS,
+)
+LLM_CALL_SECONDS = Histogram(
+    "sendme_llm_call_duration_seconds", "Gemini call latency by prompt type",
+    ["endpoint", "outcome"], buckets=LATENCY_BUCKETS,
+)
+LLM_TOKENS = Counter("sendme_llm_tokens_total", "Gemini tokens by prompt type", ["endpoint", "kind"])
+EXTERNAL_CALL_SECONDS = Histogram(
+    "sendme_external_call_duration_seconds", "Google Cloud API call latency (Vision, GCS)",
+    ["service", "operation", "outcome"], buckets=LATENCY_BUCKETS,
+)
+LLM_CIRCUIT_STATE = Gauge("sendme_llm_circuit_state", "LLM circuit breaker state (0=closed, 1=half-open, 2=open)", ["endpoint", "model"])
+LLM_HEDGES = Counter("sendme_llm_hedges_total", "Hedged Gemini requests: fired, and which copy won", ["endpoint", "result"])
+LLM_HEDGE_DELAY_SECONDS = Gauge("sendme_llm_hedge_delay_seconds", "Current hedge delay (latency percentile) by prompt type", ["endpoint"])
+LLM_MODEL_FALLBACKS = Counter("sendme_llm_model_fallbacks_total", "Calls routed to the fallback model because the primary circuit was open", ["endpoint", "model"])
+LLM_ADMISSION_QUEUE_DEPTH = Gauge("sendme_llm_admission_queue_depth", "LLM calls waiting for quota in the admission queue")
+LLM_ADMISSION_WAIT_SECONDS = Histogram(
+    "sendme_llm_admission_wait_seconds", "Time an LLM call waited for quota before being admitted",
+    ["endpoint"], buckets=LATENCY_BUCKETS,
+)
+LLM_ADMISSION_REJECTED = Counter("sendme_llm_admission_rejected_total", "LLM calls shed by admission control", ["endpoint", "reason"])
+
+# --- Trace לבקשה (Sampled) ---
+_TRACE: contextvars.ContextVar[Optional[List[Dict[str, Any]]]] = contextvars.ContextVar("sendme_trace", default=None)
+
+
+def record_stage(name: str, seconds: float, **attributes):
+    """מוסיף שלב ל-Trace של הבקשה הנוכחית (No-op אם הבקשה לא נדגמה)."""
+    trace = _TRACE.get()
+    if trace is not None:
+        trace.append({"stage": name, "ms": round(seconds * 1000, 2), **attributes})
+
+
+@contextmanager
+def observe_external(service: str, operation: str):
+    """מדידת קריאה ל-API חיצוני (Vision / GCS / Gmail)."""
+    started_at = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except Exception:
+        outcome = "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - started_at
+        EXTERNAL_CALL_SECONDS.labels(service, operation, outcome).observe(elapsed)
+        record_stage(f"{service}.{operation}", elapsed, outcome=outcome)
+
+
+def observe_llm(endpoint: str, seconds: float, outcome: str, response: Any = None):
+    """זמן קריאה ל-Gemini + ספירת Tokens מתוך usage_metadata (אם קיים)."""
+    LLM_CALL_SECONDS.labels(endpoint, outcome).observe(seconds)
+    usage = getattr(response, "usage_metadata", None)
+    tokens = {}
+    if usage is not None:
+        tokens = {
+            "prompt": getattr(usage, "prompt_token_count", None) or 0,
+            "output": getattr(usage, "candidates_token_count", None) or 0,
+        }
+        for kind, count in tokens.items():
+            if count:
+                LLM_TOKENS.labels(endpoint, kind).inc(count)
+    record_stage(f"llm.{endpoint}", seconds, outcome=outcome, **tokens)
+
+
+def timed_db(func: Callable) -> Callable:
+    """Decorator לפונקציות CRUD (סינכרוניות או אסינכרוניות): היסטוגרמה לפי שם הפונקציה."""
+    name = func.__name__
+    histogram = DB_QUERY_SECONDS.labels(name)
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            started_at = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started_at
+                histogram.observe(elapsed)
+                record_stage(f"db.{name}", elapsed)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started_at = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started_at
+            histogram.observe(elapsed)
+            record_stage(f"db.{name}", elapsed)
+    return wrapper
+
+
+# --- מדדים מחושבים בזמן Scrape (Cache, עלייה) ---
+_CACHES: List[Any] = []
+_STARTUP_SOURCE: Optional[Callable[[], Dict[str, Any]]] = None
+
+
+def register_cache(cache):
+    """רושם Cache (כל אובייקט עם stats()) לחשיפה ב-/metrics."""
+    _CACHES.append(cache)
+
+
+def register_startup_metrics(source: Callable[[], Dict[str, Any]]):
+    global _STARTUP_SOURCE
+    _STARTUP_SOURCE = source
+
+
+class _AppCollector:
+    def collect(self):
+        lookups = CounterMetricFamily("sendme_cache_lookups", "Cache lookups by namespace and result", labels=["namespace", "result"])
+        hit_ratio = GaugeMetricFamily("sendme_cache_hit_ratio", "Cache hit ratio since process start", labels=["namespace"])
+        items = GaugeMetricFamily("sendme_cache_memory_items", "Items in the in-memory cache tier", labels=["namespace"])
+        for cache in _CACHES:
+            stats = cache.stats()
+            namespace = stats["namespace"]
+            for result in ("memory_hits", "db_hits", "shared_hits", "misses"):
+                if result in stats:
+                    lookups.add_metric([namespace, result], stats[result])
+            hit_ratio.add_metric([namespace], stats["hit_ratio"])
+            items.add_metric([namespace], stats["memory_items"])
+        yield lookups
+        yield hit_ratio
+        yield items
+
+        if _STARTUP_SOURCE is not None:
+            startup = GaugeMetricFamily("sendme_startup_seconds", "Cold start phases", labels=["phase"])
+            for phase, value in _STARTUP_SOURCE().items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    startup.add_metric([phase], value)
+                elif isinstance(value, dict):
+                    for sub_phase, sub_value in value.items():
+                        startup.add_metric([f"{phase}.{sub_phase}"], sub_value)
+            yield startup
+
+
+REGISTRY.register(_AppCollector())
+
+
+# --- ASGI Middleware ---
+class MetricsMiddleware:
+    """
+    Middleware ASGI "טהור" (בלי BaseHTTPMiddleware - לא עוטף את ה-Body ולא שובר Streaming).
+    הזמן נמדד עד סוף שליחת התגובה; ה-Route מתועד לפי התבנית (/submissions/{submission_id}) ולא לפי ה-URL.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        trace = [] if TRACE_SAMPLE_RATE and random.random() < TRACE_SAMPLE_RATE else None
+        token = _TRACE.set(trace)
+        HTTP_IN_FLIGHT.inc()
+        started_at = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started_at
+            HTTP_IN_FLIGHT.dec()
+            _TRACE.reset(token)
+            route = scope.get("route")
+            # נתיב שלא נמצא לא נרשם כ-Label (מונע פיצוץ Cardinality מסריקות)
+            route_template = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUEST_SECONDS.labels(scope["method"], route_template, str(status["code"])).observe(elapsed)
+            if trace is not None:
+                print("trace " + json.dumps({
+                    "method": scope["method"],
+                    "route": route_template,
+                    "status": status["code"],
+                    "ms": round(elapsed * 1000, 2),
+                    "stages": trace,
+                }, ensure_ascii=False))
@@ -0,0 +1,207 @@
+# /send_me_mvp/backend/app/services/ocr_service.py
+import asyncio
+import hashlib
+import http.client
+import io
+import ipaddress
+import os
+import socket
+import ssl
+from typing import List, Optional, Set, Tuple
+from urllib.parse import urlsplit
+
+from app.services.cache_service import TwoTierCache
+from app.services.external_api import batch_extract_text_from_images
+
+# --- הגדרות ---
+OCR_MAX_DIMENSION = int(os.getenv("OCR_MAX_DIMENSION", "2000")) # פיקסלים בצלע הארוכה
+OCR_JPEG_QUALITY = int(os.getenv("OCR_JPEG_QUALITY", "85"))
+OCR_MAX_BATCH = int(os.getenv("OCR_MAX_BATCH", "16")) # מגבלת Vision לבקשת batch
+OCR_BATCH_LINGER_SECONDS = float(os.getenv("OCR_BATCH_LINGER_MS", "30")) / 1000
+OCR_MAX_DOWNLOAD_BYTES = int(os.getenv("OCR_MAX_DOWNLOAD_BYTES", str(10 * 1024 * 1024)))
+OCR_DOWNLOAD_TIMEOUT_SECONDS = float(os.getenv("OCR_DOWNLOAD_TIMEOUT_SECONDS", "10"))
+# רשימת שרתים מותרים להורדת תמונות, מופרדת בפסיקים (ריק = כל כתובת ציבורית)
+OCR_ALLOWED_HOSTS = {h.strip().lower() for h in os.getenv("OCR_ALLOWED_HOSTS", "").split(",") if h.strip()}
+OCR_CACHE_TTL_SECONDS = float(os.getenv("OCR_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+OCR_CACHE = TwoTierCache("ocr", OCR_CACHE_TTL_SECONDS)
+
+
+class OCRError(RuntimeError):
+    """כשל בהורדה או ב-OCR של תמונה."""
+
+
+def image_hash(image_bytes: bytes) -> str:
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def preprocess_image(image_bytes: bytes) -> bytes:
+    """
+    הקטנה (עד OCR_MAX_DIMENSION), המרה לגווני אפור ודחיסה ל-JPEG לפני שליחה ל-Vision.
+    צילומי מסך ממכשירים חדשים כבדים בהרבה ממה שנדרש ל-OCR. אם העיבוד נכשל - שולחים את המקור.
+    """
+    try:
+        from PIL import Image, ImageOps
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            image = ImageOps.exif_transpose(image).convert("L")
+            image.thumbnail((OCR_MAX_DIMENSION, OCR_MAX_DIMENSION))
+            output = io.BytesIO()
+            image.save(output, format="JPEG", quality=OCR_JPEG_QUALITY, optimize=True)
+        processed = output.getvalue()
+        return processed if len(processed) < len(image_bytes) else image_bytes
+    except Exception as e:
+        print(f"Warning: image preprocessing failed, sending original: {e}")
+        return image_bytes
+
+
+# --- הורדה בטוחה (הגנה מ-SSRF) ---
+def public_address(host: str, port: int) -> str:
+    """
+    מתרגם את שם השרת ומחזיר כתובת IP להתחברות. נזרק OCRError אם אחת הכתובות אינה ציבורית
+    (פרטית, Loopback, Link-local - כולל שרת ה-Metadata 169.254.169.254 - או שמורה).
+    """
+    try:
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except (socket.gaierror, UnicodeError):
+        raise OCRError(f"לא ניתן לתרגם את הכתובת: {host}")
+    for info in infos:
+        ip = ipaddress.ip_address(info[4][0].split("%")[0])
+        if ip.version == 6 and ip.ipv4_mapped:
+            ip = ip.ipv4_mapped
+        if not ip.is_global or ip.is_multicast:
+            raise OCRError("כתובת התמונה אינה מורשית")
+    return infos[0][4][0]
+
+
+class _PinnedHTTPConnection(http.client.HTTPConnection):
+    """מתחבר לכתובת שכבר נבדקה (בלי תרגום DNS נוסף - מונע DNS rebinding)."""
+
+    def __init__(self, host: str, address: str, port: int, timeout: float):
+        super().__init__(host, port, timeout=timeout)
+        self._address = address
+
+    def connect(self):
+        self.sock = socket.create_connection((self._address, self.port), self.timeout)
+
+
+class _PinnedHTTPSConnection(http.client.HTTPSConnection):
+    def __init__(self, host: str, address: str, port: int, timeout: float):
+        super().__init__(host, port, timeout=timeout, context=ssl.create_default_context())
+        self._address = address
+
+    def connect(self):
+        sock = socket.create_connection((self._address, self.port), self.timeout)
+        # SNI ובדיקת התעודה מול שם השרת המקורי
+        self.sock = self._context.wrap_socket(sock, server_hostname=self.host)
+
+
+def download_image(url: str) -> bytes:
+    """
+    הורדת תמונה מ-URL עם מגבלת גודל ו-Timeout. פונקציה חוסמת.
+    רק http(s) לכתובות ציבוריות (או לשרתים ב-OCR_ALLOWED_HOSTS, אם הוגדר), בלי מעקב אחרי Redirects.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise OCRError(f"URL לא נתמך: {url}")
+    host = parts.hostname.lower()
+    if OCR_ALLOWED_HOSTS and host not in OCR_ALLOWED_HOSTS:
+        raise OCRError("כתובת התמונה אינה מורשית")
+    try:
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+    except ValueError:
+        raise OCRError(f"URL לא נתמך: {url}")
+    address = public_address(host, port)
+
+    connection_class = _PinnedHTTPSConnection if parts.scheme == "https" else _PinnedHTTPConnection
+    connection = connection_class(host, address, port, OCR_DOWNLOAD_TIMEOUT_SECONDS)
+    try:
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        connection.request("GET", path, headers={"User-Agent": "send-me-ocr"})
+        response = connection.getresponse()
+        if response.status != 200:
+            # כולל 3xx: Redirect עלול להפנות לכתובת פנימית
+            raise OCRError(f"הורדת התמונה נכשלה (HTTP {response.status})")
+        data = response.read(OCR_MAX_DOWNLOAD_BYTES + 1)
+    finally:
+        connection.close()
+    if len(data) > OCR_MAX_DOWNLOAD_BYTES:
+        raise OCRError("התמונה גדולה מדי")
+    return data
+
+
+class OCRBatcher:
+    """
+    מאחד תמונות שממתינות ל-OCR לבקשת batch_annotate_images אחת.
+    הבקשה נשלחת כשמגיעים ל-OCR_MAX_BATCH תמונות, או אחרי חלון המתנה קצר (Linger) מהתמונה הראשונה.
+    """
+
+    def __init__(self, max_batch: int = OCR_MAX_BATCH, linger_seconds: float = OCR_BATCH_LINGER_SECONDS):
+        self.max_batch = max_batch
+        self.linger_seconds = linger_seconds
+        self._pending: List[Tuple[bytes, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # הפניות למשימות השליחה - כדי שלא ייאספו ע"י ה-GC לפני שהתוצאות הוחזרו
+        self._send_tasks: Set[asyncio.Task] = set()
+
+    async def submit(self, image_bytes: bytes) -> str:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((image_bytes, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.linger_seconds, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+        if self._pending:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.linger_seconds, self._flush)
+        if batch:
+            task = asyncio.create_task(self._send(batch))
+            self._send_tasks.add(task)
+            task.add_done_callback(self._send_tasks.discard)
+
+    async def _send(self, batch: List[Tuple[bytes, asyncio.Future]]):
+        try:
+            # קריאת gRPC חוסמת - רצה ב-Thread כדי לא לחסום את ה-Event Loop
+            results = await asyncio.to_thread(batch_extract_text_from_images, [content for content, _ in batch])
+        except Exception as e:
+            results = [e] * len(batch)
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(OCRError(str(result)))
+            else:
+                future.set_result(result)
+
+
+OCR_BATCHER = OCRBatcher()
+
+
+async def ocr_image(image_bytes: bytes) -> str:
+    """OCR לתמונה אחת: Cache לפי Hash של המקור, עיבוד מקדים ב-Thread ושליחה דרך ה-Batcher."""
+    key = image_hash(image_bytes)
+    cached = await OCR_CACHE.get(key)
+    if cached is not None:
+        return cached
+    processed = await asyncio.to_thread(preprocess_image, image_bytes)
+    text = await OCR_BATCHER.submit(processed)
+    await OCR_CACHE.set(key, text)
+    return text
+
+
+async def ocr_image_urls(urls: List[str]) -> str:
+    """מוריד ומבצע OCR לכמה צילומי מסך של אותה מודעה (במקביל), ומחזיר את הטקסט המאוחד לפי הסדר."""
+    try:
+        images = await asyncio.gather(*[asyncio.to_thread(download_image, url) for url in urls])
+    except OCRError:
+        raise
+    except Exception as e:
+        raise OCRError(f"כשל בהורדת תמונה: {e}")
+    texts = await asyncio.gather(*[ocr_image(image) for image in images])
+    return "\n".join(text.strip() for text in texts if text and text.strip())
@@ -0,0 +1,200 @@
+# /send_me_mvp/backend/app/services/paragraph_prefetch.py
+import asyncio
+import hashlib
+import json
+import os
+from typing import Any, Dict, Optional, Set
+
+from fastapi import HTTPException
+
+from app.schemas import JobData
+from app.services.db_service import SessionLocal, get_submission_by_id, save_draft_paragraph, clear_draft_paragraphs
+from app.services.llm_service import generate_custom_paragraph, PARAGRAPH_FALLBACKS
+from app.services.llm_admission import AdmissionRejected
+
+# --- הגדרות ---
+PREFETCH_ENABLED = os.getenv("PARAGRAPH_PREFETCH_ENABLED", "1") == "1"
+PREFETCH_QUEUE_SIZE = int(os.getenv("PARAGRAPH_PREFETCH_QUEUE_SIZE", "100"))
+PREFETCH_WORKERS = int(os.getenv("PARAGRAPH_PREFETCH_WORKERS", "2"))
+
+
+def context_hash(user_context: Dict[str, Any]) -> str:
+    """Hash של נתוני המשתמש שנכנסים לפרומפט - פסקה מוכנה תקפה רק אם ה-Hash זהה."""
+    payload = json.dumps(user_context, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _PrefetchJob:
+    def __init__(self, submission_id: str, user_id: str, user_context: Dict[str, Any], job_data: JobData):
+        self.submission_id = submission_id
+        self.user_id = user_id
+        self.user_context = user_context
+        self.job_data = job_data
+        self.context_hash = context_hash(user_context)
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.started = False
+        self.endpoint: Optional[str] = None
+        self.task: Optional[asyncio.Task] = None
+
+
+class ParagraphPrefetcher:
+    """
+    יצירה ספקולטיבית של פסקאות ברקע אחרי ה-Ingest.
+    תור חסום (עבודה עודפת נזרקת - זו רק אופטימיזציה), Dedup לפי הגשה,
+    ובקשה אינטראקטיבית מצטרפת למשימה שכבר רצה במקום ליצור קריאה נוספת.
+    """
+
+    def __init__(self, queue_size: int = PREFETCH_QUEUE_SIZE, workers: int = PREFETCH_WORKERS):
+        self.queue_size = queue_size
+        self.workers = workers
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker_tasks = []
+        self._inflight: Dict[str, _PrefetchJob] = {}
+        self._by_user: Dict[str, Set[str]] = {}
+
+    def _ensure_workers(self):
+        # Workers נוצרים בעצלות, מתוך ה-Event Loop הרץ
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._worker_tasks = [t for t in self._worker_tasks if not t.done()]
+        while len(self._worker_tasks) < self.workers:
+            self._worker_tasks.append(asyncio.create_task(self._worker()))
+
+    def _register(self, job: _PrefetchJob):
+        self._inflight[job.submission_id] = job
+        self._by_user.setdefault(job.user_id, set()).add(job.submission_id)
+
+    def _forget(self, job: _PrefetchJob):
+        if self._inflight.get(job.submission_id) is job:
+            del self._inflight[job.submission_id]
+        user_jobs = self._by_user.get(job.user_id)
+        if user_jobs:
+            user_jobs.discard(job.submission_id)
+            if not user_jobs:
+                del self._by_user[job.user_id]
+
+    def schedule(self, submission_id: str, user_id: str, user_context: Dict[str, Any], job_data: JobData) -> bool:
+        """מכניס לתור יצירה ספקולטיבית. מחזיר False אם כבר קיימת או שהתור מלא."""
+        if not PREFETCH_ENABLED or submission_id in self._inflight:
+            return False
+        self._ensure_workers()
+        job = _PrefetchJob(submission_id, user_id, user_context, job_data)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            return False
+        self._register(job)
+        return True
+
+    async def _run(self, job: _PrefetchJob, endpoint: str):
+        """מריץ את היצירה ומעדכן את ה-Future (כל הממתינים מקבלים את אותה תוצאה)."""
+        job.started = True
+        job.endpoint = endpoint
+        try:
+            paragraph = await generate_custom_paragraph(job.user_context, job.job_data, endpoint=endpoint, user_id=job.user_id)
+            if paragraph not in PARAGRAPH_FALLBACKS:
+                # Session נפרד: המשימה עשויה להמשיך אחרי שהבקשה שיזמה אותה הסתיימה
+                with SessionLocal() as db:
+                    save_draft_paragraph(db, job.submission_id, job.user_id, paragraph, job.context_hash)
+            if not job.future.done():
+                job.future.set_result(paragraph)
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+                if isinstance(e, AdmissionRejected):
+                    job.future.exception() # עומס - מוותרים על היצירה הספקולטיבית בשקט (גם אם אין ממתינים)
+        finally:
+            self._forget(job)
+
+    async def _run_interactive(self, job: _PrefetchJob) -> str:
+        # רץ כמשימה עצמאית: ניתוק של הלקוח היוזם לא מבטל את התוצאה לממתינים האחרים
+        job.started = True
+        job.task = asyncio.create_task(self._run(job, endpoint="paragraph"))
+        return await asyncio.shield(job.future)
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                # משימה שבוטלה, או שבקשה אינטראקטיבית כבר לקחה אותה - מדלגים
+                if not job.started and not job.future.done():
+                    await self._run(job, endpoint="paragraph_prefetch")
+            except Exception as e:
+                print(f"Warning: paragraph prefetch failed for {job.submission_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def get_or_generate(
+        self,
+        db_session,
+        submission_id: str,
+        user_id: str,
+        user_context: Dict[str, Any],
+        job_data: JobData,
+    ) -> str:
+        """
+        מחזיר פסקה להגשה: מוכנה מה-DB, הצטרפות למשימה שרצה, או יצירה מיידית
+        (שגם היא נרשמת כ-In-flight כדי שבקשות כפולות יחכו לה).
+        הגשה שלא שייכת למשתמש - 404 (בלי יצירה ובלי שמירה על הטיוטה של משתמש אחר).
+        """
+        submission = get_submission_by_id(db_session, submission_id)
+        if not submission or submission.user_id != user_id:
+            raise HTTPException(status_code=404, detail="הגשה לא נמצאה")
+
+        expected_hash = context_hash(user_context)
+        job = self._inflight.get(submission_id)
+        if job is not None and job.user_id == user_id and job.context_hash == expected_hash and not job.future.cancelled():
+            if not job.started:
+                # עדיין בתור - מריצים עכשיו בעדיפות אינטראקטיבית; ה-Worker ידלג עליה
+                return await self._run_interactive(job)
+            try:
+                return await asyncio.shield(job.future)
+            except AdmissionRejected:
+                # היצירה ברקע נזרקה ע"י בקרת העומס - מנסים בעדיפות אינטראקטיבית
+                if job.endpoint != "paragraph_prefetch":
+                    raise
+
+        if submission.draft_paragraph and submission.draft_context_hash == expected_hash:
+            return submission.draft_paragraph
+
+        job = _PrefetchJob(submission_id, user_id, user_context, job_data)
+        self._register(job)
+        return await self._run_interactive(job)
+
+    async def join_or_cancel(self, submission_id: str, user_id: str, user_context: Dict[str, Any]) -> Optional[str]:
+        """
+        לפני יצירה ב-Streaming (WebSocket): משימה שכבר רצה להגשה - ממתינים לתוצאה שלה במקום קריאה שנייה ל-LLM;
+        משימה שעוד בתור מבוטלת (ה-Streaming מחליף אותה). None - אין פסקה להצטרף אליה, יש ליצור.
+        """
+        job = self._inflight.get(submission_id)
+        if job is None or job.user_id != user_id or job.context_hash != context_hash(user_context) or job.future.cancelled():
+            return None
+        if not job.started:
+            job.future.cancel() # ה-Worker ידלג עליה
+            self._forget(job)
+            return None
+        try:
+            paragraph = await asyncio.shield(job.future)
+        except AdmissionRejected:
+            # היצירה ברקע נזרקה ע"י בקרת העומס - ה-Streaming ינסה בעדיפות אינטראקטיבית
+            if job.endpoint != "paragraph_prefetch":
+                raise
+            return None
+        return None if paragraph in PARAGRAPH_FALLBACKS else paragraph
+
+    def invalidate_user(self, user_id: str, db_session=None):
+        """ביטול כל הפסקאות המוכנות/בתהליך של המשתמש (נקרא כשהיעדים/הפרופיל משתנים)."""
+        for submission_id in list(self._by_user.get(user_id, ())):
+            job = self._inflight.get(submission_id)
+            if job is None:
+                continue
+            # משימה שעוד לא התחילה מבוטלת; משימה שרצה ממשיכה לממתינים שלה,
+            # אבל התוצאה שלה נשמרת עם ה-Hash הישן ולכן לא תוגש שוב
+            if not job.started:
+                job.future.cancel()
+            self._forget(job)
+        if db_session is not None:
+            clear_draft_paragraphs(db_session, user_id)
+
+
+PREFETCHER = ParagraphPrefetcher()
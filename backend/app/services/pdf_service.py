@@ -0,0 +1,154 @@
+# /send_me_mvp/backend/app/services/pdf_service.py
+import asyncio
+import io
+import os
+import re
+import threading
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+# --- הגדרות ---
+PDF_MAX_BYTES = int(os.getenv("PDF_MAX_BYTES", str(5 * 1024 * 1024)))
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "8")) # עמודים מעבר לזה לא נכנסים לפרומפט
+PDF_MAX_CHARS = int(os.getenv("PDF_MAX_CHARS", "20000"))
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "2"))
+PDF_TIMEOUT_SECONDS = float(os.getenv("PDF_TIMEOUT_SECONDS", "20"))
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+_SPACES_RE = re.compile(r"[ \t\u00a0\u200b\u200e\u200f]+")
+_HYPHEN_BREAK_RE = re.compile(r"(\w)-\n(\w)")
+_BLANK_LINES_RE = re.compile(r"\n{2,}")
+
+
+class PDFExtractionError(ValueError):
+    """קובץ PDF לא תקין, מוצפן או ריק מטקסט."""
+
+
+class PDFTooLargeError(PDFExtractionError):
+    """הקובץ חורג מ-PDF_MAX_BYTES."""
+
+
+def normalize_pdf_text(text: str, max_chars: int = PDF_MAX_CHARS) -> str:
+    """נרמול טקסט שחולץ: איחוד רווחים, חיבור מילים שנשברו במקף, הסרת שורות ריקות וקיצור."""
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    text = _HYPHEN_BREAK_RE.sub(r"\1\2", text)
+    lines = (_SPACES_RE.sub(" ", line).strip() for line in text.split("\n"))
+    text = "\n".join(line for line in lines if line)
+    text = _BLANK_LINES_RE.sub("\n", text)
+    return text[:max_chars]
+
+
+def _extract_pdf_text(data: bytes, max_pages: int, max_chars: int) -> str:
+    """רץ בתהליך נפרד (CPU-bound) - חייב להיות פונקציה ברמת המודול לצורך Pickle."""
+    from pypdf import PdfReader
+    from pypdf.errors import PdfReadError
+
+    try:
+        reader = PdfReader(io.BytesIO(data))
+        if reader.is_encrypted:
+            raise PDFExtractionError("PDF מוצפן")
+        parts = []
+        length = 0
+        for page in reader.pages[:max_pages]:
+            page_text = page.extract_text() or ""
+            parts.append(page_text)
+            length += len(page_text)
+            if length >= max_chars * 2: # מספיק טקסט - לא ממשיכים לפרסר עמודים
+                break
+    except PdfReadError as e:
+        raise PDFExtractionError(f"PDF לא תקין: {e}")
+    return normalize_pdf_text("\n".join(parts), max_chars)
+
+
+# --- Process pool (נוצר בעצלות) ---
+_POOL: Optional[ProcessPoolExecutor] = None
+_POOL_LOCK = threading.Lock()
+_POOL_SLOTS: Optional[asyncio.Semaphore] = None
+# Pools שה-Workers שלהם נהרגו בגלל Timeout של בקשה אחרת (בקשות שנפלו איתם מנסות שוב)
+_KILLED_POOLS: "weakref.WeakSet[ProcessPoolExecutor]" = weakref.WeakSet()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _POOL
+    if _POOL is None:
+        with _POOL_LOCK:
+            if _POOL is None:
+                _POOL = ProcessPoolExecutor(max_workers=PDF_WORKERS)
+    return _POOL
+
+
+def shutdown_pool():
+    """נקרא בכיבוי האפליקציה."""
+    global _POOL
+    if _POOL is not None:
+        _POOL.shutdown(wait=False, cancel_futures=True)
+        _POOL = None
+
+
+def _retire_pool(pool: ProcessPoolExecutor, kill: bool = False):
+    """
+    מוציא Pool משימוש (הבקשה הבאה תקים חדש). עם kill=True גם הורג את תהליכי ה-Worker:
+    wait_for לא עוצר עבודה שכבר רצה בתהליך, ו-PDF שנתקע היה תופס Worker לתמיד.
+    """
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is pool:
+            _POOL = None
+    if kill:
+        _KILLED_POOLS.add(pool)
+        # אין API ציבורי להריגת Workers (עד Python 3.14) - _processes הוא המיפוי pid -> Process
+        for process in list((pool._processes or {}).values()):
+            process.kill()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def read_upload_limited(upload, max_bytes: int = PDF_MAX_BYTES) -> bytes:
+    """קורא UploadFile ב-Chunks ועוצר ברגע שעוברים את המגבלה (בלי לטעון קובץ ענק לזיכרון)."""
+    buffer = bytearray()
+    while True:
+        chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        buffer.extend(chunk)
+        if len(buffer) > max_bytes:
+            raise PDFTooLargeError(f"הקובץ גדול מ-{max_bytes // (1024 * 1024)}MB")
+    return bytes(buffer)
+
+
+async def extract_resume_text(data: bytes) -> str:
+    """
+    מחלץ טקסט מ-PDF ב-ProcessPoolExecutor, כך שהפרסור לא חוסם את ה-Event Loop.
+    מספר הקבצים שבעיבוד/בהמתנה חסום (פי 2 מה-Workers) כדי שהזיכרון לכל העלאה יהיה צפוי.
+    """
+    global _POOL_SLOTS
+    if _POOL_SLOTS is None:
+        _POOL_SLOTS = asyncio.Semaphore(PDF_WORKERS * 2)
+
+    async with _POOL_SLOTS:
+        loop = asyncio.get_running_loop()
+        for attempt in range(2):
+            pool = _get_pool()
+            future = loop.run_in_executor(pool, _extract_pdf_text, data, PDF_MAX_PAGES, PDF_MAX_CHARS)
+            try:
+                text = await asyncio.wait_for(future, PDF_TIMEOUT_SECONDS)
+                break
+            except asyncio.TimeoutError:
+                # ה-Worker ממשיך לרוץ גם אחרי ה-Timeout - הורגים אותו (ואת ה-Pool) כדי לשחרר את התהליך
+                _retire_pool(pool, kill=True)
+                raise PDFExtractionError("חילוץ הטקסט מה-PDF ארך יותר מדי")
+            except PDFExtractionError:
+                raise
+            except BrokenProcessPool as e:
+                # Worker קרס (למשל OOM) או נהרג בגלל Timeout של בקשה אחרת - ה-Pool יוקם מחדש
+                _retire_pool(pool)
+                if attempt == 0 and pool in _KILLED_POOLS:
+                    continue
+                raise PDFExtractionError(f"כשל בחילוץ טקסט מה-PDF: {e}")
+            except Exception as e:
+                raise PDFExtractionError(f"כשל בחילוץ טקסט מה-PDF: {e}")
+
+    if not text:
+        raise PDFExtractionError("לא נמצא טקסט ב-PDF (ייתכן שזהו קובץ סרוק)")
+    return text
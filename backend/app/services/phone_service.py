@@ -0,0 +1,28 @@
+# /send_me_mvp/backend/app/services/phone_service.py
+import os
+import re
+
+# קידומת מדינה ברירת מחדל למספרים מקומיים (למשל 050-1234567)
+DEFAULT_COUNTRY_CODE = os.getenv("DEFAULT_PHONE_COUNTRY_CODE", "972")
+
+# Regex מקומפלים פעם אחת (נקרא בכל כניסה)
+_STRIP_RE = re.compile(r"[\s\-().]")
+_E164_RE = re.compile(r"\+[1-9]\d{7,14}")
+
+
+def to_e164(raw_phone: str, default_country_code: str = DEFAULT_COUNTRY_CODE) -> str:
+    """
+    ממיר מספר טלפון לפורמט E.164 קנוני (למשל 050-123-4567 -> +972501234567).
+    זורק ValueError אם המספר לא תקין.
+    """
+    phone = _STRIP_RE.sub("", raw_phone or "")
+    if phone.startswith("00"):
+        phone = "+" + phone[2:]
+    elif phone.startswith("0"):
+        phone = f"+{default_country_code}{phone[1:]}"
+    elif not phone.startswith("+"):
+        # ספרות בלבד: עם קידומת מדינה (972...) או בלי
+        phone = "+" + phone if phone.startswith(default_country_code) and len(phone) > 9 else f"+{default_country_code}{phone}"
+    if not _E164_RE.fullmatch(phone):
+        raise ValueError(f"Invalid phone number: {raw_phone!r}")
+    return phone
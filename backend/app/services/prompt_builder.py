@@ -0,0 +1,234 @@
+# /send_me_mvp/backend/app/services/prompt_builder.py
+import os
+import re
+from typing import Any, Dict, Iterable, List, Optional
+
+from app.schemas import JobData
+from app.services.skill_match import job_skills_mask, rank_highlights, score_masks, skills_mask
+
+# --- גרסאות פרומפטים ---
+# יש לעדכן גרסה בכל שינוי בתבנית או בבניית הקלט - היא חלק ממפתחות ה-Cache
+# (Cache קו"ח, Hash של פסקה מוכנה) ולכן שינוי גרסה מבטל תוצאות ישנות.
+PROMPT_VERSIONS = {
+    "onboarding": "onboarding-v2",
+    "paragraph": "paragraph-v3",
+    "job_extraction": "job-extraction-v1",
+    "user_context": "user-context-v1",
+}
+
+# --- תקציבי Tokens ---
+# הערכה גסה: בטקסט מעורב עברית/אנגלית Token הוא בערך 3 תווים
+CHARS_PER_TOKEN = float(os.getenv("PROMPT_CHARS_PER_TOKEN", "3"))
+RESUME_TOKEN_BUDGET = int(os.getenv("PROMPT_RESUME_TOKEN_BUDGET", "2500"))
+USER_CONTEXT_TOKEN_BUDGET = int(os.getenv("PROMPT_USER_CONTEXT_TOKEN_BUDGET", "350"))
+JOB_REQUIREMENTS_TOKEN_BUDGET = int(os.getenv("PROMPT_JOB_REQUIREMENTS_TOKEN_BUDGET", "200"))
+JOB_AD_TOKEN_BUDGET = int(os.getenv("PROMPT_JOB_AD_TOKEN_BUDGET", "1500"))
+MAX_TECHNOLOGIES = 12
+MAX_HIGHLIGHTS = 5
+MAX_REQUIREMENTS = 8
+MAX_ITEM_CHARS = 160
+MAX_FOCUS_HIGHLIGHTS = 2
+
+_SENTENCE_END_RE = re.compile(r"[.!?\n](?=\s|$)")
+_SPACES_RE = re.compile(r"[ \t]+")
+
+
+def estimate_tokens(text: str) -> int:
+    return int(len(text or "") / CHARS_PER_TOKEN) + 1
+
+
+def truncate_to_budget(text: str, max_tokens: int) -> str:
+    """קיצור טקסט לתקציב, בסוף משפט/שורה כשאפשר (ולא באמצע מילה)."""
+    text = (text or "").strip()
+    max_chars = int(max_tokens * CHARS_PER_TOKEN)
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    sentence_ends = [m.end() for m in _SENTENCE_END_RE.finditer(cut)]
+    # חותכים בסוף משפט רק אם לא מאבדים יותר מרבע מהתקציב
+    if sentence_ends and sentence_ends[-1] >= max_chars * 0.75:
+        return cut[:sentence_ends[-1]].strip()
+    return cut.rsplit(" ", 1)[0].strip() + "…"
+
+
+def _dedupe(items: Iterable[str], limit: int) -> List[str]:
+    """הסרת כפילויות (בלי תלות ברישיות), ריקים ופריטים ארוכים מדי; שומר על הסדר."""
+    seen = set()
+    result = []
+    for item in items:
+        item = _SPACES_RE.sub(" ", (item or "").strip())
+        key = item.casefold()
+        if not item or key in seen:
+            continue
+        seen.add(key)
+        result.append(item[:MAX_ITEM_CHARS])
+        if len(result) >= limit:
+            break
+    return result
+
+
+def compact_resume(resume_text: str, max_tokens: int = RESUME_TOKEN_BUDGET) -> str:
+    """קו"ח לפרומפט האונבורדינג: בלי שורות כפולות, ובתוך התקציב (החלק העליון - הרלוונטי ביותר - נשמר)."""
+    lines = _dedupe((resume_text or "").split("\n"), limit=10_000)
+    return truncate_to_budget("\n".join(lines), max_tokens)
+
+
+# --- בלוק הקשר קומפקטי למשתמש ---
+def build_user_context_block(
+    resume_summary: Optional[str],
+    technologies: Iterable[str],
+    highlights: Iterable[str],
+    max_tokens: int = USER_CONTEXT_TOKEN_BUDGET,
+) -> str:
+    """
+    בלוק קבוע לכל משתמש שנכנס לכל פרומפט פסקה. נבנה פעם אחת (באונבורדינג / בשינוי פרופיל) ונשמר ב-DB.
+    ההדגשים והטכנולוגיות נשמרים במלואם (עד הגבלת הכמות); סיכום הניסיון הוא מה שמתקצר.
+    """
+    tech_line = ", ".join(_dedupe(technologies or [], MAX_TECHNOLOGIES))
+    highlight_lines = "\n".join(f"- {h}" for h in _dedupe(highlights or [], MAX_HIGHLIGHTS))
+    fixed = f"טכנולוגיות מפתח: {tech_line or 'לא צוינו'}\nהדגשים מקצועיים:\n{highlight_lines or '- אין הדגשים ספציפיים.'}"
+    summary_budget = max(40, max_tokens - estimate_tokens(fixed))
+    summary = truncate_to_budget(resume_summary or "", summary_budget) or "לא צוין"
+    return f"סיכום ניסיון: {summary}\n{fixed}"
+
+
+def user_context_block_from_profile(user) -> str:
+    """בונה את הבלוק מתוך UserSnapshot/User + יעדים."""
+    highlights = [t["content"] for t in (user.targets or []) if t.get("type") == "highlight"]
+    return build_user_context_block(user.resume_text, user.technologies or [], highlights)
+
+
+def user_context_block(user) -> str:
+    """הבלוק השמור אם הוא מהגרסה הנוכחית; אחרת (משתמש ישן / שינוי גרסה) - נבנה במקום."""
+    if user.prompt_context and user.prompt_context_version == PROMPT_VERSIONS["user_context"]:
+        return user.prompt_context
+    return user_context_block_from_profile(user)
+
+
+def user_context_fields(resume_summary: Optional[str], technologies: Iterable[str], highlights: Iterable[str]) -> Dict[str, str]:
+    """עמודות לעדכון ב-DB יחד עם שינוי הפרופיל (באותו משפט UPDATE)."""
+    return {
+        "prompt_context": build_user_context_block(resume_summary, technologies, highlights),
+        "prompt_context_version": PROMPT_VERSIONS["user_context"],
+    }
+
+
+def format_requirements(requirements: Iterable[str], max_tokens: int = JOB_REQUIREMENTS_TOKEN_BUDGET) -> str:
+    lines = []
+    used = 0
+    for requirement in _dedupe(requirements or [], MAX_REQUIREMENTS):
+        cost = estimate_tokens(requirement)
+        if lines and used + cost > max_tokens:
+            break
+        lines.append(f"- {requirement}")
+        used += cost
+    return "\n".join(lines) or "- לא צוינו דרישות"
+
+
+def job_focus_block(technologies: Iterable[str], highlights: Iterable[str], job_data: JobData) -> str:
+    """
+    התאמה ספציפית למשרה (בלי LLM): הכישורים התואמים, וההדגשים שמזכירים את כישורי המשרה -
+    כדי שהמודל ישלב את ההדגש הרלוונטי ולא סתם את הראשון ברשימה. ריק אם אין חפיפה.
+    """
+    job_mask = job_skills_mask(job_data)
+    if not job_mask:
+        return ""
+    lines = []
+    matched = score_masks(skills_mask(technologies or []), job_mask).matched_skills
+    if matched:
+        lines.append(f"כישורי המועמד שהמשרה דורשת: {', '.join(matched)}")
+    relevant = rank_highlights(_dedupe(highlights or [], MAX_HIGHLIGHTS), job_mask, MAX_FOCUS_HIGHLIGHTS)
+    if relevant:
+        lines.append("ההדגשים הרלוונטיים ביותר למשרה (עדיף לשלב אותם):\n" + "\n".join(f"- {h}" for h in relevant))
+    return "\n".join(lines)
+
+
+# --- פרומפט 1: פירוק קו"ח ויצירת שאלות ---
+def create_onboarding_prompt(resume_text: str) -> str:
+    """יוצר פרומפט ל-Gemini לפירוק קורות חיים וגנרציה של שאלות בפורמט JSON."""
+
+    return f"""
+    אתה מומחה גיוס המנתח קורות חיים.
+    המטרה:
+    1. לחלץ נתונים קריטיים על המועמד: שם, מייל, סיכום ניסיון (2-3 משפטים) ורשימת טכנולוגיות מרכזיות (מערך).
+    2. לייצר 4-5 שאלות מיקוד (Focus Questions) מותאמות אישית, שמטרתן לחלץ "הדגשים" (Highlights) שניתן לשלב במייל הגשת מועמדות. לכל שאלה, הצע 3-4 תשובות אפשריות.
+
+    הקפד להחזיר רק JSON תקין (Raw JSON) לפי הסכימה הבאה:
+    {{
+        "profile_data": {{
+            "name": "שם המועמד",
+            "email": "אימייל",
+            "experience_summary": "סיכום ניסיון",
+            "technologies": ["טכנולוגיה 1", "טכנולוגיה 2"]
+        }},
+        "questions": [
+            {{
+                "q": "השאלה הממוקדת",
+                "options": [
+                    {{"text": "הסבר אופציה 1", "value": "הדגש שיש לשלב במייל (קצר)"}},
+                    {{"text": "הסבר אופציה 2", "value": "הדגש שיש לשלב במייל (קצר)"}}
+                ]
+            }}
+            // ... שאר השאלות
+        ]
+    }}
+
+    ---
+    קורות חיים גולמיים:
+    {compact_resume(resume_text)}
+    ---
+    """
+
+
+# --- פרומפט 2: יצירת פסקה מותאמת אישית ---
+def create_paragraph_prompt(user_data: Dict[str, Any], job_data: JobData) -> str:
+    """
+    יוצר פרומפט לכתיבת הפסקה המותאמת אישית.
+    user_data מכיל את הבלוק הקומפקטי (prompt_context); בלי הבלוק - נבנה מהשדות הגולמיים.
+    הטכנולוגיות וההדגשים (אם נשלחו) משמשים לבלוק ההתאמה למשרה.
+    """
+    highlights = user_data.get("highlights")
+    if highlights is None:
+        highlights = [t["content"] for t in user_data.get("targets", []) if t.get("type") == "highlight"]
+    context_block = user_data.get("prompt_context")
+    if not context_block:
+        context_block = build_user_context_block(user_data.get("resume_text"), user_data.get("technologies", []), highlights)
+    focus_block = job_focus_block(user_data.get("technologies", []), highlights, job_data)
+    focus_section = f"\n    ## התאמה למשרה:\n    {focus_block}\n" if focus_block else ""
+
+    return f"""
+    אתה כותב קריירה מומחה. כתוב פסקה קצרה (עד 4 משפטים), חזקה ומותאמת אישית לחלוטין, שתשמש כטקסט גוף ראשי במייל הגשת מועמדות.
+
+    הפסקה צריכה:
+    1. להתמקד ב-2-3 הדרישות העיקריות מהמודעה.
+    2. לשלב לפחות אחת מההדגשות המקצועיות ("Highlights") של המועמד.
+    3. להיות קולעת, מקצועית וכתובה בעברית רהוטה.
+
+    החזר אך ורק את הפסקה המותאמת.
+
+    ---
+    ## נתוני המועמד:
+    {context_block}
+
+    ## דרישות המשרה (חובה להתייחס):
+    {format_requirements(job_data.requirements)}
+    {focus_section}---
+    """
+
+
+# --- פרומפט 3: חילוץ נתוני משרה ---
+def create_job_extraction_prompt(job_ad_text: str) -> str:
+    """יוצר פרומפט לחילוץ נתוני משרה מטקסט מודעה, בפורמט JSON."""
+
+    return f"""
+    חלץ ממודעת הדרושים הבאה את שם התפקיד, כתובת המייל להגשת מועמדות ורשימת הדרישות (עד 8, קצרות).
+    אם לא מופיע מייל, החזר "אין אימייל".
+
+    הקפד להחזיר רק JSON תקין (Raw JSON) לפי הסכימה הבאה:
+    {{"job_title": "שם התפקיד", "target_email": "jobs@company.com", "requirements": ["דרישה 1", "דרישה 2"]}}
+
+    ---
+    מודעת המשרה:
+    {truncate_to_budget(job_ad_text, JOB_AD_TOKEN_BUDGET)}
+    ---
+    """
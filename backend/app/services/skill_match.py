@@ -0,0 +1,197 @@
+# /send_me_mvp/backend/app/services/skill_match.py
+import functools
+import os
+import re
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.schemas import JobData, JobMatch
+
+# --- אוצר מילים קנוני של כישורים ---
+# שם קנוני (כפי שמוצג למשתמש) -> כינויים/איותים נפוצים (כולל עברית). ההשוואה אחרי נרמול (אותיות קטנות, טוקנים).
+# רק הכינויים נבדקים (לא השם הקנוני עצמו) - כך "Go" או "REST" לא נתפסים ממילים רגילות באנגלית.
+SKILL_VOCABULARY: Dict[str, List[str]] = {
+    "Python": ["python", "python3", "py", "פייתון", "פיתון"],
+    "Java": ["java", "ג'אווה", "ג׳אווה", "java se", "java ee"],
+    "JavaScript": ["javascript", "js", "ecmascript", "es6", "ג'אווהסקריפט"],
+    "TypeScript": ["typescript", "ts"],
+    "Go": ["golang", "go lang"],
+    "C#": ["c#", "csharp", "c sharp"],
+    "C++": ["c++", "cpp"],
+    ".NET": [".net", "dotnet", ".net core", "asp.net"],
+    "Ruby": ["ruby", "ruby on rails", "rails"],
+    "PHP": ["php", "laravel"],
+    "Kotlin": ["kotlin"],
+    "Swift": ["swift", "ios"],
+    "Rust": ["rust"],
+    "Scala": ["scala"],
+    "SQL": ["sql", "t-sql", "tsql", "pl/sql"],
+    "PostgreSQL": ["postgresql", "postgres", "psql", "פוסטגרס"],
+    "MySQL": ["mysql", "mariadb"],
+    "MongoDB": ["mongodb", "mongo"],
+    "Redis": ["redis"],
+    "Elasticsearch": ["elasticsearch", "elastic", "opensearch"],
+    "Kafka": ["kafka", "apache kafka"],
+    "RabbitMQ": ["rabbitmq"],
+    "FastAPI": ["fastapi", "fast api"],
+    "Django": ["django"],
+    "Flask": ["flask"],
+    "Spring": ["spring", "spring boot", "springboot"],
+    "Node.js": ["node.js", "nodejs", "node", "express.js", "expressjs"],
+    "React": ["react", "react.js", "reactjs", "ריאקט"],
+    "React Native": ["react native"],
+    "Angular": ["angular", "angularjs"],
+    "Vue": ["vue", "vue.js", "vuejs"],
+    "HTML/CSS": ["html", "css", "html5", "css3", "sass", "scss"],
+    "GraphQL": ["graphql"],
+    "REST APIs": ["restful", "rest api", "rest apis", "restful api"],
+    "Microservices": ["microservices", "micro services", "מיקרוסרוויסים"],
+    "Docker": ["docker", "containers", "דוקר"],
+    "Kubernetes": ["kubernetes", "k8s", "eks", "gke", "aks"],
+    "AWS": ["aws", "amazon web services", "ec2", "s3", "lambda"],
+    "GCP": ["gcp", "google cloud", "google cloud platform", "cloud run", "bigquery"],
+    "Azure": ["azure", "microsoft azure"],
+    "Terraform": ["terraform", "iac"],
+    "CI/CD": ["ci/cd", "ci cd", "cicd", "jenkins", "github actions", "gitlab ci"],
+    "Linux": ["linux", "unix", "bash", "לינוקס"],
+    "Git": ["git", "github", "gitlab"],
+    "Machine Learning": ["machine learning", "ml", "deep learning", "למידת מכונה"],
+    "Data Engineering": ["data engineering", "etl", "airflow", "spark", "pyspark"],
+    "Pandas": ["pandas", "numpy"],
+    "LLM": ["llm", "llms", "genai", "generative ai", "openai", "gemini"],
+    "Testing": ["testing", "unit tests", "unit testing", "pytest", "jest", "tdd", "qa automation"],
+    "Agile": ["agile", "scrum", "kanban", "אג'ייל"],
+}
+
+# משקל לכל כישור: כישורים "כלליים" שמופיעים כמעט בכל מודעה תורמים פחות לציון
+SKILL_WEIGHTS: Dict[str, float] = {"Git": 0.3, "Agile": 0.3, "Linux": 0.5, "REST APIs": 0.5, "SQL": 0.7, "HTML/CSS": 0.7, "Testing": 0.7}
+
+MAX_NGRAM = 3
+# תחיליות עבריות נפוצות ("בפייתון", "וריאקט") - נבדקות רק אם הטוקן עצמו לא מוכר
+_HEBREW_PREFIXES = "בוהלמשכ"
+# מקף מפריד בין טוקנים ("ו-FastAPI", "t-sql" -> t sql, גם בכינויים) - נקודה, + ו-# הם חלק מהשם (node.js, c++, c#)
+_TOKEN_RE = re.compile(r"\.?[a-z0-9֐-׿][a-z0-9֐-׿+#.'׳]*")
+
+# עד כמה משתמשים נשמרים ב-Cache בזיכרון (הפחות בשימוש נזרקים - ייבנו שוב בגישה הבאה)
+SKILL_INDEX_MAX_USERS = int(os.getenv("SKILL_INDEX_MAX_USERS", "50000"))
+
+
+def _tokens(text: str) -> List[str]:
+    return [t.rstrip(".'") for t in _TOKEN_RE.findall((text or "").lower()) if t.rstrip(".'")]
+
+
+# --- קומפילציה של אוצר המילים: כינוי (Tuple של טוקנים) -> מספר ביט ---
+SKILLS: List[str] = list(SKILL_VOCABULARY)
+SKILL_BITS: Dict[str, int] = {skill: i for i, skill in enumerate(SKILLS)}
+_ALIASES: Dict[Tuple[str, ...], int] = {}
+for _skill, _aliases in SKILL_VOCABULARY.items():
+    for _alias in _aliases:
+        _ALIASES[tuple(_tokens(_alias))] = SKILL_BITS[_skill]
+_BIT_WEIGHTS: List[float] = [SKILL_WEIGHTS.get(skill, 1.0) for skill in SKILLS]
+
+
+def _lookup(ngram: Tuple[str, ...]) -> Optional[int]:
+    bit = _ALIASES.get(ngram)
+    if bit is None and len(ngram) == 1 and len(ngram[0]) > 2 and ngram[0][0] in _HEBREW_PREFIXES:
+        bit = _ALIASES.get((ngram[0][1:],))
+    return bit
+
+
+def skills_mask(texts: Iterable[str]) -> int:
+    """
+    Bitmask של הכישורים הקנוניים שמופיעים בטקסטים (ביט לכל כישור באוצר המילים).
+    התאמה חמדנית מהצירוף הארוך לקצר ("react native" לפני "react").
+    """
+    mask = 0
+    for text in texts:
+        tokens = _tokens(text)
+        i = 0
+        while i < len(tokens):
+            for n in range(min(MAX_NGRAM, len(tokens) - i), 0, -1):
+                bit = _lookup(tuple(tokens[i:i + n]))
+                if bit is not None:
+                    mask |= 1 << bit
+                    i += n
+                    break
+            else:
+                i += 1
+    return mask
+
+
+def mask_skills(mask: int) -> List[str]:
+    """שמות הכישורים בביטים הדלוקים (לפי סדר אוצר המילים)."""
+    names = []
+    while mask:
+        low = mask & -mask
+        names.append(SKILLS[low.bit_length() - 1])
+        mask ^= low
+    return names
+
+
+def mask_weight(mask: int) -> float:
+    total = 0.0
+    while mask:
+        low = mask & -mask
+        total += _BIT_WEIGHTS[low.bit_length() - 1]
+        mask ^= low
+    return total
+
+
+@functools.lru_cache(maxsize=4096)
+def _job_mask(job_title: str, requirements: Tuple[str, ...]) -> int:
+    return skills_mask([job_title, *requirements])
+
+
+def job_skills_mask(job_data: JobData) -> int:
+    """Bitmask של כישורי המשרה. ב-Cache: מודעה משותפת מגיעה מהרבה משתמשים, והטוקניזציה היא רוב העלות."""
+    return _job_mask(job_data.job_title, tuple(job_data.requirements))
+
+
+def score_masks(user_mask: int, job_mask: int) -> JobMatch:
+    """ציון = משקל הכישורים התואמים / משקל כל כישורי המשרה (AND/AND-NOT על ה-Bitmasks)."""
+    matched = user_mask & job_mask
+    missing = job_mask & ~user_mask
+    job_weight = mask_weight(job_mask)
+    score = round(mask_weight(matched) / job_weight, 3) if job_weight else 0.0
+    return JobMatch(score=score, matched_skills=mask_skills(matched), missing_skills=mask_skills(missing))
+
+
+def rank_highlights(highlights: Iterable[str], job_mask: int, limit: int = 2) -> List[str]:
+    """ההדגשים שמזכירים הכי הרבה (במשקל) מכישורי המשרה - לשילוב בפרומפט. בלי חפיפה - רשימה ריקה."""
+    scored = []
+    for position, highlight in enumerate(highlights):
+        weight = mask_weight(skills_mask([highlight]) & job_mask)
+        if weight:
+            scored.append((-weight, position, highlight))
+    return [highlight for _, _, highlight in sorted(scored)[:limit]]
+
+
+class SkillIndex:
+    """
+    Cache בזיכרון של ה-Bitmask של הטכנולוגיות לכל משתמש (LRU).
+    נבנה בעצלות מתוך UserSnapshot ונבנה מחדש אוטומטית כשרשימת הטכנולוגיות משתנה.
+    """
+
+    def __init__(self, max_users: int = SKILL_INDEX_MAX_USERS):
+        self.max_users = max_users
+        self._users: "OrderedDict[str, Tuple[Tuple[str, ...], int]]" = OrderedDict()
+
+    def user_mask(self, user_id: str, technologies: Iterable[str]) -> int:
+        key = tuple(technologies or ())
+        entry = self._users.get(user_id)
+        if entry is not None and entry[0] == key:
+            self._users.move_to_end(user_id)
+            return entry[1]
+        mask = skills_mask(key)
+        self._users[user_id] = (key, mask)
+        self._users.move_to_end(user_id)
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+        return mask
+
+    def match(self, user_id: str, technologies: Iterable[str], job_data: JobData) -> JobMatch:
+        """ציון התאמה של משתמש למשרה - בלי LLM ובלי DB."""
+        return score_masks(self.user_mask(user_id, technologies), job_skills_mask(job_data))
+
+
+SKILL_INDEX = SkillIndex()
@@ -0,0 +1,80 @@
+# /send_me_mvp/backend/app/services/startup.py
+import asyncio
+import os
+import time
+from typing import Any, Coroutine, Dict, Set
+
+from app.services.metrics import register_startup_metrics
+
+# --- הגדרות Cold start ---
+# create - יצירת טבלאות סינכרונית בעלייה (ברירת מחדל, כמו קודם)
+# defer  - יצירת טבלאות ברקע, בלי לעכב את קבלת הבקשות הראשונות
+# skip   - בלי יצירת טבלאות (הסכמה מנוהלת מחוץ לאפליקציה)
+DB_SCHEMA_MODE = os.getenv("DB_SCHEMA_MODE", "create").lower()
+WARMUP_CLIENTS = os.getenv("WARMUP_CLIENTS", "0") == "1"
+
+# מדדי עלייה (שניות) - מדווחים ב-/api/startup
+STARTUP_METRICS: Dict[str, Any] = {"schema_mode": DB_SCHEMA_MODE, "warmup": {}}
+register_startup_metrics(lambda: STARTUP_METRICS)
+
+
+# משימות רקע של העלייה - שומרים הפניה כדי שלא ייאספו ע"י ה-GC באמצע הריצה
+_BACKGROUND_TASKS: Set[asyncio.Task] = set()
+
+
+def run_in_background(coro: Coroutine) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    _BACKGROUND_TASKS.add(task)
+    task.add_done_callback(_BACKGROUND_TASKS.discard)
+    return task
+
+
+def record(name: str, started_at: float):
+    STARTUP_METRICS[name] = round(time.perf_counter() - started_at, 4)
+
+
+def init_schema():
+    """יצירת הטבלאות והשלמת הסכמה לפי DB_SCHEMA_MODE (נקרא בעלייה, או ב-Thread ברקע במצב defer)."""
+    from app.services.db_service import SessionLocal, create_tables, upgrade_schema, canonicalize_phone_numbers
+    started_at = time.perf_counter()
+    try:
+        create_tables()
+        print("Database tables created/verified")
+    except Exception as e:
+        print(f"Warning: Could not create tables: {e}")
+    # עמודות/אינדקסים חדשים בטבלאות שכבר קיימות (למשל users.prompt_context, submissions.draft_paragraph)
+    try:
+        upgraded = upgrade_schema()
+        if upgraded:
+            print(f"Database schema upgraded: {', '.join(upgraded)}")
+    except Exception as e:
+        print(f"Warning: Could not upgrade schema: {e}")
+    # מיגרציות נתונים (אידמפוטנטיות)
+    try:
+        with SessionLocal() as db:
+            migrated = canonicalize_phone_numbers(db)
+        if migrated:
+            print(f"Migrated {migrated} phone numbers to E.164")
+    except Exception as e:
+        print(f"Warning: phone number migration failed: {e}")
+    record("schema_seconds", started_at)
+
+
+def _warm(name: str, factory):
+    started_at = time.perf_counter()
+    try:
+        factory()
+    except Exception as e:
+        print(f"Warning: warm-up of {name} failed: {e}")
+    STARTUP_METRICS["warmup"][name] = round(time.perf_counter() - started_at, 4)
+
+
+async def warm_up_clients():
+    """אתחול הקליינטים של Google ברקע, במקביל, כדי שהבקשה הראשונה לא תשלם עליהם."""
+    from app.services.external_api import get_gcs_client, get_vision_client
+    from app.services.llm_service import get_client
+    await asyncio.gather(
+        asyncio.to_thread(_warm, "gcs", get_gcs_client),
+        asyncio.to_thread(_warm, "vision", get_vision_client),
+        asyncio.to_thread(_warm, "gemini", get_client),
+    )
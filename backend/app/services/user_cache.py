@@ -0,0 +1,160 @@
+# /send_me_mvp/backend/app/services/user_cache.py
+import json
+import os
+from abc import ABC, abstractmethod
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from app.schemas import UserProfileBase
+from app.services.lru_cache import LRUCache
+from app.services.metrics import register_cache
+
+# --- הגדרות ---
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+USER_CACHE_MAX_ITEMS = int(os.getenv("USER_CACHE_MAX_ITEMS", "10000"))
+# Backend משותף אופציונלי (למשל כשיש כמה מופעי Cloud Run): redis://...
+USER_CACHE_REDIS_URL = os.getenv("USER_CACHE_REDIS_URL")
+
+
+@dataclass
+class UserSnapshot:
+    """
+    עותק קריא של פרופיל המשתמש + היעדים/הדגשים שלו, כפי שנשמר ב-Cache.
+    תומך גם ב-.get() כדי לשמש ישירות כ-user_data לפרומפטים.
+    """
+    id: str
+    phone_number: Optional[str] = None
+    name: Optional[str] = None
+    email: Optional[str] = None
+    resume_text: Optional[str] = None
+    technologies: List[str] = field(default_factory=list)
+    onboarding_complete: bool = False
+    targets: List[Dict[str, str]] = field(default_factory=list)
+    prompt_context: Optional[str] = None
+    prompt_context_version: Optional[str] = None
+
+    @classmethod
+    def from_orm(cls, user, targets) -> "UserSnapshot":
+        return cls(
+            id=user.id,
+            phone_number=user.phone_number,
+            name=user.name,
+            email=user.email,
+            resume_text=user.resume_text,
+            technologies=list(user.technologies or []),
+            onboarding_complete=bool(user.onboarding_complete),
+            targets=[{"type": t.type, "content": t.content} for t in targets],
+            prompt_context=user.prompt_context,
+            prompt_context_version=user.prompt_context_version,
+        )
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = getattr(self, key, None)
+        return default if value is None else value
+
+    def to_profile(self) -> UserProfileBase:
+        return UserProfileBase(
+            user_id=self.id,
+            phone_number=self.phone_number,
+            name=self.name,
+            email=self.email,
+            onboarding_complete=self.onboarding_complete,
+        )
+
+
+class SharedCacheBackend(ABC):
+    """ממשק ל-Backend משותף בין תהליכים. המימוש חייב להיות Best-effort (בלי לזרוק)."""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: str, ttl_seconds: float):
+        ...
+
+    @abstractmethod
+    def delete(self, key: str):
+        ...
+
+
+class RedisCacheBackend(SharedCacheBackend):
+    """Backend משותף על Redis (דורש את החבילה redis - תלות אופציונלית)."""
+
+    def __init__(self, url: str):
+        import redis  # ייבוא עצל: נדרש רק כשמוגדר USER_CACHE_REDIS_URL
+        self._client = redis.Redis.from_url(url, socket_timeout=0.2)
+
+    def get(self, key: str) -> Optional[str]:
+        try:
+            value = self._client.get(key)
+            return value.decode("utf-8") if value else None
+        except Exception as e:
+            print(f"Warning: shared user cache get failed: {e}")
+            return None
+
+    def set(self, key: str, value: str, ttl_seconds: float):
+        try:
+            self._client.set(key, value, ex=max(1, int(ttl_seconds)))
+        except Exception as e:
+            print(f"Warning: shared user cache set failed: {e}")
+
+    def delete(self, key: str):
+        try:
+            self._client.delete(key)
+        except Exception as e:
+            print(f"Warning: shared user cache delete failed: {e}")
+
+
+class UserCache:
+    """Read-through cache לפרופיל משתמש: LRU בזיכרון (TTL קצר) ואחריו Backend משותף אופציונלי."""
+
+    def __init__(self, ttl_seconds: float = USER_CACHE_TTL_SECONDS, max_items: int = USER_CACHE_MAX_ITEMS, shared: Optional[SharedCacheBackend] = None):
+        self.ttl_seconds = ttl_seconds
+        self.local = LRUCache(max_items, ttl_seconds)
+        self.shared = shared
+        self.counters = {"memory_hits": 0, "shared_hits": 0, "misses": 0}
+        register_cache(self)
+
+    @staticmethod
+    def _shared_key(user_id: str) -> str:
+        return f"user:{user_id}"
+
+    def get(self, user_id: str, loader: Callable[[], Optional[UserSnapshot]]) -> Optional[UserSnapshot]:
+        snapshot = self.local.get(user_id)
+        if snapshot is not None:
+            self.counters["memory_hits"] += 1
+            return snapshot
+
+        if self.shared is not None:
+            raw = self.shared.get(self._shared_key(user_id))
+            if raw:
+                snapshot = UserSnapshot(**json.loads(raw))
+                self.local.set(user_id, snapshot)
+                self.counters["shared_hits"] += 1
+                return snapshot
+
+        self.counters["misses"] += 1
+        snapshot = loader()
+        if snapshot is not None:
+            self.set(snapshot)
+        return snapshot
+
+    def set(self, snapshot: UserSnapshot):
+        self.local.set(snapshot.id, snapshot)
+        if self.shared is not None:
+            self.shared.set(self._shared_key(snapshot.id), json.dumps(asdict(snapshot), ensure_ascii=False), self.ttl_seconds)
+
+    def invalidate(self, user_id: str):
+        """נקרא בכל כתיבה לפרופיל/ליעדים (update_user, save_targets)."""
+        self.local.delete(user_id)
+        if self.shared is not None:
+            self.shared.delete(self._shared_key(user_id))
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.counters["memory_hits"] + self.counters["shared_hits"]
+        total = hits + self.counters["misses"]
+        return {"namespace": "user", **self.counters, "memory_items": len(self.local), "hit_ratio": (hits / total) if total else 0.0}
+
+
+USER_CACHE = UserCache(shared=RedisCacheBackend(USER_CACHE_REDIS_URL) if USER_CACHE_REDIS_URL else None)
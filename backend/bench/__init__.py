@@ -0,0 +1 @@
+# /send_me_mvp/backend/bench/__init__.py
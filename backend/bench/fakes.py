@@ -0,0 +1,217 @@
+# /send_me_mvp/backend/bench/fakes.py
+"""
+תחליפים מקומיים לשירותים החיצוניים (Gemini, Vision, GCS, Gmail) עבור ה-Benchmark.
+לכל שירות מודל Latency (Log-normal לפי חציון ו-p99) ושיעור שגיאות.
+"""
+import asyncio
+import io
+import json
+import math
+import random
+import re
+import time
+from types import SimpleNamespace
+from typing import List
+
+from google.genai import errors as genai_errors
+
+_Z_99 = 2.326 # z-score של האחוזון ה-99 בהתפלגות נורמלית
+
+
+class LatencyModel:
+    """
+    Latency בהתפלגות Log-normal, מוגדרת ע"י חציון ו-p99 (במילישניות), ושיעור שגיאות.
+    פורמט מחרוזת: "median_ms/p99_ms/error_rate", למשל "800/3000/0.02".
+    """
+
+    def __init__(self, median_ms: float, p99_ms: float, error_rate: float = 0.0):
+        self.median_ms = median_ms
+        self.p99_ms = max(p99_ms, median_ms)
+        self.error_rate = error_rate
+        self._sigma = math.log(self.p99_ms / median_ms) / _Z_99 if median_ms > 0 else 0.0
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyModel":
+        parts = [float(p) for p in spec.split("/")]
+        median = parts[0]
+        p99 = parts[1] if len(parts) > 1 else median * 3
+        error_rate = parts[2] if len(parts) > 2 else 0.0
+        return cls(median, p99, error_rate)
+
+    def sample_seconds(self) -> float:
+        if self.median_ms <= 0:
+            return 0.0
+        return random.lognormvariate(math.log(self.median_ms), self._sigma) / 1000
+
+    def should_fail(self) -> bool:
+        return random.random() < self.error_rate
+
+    def to_dict(self):
+        return {"median_ms": self.median_ms, "p99_ms": self.p99_ms, "error_rate": self.error_rate}
+
+
+class FakeServiceError(ConnectionError):
+    """שגיאה זמנית מדומה (נחשבת Retryable בדיוק כמו תקלת רשת אמיתית)."""
+
+
+def _gemini_unavailable() -> genai_errors.APIError:
+    response = SimpleNamespace(body_segments=[{"error": {"code": 503, "message": "fake overload", "status": "UNAVAILABLE"}}])
+    return genai_errors.ServerError(503, response)
+
+
+# --- Gemini ---
+FAKE_PARAGRAPH = (
+    "במהלך שלוש השנים האחרונות פיתחתי מערכות Backend ב-Python ו-FastAPI שמשרתות אלפי משתמשים ביום. "
+    "הובלתי מעבר ל-PostgreSQL מנוהל ושיפרתי את זמני התגובה בעשרות אחוזים. "
+    "אשמח להביא את הניסיון הזה לצוות שלכם ולהשתלב במהירות בפיתוח המוצר."
+)
+
+
+def _fake_gemini_text(contents: str) -> str:
+    """מחזיר תשובה בפורמט שהקוד מצפה לו, לפי סוג הפרומפט."""
+    if "profile_data" in contents:
+        return json.dumps({
+            "profile_data": {
+                "name": "משתמש בדיקה",
+                "email": "bench.user@example.com",
+                "experience_summary": "מפתח Backend עם 5 שנות ניסיון ב-Python, FastAPI ו-PostgreSQL.",
+                "technologies": ["Python", "FastAPI", "PostgreSQL", "Docker"],
+            },
+            "questions": [
+                {"q": f"שאלה {i}", "options": [{"text": "אופציה א", "value": f"הדגש {i}א"}, {"text": "אופציה ב", "value": f"הדגש {i}ב"}]}
+                for i in range(1, 5)
+            ],
+        }, ensure_ascii=False)
+    if "job_title" in contents:
+        title = re.search(r"דרוש/ה (.+)", contents)
+        return json.dumps({
+            "job_title": title.group(1).strip() if title else "מפתח/ת Backend",
+            "target_email": "jobs@example.com",
+            "requirements": ["Python", "FastAPI", "PostgreSQL", "ניסיון של 3 שנים"],
+        }, ensure_ascii=False)
+    return FAKE_PARAGRAPH
+
+
+class _FakeGeminiModels:
+    def __init__(self, latency: LatencyModel):
+        self.latency = latency
+
+    async def generate_content(self, model, contents, config=None):
+        await asyncio.sleep(self.latency.sample_seconds())
+        if self.latency.should_fail():
+            raise _gemini_unavailable()
+        text = _fake_gemini_text(contents)
+        usage = SimpleNamespace(prompt_token_count=len(contents) // 4, candidates_token_count=len(text) // 4)
+        return SimpleNamespace(text=text, usage_metadata=usage)
+
+    async def generate_content_stream(self, model, contents, config=None):
+        # Latency עד ה-Chunk הראשון, ואחריו Chunks קטנים ומהירים
+        await asyncio.sleep(self.latency.sample_seconds())
+        if self.latency.should_fail():
+            raise _gemini_unavailable()
+        text = _fake_gemini_text(contents)
+        words = text.split(" ")
+        for i in range(0, len(words), 4):
+            await asyncio.sleep(0.01)
+            yield SimpleNamespace(text=" ".join(words[i:i + 4]) + " ", usage_metadata=None)
+        yield SimpleNamespace(text="", usage_metadata=SimpleNamespace(prompt_token_count=len(contents) // 4, candidates_token_count=len(text) // 4))
+
+
+class FakeGeminiClient:
+    def __init__(self, latency: LatencyModel):
+        self.aio = SimpleNamespace(models=_FakeGeminiModels(latency))
+
+
+# --- Google Cloud Storage ---
+class _FakeBlob:
+    def __init__(self, latency: LatencyModel):
+        self.latency = latency
+        self.chunk_size = None
+
+    def _upload(self, size: int):
+        time.sleep(self.latency.sample_seconds())
+        if self.latency.should_fail():
+            raise FakeServiceError("fake GCS 503")
+
+    def upload_from_string(self, data, content_type=None):
+        self._upload(len(data))
+
+    def upload_from_file(self, file_obj, size=None, content_type=None):
+        data = file_obj.read()
+        self._upload(len(data))
+
+
+class FakeGCSClient:
+    def __init__(self, latency: LatencyModel):
+        self.latency = latency
+
+    def bucket(self, name):
+        return SimpleNamespace(blob=lambda path: _FakeBlob(self.latency))
+
+
+# --- Google Vision ---
+FAKE_OCR_TEXT = "דרוש/ה מפתח/ת Backend\nדרישות: Python, FastAPI, PostgreSQL\nקו\"ח ל- jobs@example.com"
+
+
+class FakeVisionClient:
+    def __init__(self, latency: LatencyModel):
+        self.latency = latency
+
+    def _call(self):
+        time.sleep(self.latency.sample_seconds())
+        if self.latency.should_fail():
+            raise FakeServiceError("fake Vision 503")
+
+    def document_text_detection(self, image):
+        self._call()
+        return SimpleNamespace(full_text_annotation=SimpleNamespace(text=FAKE_OCR_TEXT))
+
+    def batch_annotate_images(self, requests):
+        self._call()
+        return SimpleNamespace(responses=[
+            SimpleNamespace(error=SimpleNamespace(message=""), full_text_annotation=SimpleNamespace(text=FAKE_OCR_TEXT))
+            for _ in requests
+        ])
+
+
+def fake_image_bytes() -> bytes:
+    """תמונת PNG קטנה (צריכה לעבור את ה-Preprocessing של Pillow)."""
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new("RGB", (1200, 1600), "white").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+# --- Gmail ---
+def make_fake_gmail_sender(latency: LatencyModel):
+    def send_email_with_gmail_api(service, user_email, raw_message):
+        time.sleep(latency.sample_seconds())
+        if latency.should_fail():
+            raise FakeServiceError("fake Gmail 503")
+        return {"id": "fake-message-id"}
+    return send_email_with_gmail_api
+
+
+# --- PDF לקו"ח ---
+def make_resume_pdf(lines: List[str]) -> bytes:
+    """PDF מינימלי תקין עם טקסט (ASCII) - מספיק לחילוץ ע"י pypdf."""
+    text_ops = " ".join(f"({line}) Tj 0 -16 Td" for line in lines)
+    stream = f"BT /F1 12 Tf 72 720 Td {text_ops} ET".encode("latin-1")
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R /Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for i, obj in enumerate(objects):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % (i + 1) + obj + b"\nendobj\n"
+    xref_at = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF" % (len(objects) + 1, xref_at)
+    return out